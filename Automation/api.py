@@ -1,6 +1,237 @@
 import requests
 import datetime
-import pytz
+import sqlite3
+import threading
+import time
+import bisect
+import calendar
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+from requests.adapters import HTTPAdapter
+import instrumentation
+import records
+
+# Settings for the connection to the APIs
+connect_timeout = 5  # Seconds to wait for the connection to be established
+read_timeout = 30  # Seconds to wait for the server to send a response
+max_retries = 4  # How often a failed request is retried before giving up
+backoff_factor = 1  # Seconds to wait before the first retry. This doubles with every retry
+pool_size = 16  # Number of connections kept open per host. Should be at least as big as the number of threads
+retry_status_codes = [429, 500, 502, 503, 504]  # Status codes that are worth retrying
+
+# Rate limits for APIs that have them: host -> (calls per minute, calls per day)
+# The first 1000 calls per day to the One Call API are free, anything above is charged
+rate_limits = {'api.openweathermap.org': (60, 1000)}
+
+# The calls per day are counted in this SQLite file, so the daily quota holds for all runs of the day and not only
+# for the calls of one process. main.py uses the file of the response cache. If None, only the calls of this process
+# are counted
+quota_file = None
+
+# Class DailyQuotaExceeded
+# Purpose:
+#   Raised when a request would go over the daily quota of an API. Requests are not sent anymore instead of being
+#   charged
+class DailyQuotaExceeded(Exception):
+    pass
+
+# Class DailyCallCounter
+# Input
+#   file_name - absolute path of the SQLite file the calls are counted in. It is created if it doesn't exist
+#   host - the host whose calls are counted
+# Purpose:
+#   Counts the calls to a host per day (UTC) in a file. Runs started every few minutes and processes running at the
+#   same time (e.g. shards) all count in the same table, so together they never go over the daily quota
+class DailyCallCounter:
+    def __init__(self, file_name, host):
+        self.host = host
+        # Transactions are started explicitly, so the check and the increment of add_call are one transaction
+        self.connection = sqlite3.connect(file_name, check_same_thread=False, timeout=30, isolation_level=None)
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS api_calls (
+                                       host TEXT,
+                                       day TEXT,
+                                       calls INTEGER,
+                                       PRIMARY KEY (host, day))""")
+
+    # Function get_calls
+    # Input - day - the date (UTC)
+    # Output - the number of calls made on that day
+    def get_calls(self, day):
+        row = self.connection.execute("SELECT calls FROM api_calls WHERE host = ? AND day = ?",
+                                      (self.host, day.isoformat())).fetchone()
+        return 0 if row is None else row[0]
+
+    # Function add_call
+    # Input
+    #   day - the date (UTC)
+    #   calls_per_day - the daily quota
+    # Output - True if the call was counted, False if the quota of the day is already used up
+    def add_call(self, day, calls_per_day):
+        # BEGIN IMMEDIATE locks the file for writing, so no other process can count a call in between
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            if self.get_calls(day) >= calls_per_day:
+                return False
+            self.connection.execute("INSERT INTO api_calls VALUES (?, ?, 1) "
+                                    "ON CONFLICT (host, day) DO UPDATE SET calls = calls + 1",
+                                    (self.host, day.isoformat()))
+            return True
+        finally:
+            self.connection.execute("COMMIT")
+
+    def close(self):
+        self.connection.close()
+
+# Class RateLimiter
+# Input
+#   calls_per_minute - the number of calls allowed per minute
+#   calls_per_day - the number of calls allowed per day
+#   counter - optional DailyCallCounter. If given, the calls per day are counted in its file instead of only in memory
+# Purpose:
+#   Token bucket which is shared by all threads sending requests to the same host. Every request takes one token,
+#   tokens are refilled at calls_per_minute. If no tokens are left, the request waits until there is one.
+#   Once calls_per_day have been made (the day is counted in UTC), DailyQuotaExceeded is raised.
+class RateLimiter:
+    def __init__(self, calls_per_minute, calls_per_day, counter=None):
+        self.capacity = calls_per_minute
+        self.tokens = calls_per_minute
+        self.refill_rate = calls_per_minute / 60
+        self.last_refill = time.monotonic()
+        self.calls_per_day = calls_per_day
+        self.counter = counter
+        self.day = datetime.datetime.now(datetime.timezone.utc).date()
+        self.calls_today = self.get_stored_calls()
+        self.lock = threading.Lock()
+
+    # Function get_stored_calls
+    # Output - the calls made today by all runs, 0 without a counter
+    def get_stored_calls(self):
+        if self.counter is None:
+            return 0
+        return self.counter.get_calls(self.day)
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                # Reset the daily counter when a new day starts
+                today = datetime.datetime.now(datetime.timezone.utc).date()
+                if today != self.day:
+                    self.day = today
+                    self.calls_today = self.get_stored_calls()
+
+                if self.calls_today >= self.calls_per_day:
+                    raise DailyQuotaExceeded(f"Daily quota of {self.calls_per_day} calls is used up")
+
+                # Refill the tokens for the time that has passed since the last call
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.refill_rate)
+                self.last_refill = now
+
+                if self.tokens >= 1:
+                    # Other runs may have used up the quota since the last call
+                    if self.counter is not None and not self.counter.add_call(self.day, self.calls_per_day):
+                        self.calls_today = self.calls_per_day
+                        raise DailyQuotaExceeded(f"Daily quota of {self.calls_per_day} calls is used up")
+                    self.tokens -= 1
+                    self.calls_today += 1
+                    return
+
+                wait = (1 - self.tokens) / self.refill_rate
+
+            # Wait outside of the lock so other threads are not blocked
+            time.sleep(wait)
+
+# The session and rate limiters are shared by all threads, so connections are reused between requests
+session = None
+rate_limiters = {}
+session_lock = threading.Lock()
+
+# Function get_session
+# Input: None
+# Output: session - the requests session shared by all API calls
+# Purpose:
+#   Creates the session the first time it is needed. The session keeps connections open (keep-alive), so only the
+#   first request to a host needs to do the TCP and TLS handshake.
+def get_session():
+    global session
+    with session_lock:
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+    return session
+
+# Function get_rate_limiter
+# Input
+#   url - the URL that will be requested
+# Output: the RateLimiter for the host of the url, or None if the host has no rate limit
+def get_rate_limiter(url):
+    host = urlparse(url).hostname
+    if host not in rate_limits:
+        return None
+    with session_lock:
+        if host not in rate_limiters:
+            counter = None
+            if quota_file is not None:
+                counter = DailyCallCounter(quota_file, host)
+            rate_limiters[host] = RateLimiter(*rate_limits[host], counter)
+    return rate_limiters[host]
+
+# Function get_retry_wait
+# Input
+#   response - the response of the failed request (None if there was no response)
+#   attempt - the number of the attempt that failed, starting at 0
+# Output: number of seconds to wait before trying again
+# Purpose:
+#   If the API tells us how long to wait (Retry-After header on 429 responses), this is used. Otherwise the wait time
+#   doubles with every attempt (exponential backoff)
+def get_retry_wait(response, attempt):
+    if response is not None:
+        retry_after = response.headers.get('Retry-After')
+        if retry_after is not None and retry_after.isdigit():
+            return int(retry_after)
+    return backoff_factor * (2 ** attempt)
+
+# Function send_request
+# Input
+#   url - the URL of the API we will connect to
+#   parameters - Any parameters needed in the API call
+# Output: response.json() - returns a json string containing the API response
+# Purpose:
+#   Requests go through the shared session and wait for the rate limiter of the host. Timeouts, connection errors and
+#   the status codes in retry_status_codes are retried up to max_retries times. Any other error is raised.
+def send_request(url, parameters):
+    rate_limiter = get_rate_limiter(url)
+
+    for attempt in range(max_retries + 1):
+        if rate_limiter is not None:
+            rate_limiter.acquire()
+
+        response = None
+        try:
+            start = time.perf_counter()
+            response = get_session().get(url, params=parameters, timeout=(connect_timeout, read_timeout))
+            instrumentation.record_time('http.request', time.perf_counter() - start)
+            instrumentation.count('http.bytes', len(response.content))
+            instrumentation.count('http.requests')
+
+            if response.status_code not in retry_status_codes:
+                response.raise_for_status()
+                return response.json()
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt == max_retries:
+                raise
+
+        if attempt == max_retries:
+            response.raise_for_status()
+
+        instrumentation.count('http.retries')
+        time.sleep(get_retry_wait(response, attempt))
+
+# Cache for the API responses (see cache.py). If None, every request is sent to the API
+response_cache = None
 
 # Function make_api_request
 # Input
@@ -8,12 +239,23 @@ import pytz
 #   parameters - Any parameters needed in the API call
 # Output: response.json() - returns a json string containing the API response
 # Purpose:
-#   This function connects to an API and returns the results in JSON format
+#   This function connects to an API and returns the results in JSON format.
+#   If a response cache is set and contains the request, no request is sent at all.
 def make_api_request(url, parameters):
-    response = requests.get(url, params=parameters)
-    return response.json()
+    if response_cache is not None:
+        data = response_cache.get(url, parameters)
+        if data is not None:
+            instrumentation.count('cache.hits')
+            return data
 
-# Function convert_epoch_time
+    data = send_request(url, parameters)
+
+    if response_cache is not None:
+        response_cache.set(url, parameters, data)
+
+    return data
+
+# Function convert_epoch_time_with_pytz
 # Input
 #   ts - timestamp to convert (in epoch format)
 #   timezone - timezone of the newly converted timestamp
@@ -21,13 +263,88 @@ def make_api_request(url, parameters):
 # Output: timestamp matching the timezone and format specified (as string)
 # Purpose:
 #   This function will convert epoch times to a more human-readable time defined by the format given. The weather API
-#   uses epoch time in all of its calls, so this must be converted
-def convert_epoch_time(ts, timezone, format):
+#   uses epoch time in all of its calls, so this must be converted.
+#   This looks up the timezone and creates a datetime object on every call. convert_epoch_time does the same with
+#   cached lookups, this function is kept as reference (see benchmark_time.py)
+def convert_epoch_time_with_pytz(ts, timezone, format):
+    import pytz
     utc_time = datetime.datetime.fromtimestamp(ts)
     converted_time = utc_time.astimezone(pytz.timezone(timezone))
 
     return converted_time.strftime(format)
 
+# Function get_timezone
+# Input - timezone - name of the timezone
+# Output - the pytz timezone. Every timezone is only looked up once
+@functools.lru_cache(maxsize=None)
+def get_timezone(timezone):
+    # pytz is only imported when the first timestamp is converted
+    import pytz
+    return pytz.timezone(timezone)
+
+# Function get_offset_transitions
+# Input - timezone - name of the timezone
+# Output
+#   transition_times - list of the epoch times at which the UTC offset of the timezone changes
+#   offsets - list of the UTC offsets (in seconds) starting at each of the transition times
+# Purpose:
+#   Reads the table of offset changes (e.g. daylight saving time) from pytz once per timezone, so the offset of any
+#   timestamp can be looked up without creating datetime objects
+@functools.lru_cache(maxsize=None)
+def get_offset_transitions(timezone):
+    tz = get_timezone(timezone)
+
+    # Timezones without any changes (e.g. UTC) only have a single offset
+    if not hasattr(tz, '_utc_transition_times'):
+        return [0], [int(tz.utcoffset(datetime.datetime(2000, 1, 1)).total_seconds())]
+
+    transition_times = [calendar.timegm(time.timetuple()) for time in tz._utc_transition_times]
+    offsets = [int(info[0].total_seconds()) for info in tz._transition_info]
+    return transition_times, offsets
+
+# Function get_utc_offset
+# Input
+#   ts - timestamp (in epoch format)
+#   timezone - name of the timezone
+# Output - the UTC offset of the timezone at the time of the timestamp (in seconds)
+def get_utc_offset(ts, timezone):
+    transition_times, offsets = get_offset_transitions(timezone)
+    return offsets[max(0, bisect.bisect_right(transition_times, ts) - 1)]
+
+epoch = datetime.datetime(1970, 1, 1)
+
+# Function format_local_minute
+# Input
+#   local_minute - local time as the number of minutes since 1970-01-01 00:00
+#   format - the format the time should be returned as
+# Output - the formatted time (as string)
+# Purpose:
+#   All cities in the same timezone share the same hourly and daily times, so most times are only formatted once
+@functools.lru_cache(maxsize=65536)
+def format_local_minute(local_minute, format):
+    return (epoch + datetime.timedelta(minutes=local_minute)).strftime(format)
+
+# Formats that need more than the local time in minutes can't be cached (seconds and the name or offset of the timezone)
+uncached_format_codes = ['%S', '%f', '%Z', '%z', '%c', '%X', '%T', '%s']
+
+# Function convert_epoch_time
+# Input
+#   ts - timestamp to convert (in epoch format)
+#   timezone - timezone of the newly converted timestamp
+#   format - the format the timestamp should be returned as
+# Output: timestamp matching the timezone and format specified (as string)
+# Purpose:
+#   This function will convert epoch times to a more human-readable time defined by the format given. The weather API
+#   uses epoch time in all of its calls, so this must be converted.
+#   The offset of the timezone comes from a precomputed table and the formatted times are cached, so converting a
+#   time is mostly table lookups. The result is the same as convert_epoch_time_with_pytz
+def convert_epoch_time(ts, timezone, format):
+    if any([code in format for code in uncached_format_codes]):
+        return convert_epoch_time_with_pytz(ts, timezone, format)
+
+    local_minute = (int(ts) + get_utc_offset(ts, timezone)) // 60
+    return format_local_minute(local_minute, format)
+
 # Function create_dict_with_multiple_units
 # Input
 #   conversion_type - either 'temperature' or 'speed'
@@ -53,77 +370,96 @@ def create_dict_with_multiple_units(conversion_type, value_metric):
 #   api_url = url to make the request to
 #   api_parameters = parameters for the API call
 # output:
-#   weather_data: A list object with the current, hourly, and daily weather
-# Purpose:
-#   This function is the meat and potatoes. It will take the data from the API call and transform the values into a
-#   human-readable format. Times are converted, Temps are given in either C or F, speeds in mph or m/s.
-#   The weather_data list contains the following entries:
-#       [0] current_weather, type dict
-#       [1] hourly_forecast, type list
-#       [2] daily_forecast, type list
-#       [3] alerts, type string
+#   forecast: a records.Forecast with the current, hourly, and daily weather (see transform_weather_data)
+# Purpose:
+#   Gets the weather from the API and transforms it into a forecast
 def get_weather_data(api_url, api_parameters):
-    data = make_api_request(api_url, api_parameters)
+    return transform_weather_data(make_api_request(api_url, api_parameters))
 
-    # Initialize all required variables
-    weather_data = []
-
-    current_weather = {}
-    hourly_forecast = []
-    daily_forecast = []
+# Function transform_weather_data:
+# Input:
+#   data = the response of the One Call API
+# output:
+#   forecast: a records.Forecast with the current weather, the hourly forecast for the next 12 hours, the daily
+#             forecast for the next 7 days and the alert
+# Purpose:
+#   This function is the meat and potatoes. It will take the data from the API call and keep the values needed for the
+#   topics. The values are only converted into a human-readable format when they are rendered (see records.py):
+#   Times are converted, Temps are given in either C or F, speeds in mph or m/s.
+def transform_weather_data(data):
+    timezone = data['timezone']
 
     # Set all of the current weather attributes
-    current_weather['time'] = convert_epoch_time(data['current']['dt'], data['timezone'], '%A, %B %d, %Y at %I:%M %p')
-    current_weather['temp'] = create_dict_with_multiple_units('temperature', data['current']['temp'])
-    current_weather['weather_conditions'] = data['current']['weather']
-    current_weather['feels_like'] = create_dict_with_multiple_units('temperature', data['current']['feels_like'])
-    current_weather['humidity'] = str(data['current']['humidity']) + ' %'
-    current_weather['uv'] = str(data['current']['uvi'])
-    current_weather['windspeed'] = create_dict_with_multiple_units('speed', data['current']['wind_speed'])
-
-    # Add current_weather into weather_data list
-    weather_data.append(current_weather)
+    current = data['current']
+    current_weather = records.CurrentWeather(current['dt'], timezone, current['temp'], current['feels_like'],
+                                             current['humidity'], current['uvi'], current['wind_speed'],
+                                             current['weather'][0]['icon'], current['weather'][0]['description'])
 
     # Get hourly weather for the next 12 hours
-    for i in range(0,12):
-        hourly_weather = {}
-        hourly_weather['time'] = convert_epoch_time(data['hourly'][i]['dt'], data['timezone'], '%I:%M %p')
-        hourly_weather['temp'] = create_dict_with_multiple_units('temperature', data['hourly'][i]['temp'])
-        hourly_weather['weather_conditions'] = data['hourly'][i]['weather']
-        hourly_weather['chance_of_rain'] = str(round(data['hourly'][i]['pop'] * 100)) + '%'
-
-        hourly_forecast.append(hourly_weather)
-
-    # Add hourly weather to the weather_data list
-    weather_data.append(hourly_forecast)
+    hourly_forecast = []
+    for hour in data['hourly'][0:12]:
+        hourly_forecast.append(records.HourlyForecast(hour['dt'], timezone, hour['temp'], hour['pop'],
+                                                      hour['weather'][0]['icon'], hour['weather'][0]['description']))
 
     # Get daily forecast for the next 7 days
-    for x in range(0,7):
-        daily_weather = {}
-        daily_weather['time'] = convert_epoch_time(data['daily'][x]['dt'], data['timezone'], '%B %d')
-        daily_weather['min temp'] = create_dict_with_multiple_units('temperature', data['daily'][x]['temp']['min'])
-        daily_weather['max temp'] = create_dict_with_multiple_units('temperature', data['daily'][x]['temp']['max'])
-        daily_weather['weather_conditions'] = data['daily'][x]['weather']
-        daily_weather['chance_of_rain'] = str(round(data['daily'][x]['pop'] * 100)) + '%'
-
-        daily_forecast.append(daily_weather)
-
-    # Add daily forecast to the weather_data list
-    weather_data.append(daily_forecast)
+    daily_forecast = []
+    for day in data['daily'][0:7]:
+        daily_forecast.append(records.DailyForecast(day['dt'], timezone, day['temp']['min'], day['temp']['max'],
+                                                    day['pop'], day['weather'][0]['icon'],
+                                                    day['weather'][0]['description']))
 
     # If there are any alerts, then store these as well.
     if "alerts" in data:
-        weather_data.append(data['alerts'][0]['description'])
+        alert = data['alerts'][0]['description']
     else:
-        weather_data.append("There are no alerts.")
-
-    # Return a list of all of the weather
-    return weather_data
+        alert = "There are no alerts."
 
+    return records.Forecast(current_weather, hourly_forecast, daily_forecast, alert)
 
+# Function get_weather_data_with_response
+# Input: same as get_weather_data
+# Output: (response, forecast) - the One Call response as returned by the API, compressed (see
+#         forecast_store.pack_response), and its Forecast record
+# Purpose:
+#   The responses are compressed right away in the threads, so the responses of thousands of cities don't stay in
+#   memory as dicts until all cities are fetched
+def get_weather_data_with_response(api_url, api_parameters):
+    import forecast_store
 
+    data = make_api_request(api_url, api_parameters)
+    return forecast_store.pack_response(data), transform_weather_data(data)
 
+# Function get_weather_data_for_cities
+# Input:
+#   api_url - url to make the requests to
+#   parameter_list - list of parameters for the API calls, one entry per city
+#   max_workers - maximum number of requests that are running at the same time
+#   keep_responses - if True, every entry of forecasts is (compressed response, forecast) instead of only the
+#                    forecast, to store the responses (see get_weather_data_with_response)
+# Output:
+#   forecasts - list of Forecast records (see get_weather_data) in the same order as parameter_list. If the request
+#               for a city failed, the entry is None
+#   failures - dict with the index of every failed entry in parameter_list and the error that occurred
+# Purpose:
+#   Getting the weather is almost only waiting on the network, so the requests are sent from a pool of threads instead
+#   of one after the other. A failed city does not stop the others, it is reported in failures instead.
+def get_weather_data_for_cities(api_url, parameter_list, max_workers=8, keep_responses=False):
+    forecasts = [None] * len(parameter_list)
+    failures = {}
 
+    if keep_responses:
+        request_function = get_weather_data_with_response
+    else:
+        request_function = get_weather_data
 
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(request_function, api_url, parameters) for parameters in parameter_list]
 
+        # Results are collected in the order the requests were submitted so the output stays the same on every run
+        for index, future in enumerate(futures):
+            try:
+                forecasts[index] = future.result()
+            except Exception as e:
+                failures[index] = e
 
+    return forecasts, failures
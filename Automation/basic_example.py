@@ -1,11 +1,12 @@
 import os
 import requests
 from bs4 import BeautifulSoup
+import layout
 
 if __name__ == "__main__":
 
     # Reading xml file and store into soup object
-    file_name = os.path.realpath(os.path.join(os.path.dirname(__file__), '..')) + '\\Content\\basic_example.htm'
+    file_name = layout.project.content_dir / 'basic_example.htm'
     with open(file_name, "r", encoding="utf-8") as file:
         example = BeautifulSoup(file, 'xml')
 
@@ -0,0 +1,266 @@
+import api
+import continents
+import flare
+import layout
+import templates
+import cities as city_source
+
+import os
+import sys, getopt
+import json
+import time
+import shutil
+import tempfile
+from urllib.parse import urlparse, parse_qs
+import requests
+from requests.adapters import BaseAdapter
+
+# ================================================
+# Purpose: Benchmarks every stage of the pipeline in main.py without calling the real APIs
+# Background:
+#   The requests of api.py are answered by FixtureAdapter instead of the network. It is mounted on the shared session
+#   of api.py, so the real request path (session, retries, JSON) is measured, just without network latency.
+#   The geonames API returns synthetic cities in the shape of fixtures/geonames.json (a real response, every city is a
+#   copy of its city with a new name, position and country), the One Call API returns fixtures/onecall.json in the
+#   timezone of the city. Topics, TOCs and snippets are written into a temporary folder.
+#   For every number of cities in sizes, the time of every stage is measured per city (or once per run for the
+#   geonames and TOC/snippet stages). The results are written as JSON, with throughput, p50/p99 latency per city and
+#   the peak memory (RSS) of the process, so results of different versions can be compared.
+#   Run it with: python benchmark.py [--sizes 10,100] [--output results.json]
+# =================================================
+
+sizes = [10, 100, 1000, 10000]
+
+fixture_dir = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+geonames_api = \
+    "https://public.opendatasoft.com/api/explore/v2.1/catalog/datasets/geonames-all-cities-with-a-population-500/records"
+weather_api = "https://api.openweathermap.org/data/3.0/onecall"
+
+# Countries (and their timezone) of the synthetic cities, one per continent
+countries = [('NG', 'Africa/Lagos'),
+             ('CN', 'Asia/Shanghai'),
+             ('DE', 'Europe/Berlin'),
+             ('US', 'America/Chicago'),
+             ('AU', 'Australia/Sydney'),
+             ('BR', 'America/Sao_Paulo')]
+
+continent_folders = ['Africa', 'Asia', 'Europe', 'NorthAmerica', 'Oceania', 'SouthAmerica']
+
+# Function create_synthetic_cities
+# Input
+#   number_of_cities - number of cities to create
+#   geonames - the geonames response from the fixtures
+# Output - list of cities in the format of the geonames API. The latitude is the index of the city
+def create_synthetic_cities(number_of_cities, geonames):
+    city_records = []
+    for index in range(number_of_cities):
+        country_code, timezone = countries[index % len(countries)]
+        city_records.append(dict(geonames['results'][0],
+                                 name=f'City {index:05d}',
+                                 ascii_name=f'City{index:05d}',
+                                 latitude=float(index),
+                                 longitude=0.0,
+                                 country_code=country_code,
+                                 population=10000000 - index,
+                                 timezone=timezone,
+                                 country=country_code))
+    return city_records
+
+# Class FixtureAdapter
+# Input
+#   city_records - the synthetic cities returned by the geonames API (see create_synthetic_cities)
+#   onecall - the One Call response from the fixtures
+#   geonames - the geonames response from the fixtures, every page of cities is returned in its shape
+# Purpose:
+#   Transport adapter for requests which answers the geonames and One Call requests without any network
+class FixtureAdapter(BaseAdapter):
+    def __init__(self, city_records, onecall, geonames):
+        super().__init__()
+        self.city_records = city_records
+        self.geonames = geonames
+
+        # The One Call response is only converted to JSON once per timezone
+        self.onecall_bodies = {}
+        for country_code, timezone in countries:
+            response = dict(onecall)
+            response['timezone'] = timezone
+            self.onecall_bodies[timezone] = json.dumps(response).encode('utf-8')
+
+    def send(self, request, **kwargs):
+        url = urlparse(request.url)
+        parameters = {name: values[0] for name, values in parse_qs(url.query).items()}
+
+        if url.hostname == 'api.openweathermap.org':
+            city = self.city_records[int(float(parameters['lat']))]
+            body = self.onecall_bodies[city['timezone']]
+        else:
+            where = parameters.get('where', '')
+            if where.startswith('ascii_name in'):
+                results = [city for city in self.city_records if f"'{city['ascii_name']}'" in where]
+            else:
+                offset = int(parameters.get('offset', 0))
+                results = self.city_records[offset:offset + int(parameters.get('limit', 10))]
+            body = json.dumps(dict(self.geonames, total_count=len(self.city_records), results=results)).encode('utf-8')
+
+        response = requests.Response()
+        response.status_code = 200
+        response._content = body
+        response.headers['Content-Type'] = 'application/json'
+        response.encoding = 'utf-8'
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+# Function get_peak_rss
+# Output - the peak memory (resident set size) of this process in KB, None if it can't be measured (Windows)
+def get_peak_rss():
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS returns bytes, Linux returns KB
+    if sys.platform == 'darwin':
+        peak_rss = peak_rss // 1024
+    return peak_rss
+
+# Function get_percentile
+# Input
+#   values - list of numbers
+#   percentile - between 0 and 100
+# Output - the value at the percentile (nearest rank)
+def get_percentile(values, percentile):
+    ordered = sorted(values)
+    return ordered[round(percentile / 100 * (len(ordered) - 1))]
+
+# Function summarize
+# Input - timings - list of the times (in seconds) of one stage
+# Output - dict with the total, p50 and p99 of the times
+def summarize(timings):
+    return {'total_seconds': sum(timings),
+            'p50_ms': get_percentile(timings, 50) * 1000,
+            'p99_ms': get_percentile(timings, 99) * 1000}
+
+# Function timed
+# Input
+#   timings - dict with a list of times per stage. The time of this call is added to timings[stage]
+#   stage - name of the stage
+#   function, *args - the function to call and its arguments
+# Output - the result of function
+def timed(timings, stage, function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    timings.setdefault(stage, []).append(time.perf_counter() - start)
+    return result
+
+# Function run_benchmark
+# Input - number_of_cities - number of synthetic cities
+# Output - dict with the results (see the Background above)
+def run_benchmark(number_of_cities):
+    with open(os.path.join(fixture_dir, 'onecall.json'), encoding='utf-8') as fixture:
+        onecall = json.load(fixture)
+    with open(os.path.join(fixture_dir, 'geonames.json'), encoding='utf-8') as fixture:
+        geonames = json.load(fixture)
+
+    api.get_session().mount('https://', FixtureAdapter(create_synthetic_cities(number_of_cities, geonames), onecall,
+                                                       geonames))
+
+    output_dir = tempfile.mkdtemp(prefix='weather_benchmark_')
+    try:
+        # Same folders as the project, the snippets are copied because they must exist
+        output = layout.ProjectLayout(output_dir)
+        shutil.copytree(layout.project.snippet_dir, output.snippet_dir)
+        output.create_folders(continent_folders)
+
+        run_timings = {}
+        city_timings = {}
+        start = time.perf_counter()
+
+        city_records = timed(run_timings, 'geonames', city_source.get_city_records, geonames_api,
+                             {'where': 'population > 500000', 'order_by': 'population desc'}, number_of_cities, [])
+
+        entries = []
+        for city in city_records:
+            parameters = {'appid': 'benchmark', 'exclude': 'minutely', 'lat': city['latitude'],
+                          'lon': city['longitude'], 'units': 'metric'}
+            forecast = timed(city_timings, 'get_weather_data', api.get_weather_data, weather_api, parameters)
+
+            folder = continents.get_continent_name(city['country_code'])
+            topic_file = output.get_topic_file(folder, city['ascii_name'])
+
+            topic = timed(city_timings, 'initialize_topic', flare.initialize_topic, topic_file, city['ascii_name'])
+            topic = timed(city_timings, 'update_current_weather', flare.update_current_weather, topic, forecast)
+            topic = timed(city_timings, 'update_hourly_forecast', flare.update_hourly_forecast, topic, forecast)
+            topic = timed(city_timings, 'update_daily_forecast', flare.update_daily_forecast, topic, forecast)
+            timed(city_timings, 'render_topic', templates.render_topic, city['ascii_name'], forecast)
+            timed(city_timings, 'insert_into_file', flare.insert_into_file, topic_file, topic)
+
+            entries.append((folder, city['ascii_name']))
+
+        def assemble_tocs_and_snippets():
+            for folder in continent_folders:
+                toc_file = output.get_toc_file(folder)
+                snippet_file = output.get_snippet_file(folder)
+                toc = flare.initialize_toc(toc_file)
+                snippet = flare.initialize_snippet(snippet_file)
+                for entry_folder, name in entries:
+                    if entry_folder == folder:
+                        toc = flare.add_entry_to_toc(toc, folder, name)
+                        snippet = flare.add_entry_to_snippet_list(snippet, folder, name)
+                flare.insert_into_file(toc_file, toc)
+                flare.insert_into_file(snippet_file, snippet)
+
+        timed(run_timings, 'toc_and_snippets', assemble_tocs_and_snippets)
+        total_seconds = time.perf_counter() - start
+    finally:
+        shutil.rmtree(output_dir)
+
+    # Time per city for all stages together (the template renderer is an alternative, so it is not included)
+    per_city = [sum(times) for times in zip(*[timings for stage, timings in city_timings.items()
+                                              if stage != 'render_topic'])]
+
+    return {'cities': number_of_cities,
+            'total_seconds': total_seconds,
+            'cities_per_second': number_of_cities / total_seconds,
+            'per_city': summarize(per_city),
+            'stages': {stage: summarize(timings) for stage, timings in list(run_timings.items()) +
+                       list(city_timings.items())},
+            'peak_rss_kb': get_peak_rss()}
+
+if __name__ == "__main__":
+    output_file = None
+    try:
+        myopts, args = getopt.getopt(sys.argv[1:], "", ["sizes=", "output="])
+    except getopt.GetoptError as e:
+        print(str(e))
+        sys.exit("Usage: %s [--sizes 10,100,1000] [--output results.json]" % sys.argv[0])
+
+    for o, a in myopts:
+        if o == '--sizes':
+            sizes = [int(size) for size in a.split(',')]
+        elif o == '--output':
+            output_file = a
+
+    # No rate limits or cache, every request goes to the FixtureAdapter
+    api.rate_limits = {}
+    api.response_cache = None
+
+    results = []
+    for size in sizes:
+        print(f"Benchmarking {size} cities", file=sys.stderr)
+        result = run_benchmark(size)
+        print(f"  {result['cities_per_second']:.1f} cities per second, "
+              f"p50 {result['per_city']['p50_ms']:.2f} ms, p99 {result['per_city']['p99_ms']:.2f} ms per city",
+              file=sys.stderr)
+        results.append(result)
+
+    if output_file is None:
+        print(json.dumps(results, indent=1))
+    else:
+        with open(output_file, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=1)
@@ -0,0 +1,51 @@
+import os
+import sys, getopt
+import time
+import subprocess
+
+# ================================================
+# Purpose: Measures the cold start of main.py and of the subcommands of cli.py
+# Background:
+#   Every statement is run in a new Python process, the fastest of several runs is shown. The first line is the start
+#   of Python itself, the second line imports the same modules as main.py did before the imports were moved into the
+#   stages. The other lines import the modules a subcommand of cli.py needs before it starts working.
+#   Run it with: python benchmark_startup.py [--runs 10]
+# =================================================
+
+runs = 10
+
+statements = [('python', 'pass'),
+              ('main.py (all modules)', 'import pandas, pytz, pycountry_convert, api, cache, flare, manifest, '
+                                        'render_pool, streaming, cities, continents, instrumentation'),
+              ('import main', 'import main'),
+              ('cli.py fetch', 'import cli, api, cache, cities, continents'),
+              ('cli.py render', 'import cli, manifest, render_pool'),
+              ('cli.py toc', 'import cli, manifest, flare'),
+              ('cli.py commit', 'import cli, git, requests')]
+
+# Function measure
+# Input - statement - Python code
+# Output - the fastest time (in seconds) to start Python and run the statement
+def measure(statement):
+    fastest = None
+    for run in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', statement], cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
+        seconds = time.perf_counter() - start
+        if fastest is None or seconds < fastest:
+            fastest = seconds
+    return fastest
+
+if __name__ == "__main__":
+    try:
+        myopts, args = getopt.getopt(sys.argv[1:], "", ["runs="])
+    except getopt.GetoptError as e:
+        print(str(e))
+        sys.exit("Usage: %s [--runs 10]" % sys.argv[0])
+
+    for o, a in myopts:
+        if o == '--runs':
+            runs = int(a)
+
+    for name, statement in statements:
+        print(f"{name:<25}{measure(statement) * 1000:>10.0f} ms")
@@ -0,0 +1,63 @@
+import api
+import random
+import timeit
+
+# ================================================
+# Purpose: Micro-benchmark of api.convert_epoch_time against api.convert_epoch_time_with_pytz
+# Background:
+#   Every city needs 20 converted times: the current time, 12 hourly and 7 daily forecasts. The benchmark converts
+#   the times of number_of_cities cities spread over a few timezones, like a real run, and prints the time per city
+#   for both functions. It also checks that both functions return exactly the same text.
+#   Run it with: python benchmark_time.py
+# =================================================
+
+number_of_cities = 1000
+repeats = 5
+
+timezones = ['Africa/Lagos', 'America/Chicago', 'America/Mexico_City', 'America/Sao_Paulo', 'Asia/Kolkata',
+             'Asia/Shanghai', 'Australia/Sydney', 'Europe/Berlin', 'Europe/Istanbul', 'Pacific/Auckland']
+
+# Function create_city_times
+# Input - start - epoch time of the current weather of all cities
+# Output - list of (timestamp, timezone, format) of all times converted for number_of_cities cities
+def create_city_times(start):
+    city_times = []
+    generator = random.Random(0)
+    for city in range(number_of_cities):
+        timezone = generator.choice(timezones)
+        current = start + generator.randint(0, 600)
+        city_times.append((current, timezone, '%A, %B %d, %Y at %I:%M %p'))
+        for hour in range(12):
+            city_times.append((start - start % 3600 + hour * 3600, timezone, '%I:%M %p'))
+        for day in range(7):
+            city_times.append((start - start % 86400 + day * 86400 + 39600, timezone, '%B %d'))
+    return city_times
+
+# Function run_benchmark
+# Input - convert_function - either api.convert_epoch_time or api.convert_epoch_time_with_pytz
+# Output - the best time of all repeats per city in microseconds
+def run_benchmark(convert_function, city_times):
+    def convert_all():
+        for ts, timezone, format in city_times:
+            convert_function(ts, timezone, format)
+
+    return min(timeit.repeat(convert_all, number=1, repeat=repeats)) / number_of_cities * 1000000
+
+if __name__ == "__main__":
+    city_times = create_city_times(1697039340)
+
+    for ts, timezone, format in city_times:
+        if api.convert_epoch_time(ts, timezone, format) != api.convert_epoch_time_with_pytz(ts, timezone, format):
+            exit(f"Different result for {ts} in {timezone}")
+
+    # Start with empty caches. The best of all repeats is reported, which is with warm caches like in a long run
+    api.get_timezone.cache_clear()
+    api.get_offset_transitions.cache_clear()
+    api.format_local_minute.cache_clear()
+
+    time_with_pytz = run_benchmark(api.convert_epoch_time_with_pytz, city_times)
+    time_cached = run_benchmark(api.convert_epoch_time, city_times)
+
+    print(f"convert_epoch_time_with_pytz: {time_with_pytz:.1f} us per city")
+    print(f"convert_epoch_time:           {time_cached:.1f} us per city")
+    print(f"Saved {time_with_pytz - time_cached:.1f} us per city ({time_with_pytz / time_cached:.1f}x faster)")
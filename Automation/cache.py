@@ -0,0 +1,166 @@
+import sqlite3
+import json
+import hashlib
+import threading
+import time
+from urllib.parse import urlparse
+
+# ================================================
+# Purpose: Stores API responses on disk so they can be reused by the next runs
+# Background:
+#   Regenerating the topics (e.g. after fixing a template) should not download the city list and every forecast again.
+#   Responses are stored in a small SQLite database, keyed by the URL and the parameters of the request. Secrets like
+#   the API key are not part of the key, so changing the key does not throw away the cache.
+#   Every host has its own time to live. When the cache gets bigger than max_size, the entries that were used least
+#   recently are removed first. The total size is kept in memory and only read once, and the access times of cache
+#   hits are written in batches (see access_batch_size), so a hit does not write to the file.
+#   In offline mode the age of the entries is ignored and no requests are sent at all (replay of the last run).
+# =================================================
+
+# Parameters that are not part of the cache key
+excluded_parameters = ['appid']
+
+# Time to live in seconds for every host. Hosts that are not listed use default_ttl
+ttls = {'api.openweathermap.org': 10 * 60,  # Forecasts change, but not within minutes
+        'public.opendatasoft.com': 7 * 24 * 60 * 60}  # The list of cities hardly changes
+default_ttl = 60 * 60
+
+# Maximum size of all responses in the cache in bytes
+max_size = 200 * 1024 * 1024
+
+# The access times of cache hits are written to the file after this many hits, when a response is stored and on close
+access_batch_size = 500
+
+# Class CacheMiss
+# Purpose:
+#   Raised in offline mode if a request is not in the cache
+class CacheMiss(Exception):
+    pass
+
+# Function make_cache_key
+# Input
+#   url - the URL of the request
+#   parameters - the parameters of the request
+# Output: key - a hash identifying the request
+# Purpose:
+#   Normalizes the parameters (sorted, converted to strings, surrounding whitespace removed, secrets removed) so the
+#   same request always gets the same key
+def make_cache_key(url, parameters):
+    normalized = {}
+    for name, value in (parameters or {}).items():
+        if name not in excluded_parameters:
+            normalized[str(name)] = str(value).strip()
+
+    key_text = url + '?' + json.dumps(normalized, sort_keys=True)
+    return hashlib.sha256(key_text.encode('utf-8')).hexdigest()
+
+# Class ResponseCache
+# Input
+#   file_name - absolute path of the SQLite file holding the cache. It is created if it doesn't exist
+#   offline - if True, entries never expire and a request that is not cached raises CacheMiss
+# Purpose:
+#   Persistent cache for API responses. The same object can be used from several threads.
+class ResponseCache:
+    def __init__(self, file_name, offline=False):
+        self.offline = offline
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(file_name, check_same_thread=False)
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS responses (
+                                       key TEXT PRIMARY KEY,
+                                       url TEXT,
+                                       stored_at REAL,
+                                       last_access REAL,
+                                       size INTEGER,
+                                       body TEXT)""")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+        self.connection.commit()
+        self.total_size = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        self.accessed = {}  # key -> time of the last hit, not written yet
+
+    # Function get
+    # Input
+    #   url, parameters - the request
+    # Output: the stored response (already converted from JSON) or None if there is no valid entry
+    def get(self, url, parameters):
+        key = make_cache_key(url, parameters)
+        with self.lock:
+            row = self.connection.execute("SELECT stored_at, body FROM responses WHERE key = ?", (key,)).fetchone()
+
+            if row is None:
+                if self.offline:
+                    raise CacheMiss(f"{url} is not in the cache")
+                return None
+
+            stored_at, body = row
+            if not self.offline and time.time() - stored_at > ttls.get(urlparse(url).hostname, default_ttl):
+                return None
+
+            self.accessed[key] = time.time()
+            if len(self.accessed) >= access_batch_size:
+                self.write_access_times()
+                self.connection.commit()
+
+        return json.loads(body)
+
+    # Function write_access_times
+    # Purpose:
+    #   Writes the access times of the hits since the last call. Must be called with the lock, the caller commits
+    def write_access_times(self):
+        if len(self.accessed) == 0:
+            return
+        self.connection.executemany("UPDATE responses SET last_access = ? WHERE key = ?",
+                                    [(last_access, key) for key, last_access in self.accessed.items()])
+        self.accessed = {}
+
+    # Function set
+    # Input
+    #   url, parameters - the request
+    #   data - the response (already converted from JSON)
+    # Output: None
+    # Purpose:
+    #   Stores the response and removes the least recently used entries if the cache got too big
+    def set(self, url, parameters, data):
+        key = make_cache_key(url, parameters)
+        body = json.dumps(data)
+        now = time.time()
+        with self.lock:
+            # An expired entry of the same request is replaced, its size no longer counts
+            row = self.connection.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                self.total_size -= row[0]
+
+            self.connection.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                                    (key, url, now, now, len(body), body))
+            self.total_size += len(body)
+            self.accessed.pop(key, None)
+            self.write_access_times()
+            self.evict()
+            self.connection.commit()
+
+    # Function evict
+    # Purpose:
+    #   Deletes the least recently used entries until the total size is below max_size. Must be called with the lock
+    def evict(self):
+        if self.total_size <= max_size:
+            return
+
+        # The order depends on the access times, so the hits that were not written yet are written first
+        self.write_access_times()
+
+        keys_to_delete = []
+        for key, size in self.connection.execute("SELECT key, size FROM responses ORDER BY last_access"):
+            if self.total_size <= max_size:
+                break
+            keys_to_delete.append((key,))
+            self.total_size -= size
+
+        self.connection.executemany("DELETE FROM responses WHERE key = ?", keys_to_delete)
+
+    # Function close
+    # Purpose:
+    #   Writes the access times of the last hits and closes the file
+    def close(self):
+        with self.lock:
+            self.write_access_times()
+            self.connection.commit()
+            self.connection.close()
@@ -0,0 +1,119 @@
+from concurrent.futures import ThreadPoolExecutor
+import api
+
+# ================================================
+# Purpose: Gets the list of cities from the geonames dataset on opendatasoft
+# Background:
+#   The records API returns at most page_size cities per request, so bigger lists are requested page by page using
+#   offsets. The pages are requested at the same time. The API does not allow offset + limit to be above max_records.
+#   The additional (special) cities are requested with a single "ascii_name in (...)" query instead of one request
+#   per city.
+#   The cities are plain lists of dicts, pandas is not needed.
+# =================================================
+
+page_size = 100  # Maximum number of records per request allowed by the API
+max_records = 10000  # Maximum of offset + limit allowed by the API
+
+# Function get_page
+# Input
+#   api_url - url of the records API
+#   parameters - parameters of the request (select, where, order_by, ...)
+#   offset - the number of records to skip
+#   limit - the number of records to return
+# Output - the response of the API (dict with total_count and results)
+def get_page(api_url, parameters, offset, limit):
+    page_parameters = dict(parameters)
+    page_parameters['offset'] = str(offset)
+    page_parameters['limit'] = str(limit)
+    return api.make_api_request(api_url, page_parameters)
+
+# Function get_page_limits
+# Input
+#   number_of_cities - the number of cities that are needed
+#   total_count - the number of cities available, None if not known yet
+# Output - list of (offset, limit) for all pages that need to be requested
+def get_page_limits(number_of_cities, total_count=None):
+    number_of_cities = min(number_of_cities, max_records)
+    if total_count is not None:
+        number_of_cities = min(number_of_cities, total_count)
+
+    return [(offset, min(page_size, number_of_cities - offset)) for offset in range(0, number_of_cities, page_size)]
+
+# Function get_largest_cities
+# Input
+#   api_url - url of the records API
+#   parameters - parameters of the request (select, where, order_by, ...)
+#   number_of_cities - the number of cities to return
+#   workers - number of pages requested at the same time
+# Output - list of the cities (one dict per city) in the order returned by the API
+def get_largest_cities(api_url, parameters, number_of_cities, workers=4):
+    page_limits = get_page_limits(number_of_cities)
+    if len(page_limits) == 0:
+        return []
+
+    # The first page tells us how many cities there are, so no pages after the end are requested
+    first_page = get_page(api_url, parameters, *page_limits[0])
+    city_records = list(first_page['results'])
+    page_limits = get_page_limits(number_of_cities, first_page['total_count'])[1:]
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pages = executor.map(lambda page_limit: get_page(api_url, parameters, *page_limit), page_limits)
+        for page in pages:
+            city_records.extend(page['results'])
+
+    return city_records
+
+# Function get_special_cities
+# Input
+#   api_url - url of the records API
+#   parameters - parameters of the request (select, ...). The where condition is replaced
+#   names - list of ascii names of the cities
+# Output - list of the cities (one dict per city), in the order of names
+def get_special_cities(api_url, parameters, names):
+    city_records = []
+
+    for start in range(0, len(names), page_size):
+        batch = names[start:start + page_size]
+        batch_parameters = dict(parameters)
+        batch_parameters.pop('order_by', None)
+        batch_parameters['where'] = 'ascii_name in (' + ', '.join([f"'{name}'" for name in batch]) + ')'
+
+        results = get_page(api_url, batch_parameters, 0, page_size)['results']
+
+        # Keep the order of names, the API returns the cities in any order
+        for name in batch:
+            city_records.extend([city for city in results if city['ascii_name'] == name])
+
+    return city_records
+
+# Function get_city_records
+# Input
+#   api_url - url of the records API
+#   parameters - parameters of the request for the largest cities (select, where, order_by)
+#   number_of_cities - the number of largest cities
+#   special_cities - list of ascii names of additional cities
+#   workers - number of pages requested at the same time
+# Output - list of all cities (one dict per city): first the largest cities, then the special cities
+def get_city_records(api_url, parameters, number_of_cities, special_cities, workers=4):
+    return get_largest_cities(api_url, parameters, number_of_cities, workers) + \
+        get_special_cities(api_url, parameters, special_cities)
+
+# Function iterate_cities
+# Input - see get_city_records
+# Output - generator with all cities (one dict per city), in the same order as get_city_records
+# Purpose:
+#   Used in streaming mode. Only one page is requested at a time, and only when the cities before have been used
+def iterate_cities(api_url, parameters, number_of_cities, special_cities):
+    page_limits = get_page_limits(number_of_cities)
+    total_count = None
+
+    for offset, limit in page_limits:
+        if total_count is not None and offset >= total_count:
+            break
+        page = get_page(api_url, parameters, offset, limit)
+        total_count = page['total_count']
+        for city in page['results']:
+            yield city
+
+    for city in get_special_cities(api_url, parameters, special_cities):
+        yield city
@@ -0,0 +1,241 @@
+import main
+
+import os
+import sys, getopt
+import json
+import getpass
+import traceback
+
+# ================================================
+# Purpose: Command line entry point which runs the stages of main.py on their own
+# Background:
+#   A full run of main.py fetches the weather, renders the topics, builds the TOCs and snippets in one go. For small
+#   incremental runs most of the time is spent starting Python and importing modules that are not needed.
+#   Every subcommand only imports the modules it needs:
+#       fetch - gets the cities and their weather and saves them in forecasts_file (requests, no BeautifulSoup)
+#       render - renders and writes the topics of forecasts_file. With --from-store, the last forecasts of the
+#                forecast store are rendered instead (see forecast_store.py)
+#       toc - builds the TOCs and snippets of the cities in forecasts_file (or the forecast store). With --shard, the
+#             entries of the shard are saved instead (see shards.py)
+#       merge - builds the TOCs and snippets from the entries of all shards (needs --shard-count)
+#       commit - commits and pushes the changes (see github_commit.py)
+#       run - all stages except commit in one process, same as main.py
+#       publish - all stages including commit in one process (see publish_command). With --dry-run the topics are
+#                 generated, but the changed files are only printed instead of committed
+#   Run it with: python cli.py <fetch|render|toc|merge|commit|run|publish> [--offline] [--no-cache] [--stream]
+#                              [--delta] [--from-store] [--no-store] [--unit-variants] [--shard index/count]
+#                              [--shard-count count] [--run-id id] [--dry-run] [-u user] [-p token]
+#   benchmark_startup.py compares the start-up time of the subcommands with main.py.
+# =================================================
+
+# The result of fetch, read by render and toc
+forecasts_file = os.path.join(os.path.dirname(__file__), 'forecasts.json')
+
+usage = "Usage: %s <fetch|render|toc|merge|commit|run|publish> [--offline] [--no-cache] [--stream] [--delta] " \
+        "[--from-store] [--no-store] [--unit-variants] [--shard index/count] [--shard-count count] [--run-id id] " \
+        "[--dry-run] [-u user] [-p token]"
+
+# Exit codes of publish
+exit_success = 0
+exit_generation_failed = 1  # nothing was committed, the project may still contain the files of the last run
+exit_usage = 2
+exit_commit_failed = 3  # the files were generated, they are committed by the next successful publish or commit
+exit_cities_failed = 4  # everything was committed, but some cities have no topic (see main.report_failures)
+
+# Function save_forecasts
+# Input
+#   city_forecasts - list returned by main.fetch
+#   failures - list of (name of the city, error)
+# Output: None
+def save_forecasts(city_forecasts, failures):
+    with open(forecasts_file, "w", encoding="utf-8") as file:
+        json.dump({'cities': [dict(city, forecast=city['forecast'].to_dict()) for city in city_forecasts],
+                   'failures': [[city, str(error)] for city, error in failures]}, file)
+
+# Function load_forecasts
+# Input: None
+# Output - the list of cities and the list of failures saved by save_forecasts, or the last forecasts of the forecast
+#          store with --from-store. With --shard, only the cities and failures of the shard
+def load_forecasts():
+    if main.render_from_store:
+        return main.load_stored_forecasts()
+
+    if not os.path.exists(forecasts_file):
+        sys.exit(f"{forecasts_file} does not exist, run the fetch subcommand first")
+
+    import records
+
+    with open(forecasts_file, encoding="utf-8") as file:
+        forecasts = json.load(file)
+    cities = forecasts['cities']
+    failures = [tuple(failure) for failure in forecasts['failures']]
+
+    # forecasts.json may come from a fetch of all cities, a shard only renders its own
+    if main.shard is not None:
+        import shards
+        cities = list(shards.select_cities(cities, main.shard, key='title'))
+        failures = [failure for failure in failures if shards.get_shard(failure[0], main.shard[1]) == main.shard[0]]
+
+    city_forecasts = [dict(city, forecast=records.Forecast.from_dict(city['forecast'])) for city in cities]
+    return city_forecasts, failures
+
+def fetch_command():
+    main.open_cache()
+    try:
+        city_forecasts, failures = main.fetch()
+    finally:
+        main.close_cache()
+    save_forecasts(city_forecasts, failures)
+    print(f"Saved the forecasts of {len(city_forecasts)} cities to {forecasts_file}")
+    main.report_failures(failures)
+
+def render_command():
+    generated_files = main.open_manifest()
+    writer = main.open_writer()
+    try:
+        main.render(load_forecasts()[0], generated_files, writer)
+        writer.commit()
+    finally:
+        writer.close()
+    main.save_manifest(generated_files)
+
+def toc_command():
+    city_forecasts, failures = load_forecasts()
+    if main.shard is not None:
+        main.save_shard_entries(city_forecasts, failures)
+        return
+
+    generated_files = main.open_manifest()
+    writer = main.open_writer()
+    try:
+        main.build_tocs_and_snippets(city_forecasts, generated_files, writer)
+        writer.commit()
+    finally:
+        writer.close()
+    main.save_manifest(generated_files)
+
+# Function set_credentials
+# Input
+#   user - GitHub user name, asked for if empty
+#   token - GitHub PAT, taken from api_secrets.py or asked for if empty
+# Output - the github_commit module, ready to push
+def set_credentials(user, token):
+    import github_commit
+
+    if token is None:
+        import api_secrets
+        token = getattr(api_secrets, 'github_pat', '')
+    if user == '':
+        user = getpass.getpass(prompt='Enter your Github Username: ')
+    if token == '':
+        token = getpass.getpass(prompt='Enter your Github PAT: ')
+
+    github_commit.user = user
+    github_commit.token = token
+    return github_commit
+
+def commit_command(user, token):
+    set_credentials(user, token).commit_to_github()
+
+# Function publish_command
+# Input
+#   user, token - see set_credentials. Not needed for a dry run
+#   dry_run - if True, the changed files are only printed, nothing is committed or pushed
+# Output - the exit code (see exit_success and the codes below it)
+# Purpose:
+#   Runs fetch, render, write and commit in one process. The commit gets the files written since the last commit from
+#   the manifest in memory, so neither the lists of written files nor the working tree are read again. Errors are
+#   returned as exit code, no error.txt is needed to detect them
+def publish_command(user, token, dry_run):
+    try:
+        generated_files, failures = main.run()
+    except Exception:
+        traceback.print_exc()
+        print("Generating the topics failed, nothing was committed")
+        return exit_generation_failed
+
+    try:
+        if dry_run:
+            import github_commit
+        else:
+            github_commit = set_credentials(user, token)
+        github_commit.commit_to_github(generated_files.uncommitted_files, dry_run)
+    except Exception:
+        traceback.print_exc()
+        print("Committing the changes failed")
+        return exit_commit_failed
+
+    if len(failures) > 0:
+        return exit_cities_failed
+    return exit_success
+
+commands = {'fetch': fetch_command,
+            'render': render_command,
+            'toc': toc_command,
+            'merge': main.merge,
+            'run': main.run}
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in list(commands) + ['commit', 'publish']:
+        print(usage % sys.argv[0])
+        sys.exit(exit_usage)
+
+    command = sys.argv[1]
+    try:
+        myopts, args = getopt.getopt(sys.argv[2:], "u:p:", ["offline", "no-cache", "stream", "delta", "from-store",
+                                                            "no-store", "unit-variants", "shard=", "shard-count=",
+                                                            "run-id=", "dry-run"])
+    except getopt.GetoptError as e:
+        print(str(e))
+        print(usage % sys.argv[0])
+        sys.exit(exit_usage)
+
+    user = ''
+    token = None
+    dry_run = False
+    for o, a in myopts:
+        if o == '--offline':
+            main.offline_mode = True
+        elif o == '--no-cache':
+            main.use_cache = False
+        elif o == '--stream':
+            main.streaming_mode = True
+        elif o == '--delta':
+            main.delta_rendering = True
+        elif o == '--from-store':
+            main.render_from_store = True
+        elif o == '--no-store':
+            main.use_forecast_store = False
+        elif o == '--unit-variants':
+            main.unit_variants = main.all_unit_variants
+        elif o == '--shard':
+            import shards
+            try:
+                main.shard = shards.parse_shard(a)
+            except ValueError as e:
+                sys.exit(str(e))
+        elif o == '--shard-count':
+            main.shard_count = int(a)
+        elif o == '--run-id':
+            main.run_id = a
+        elif o == '--dry-run':
+            dry_run = True
+        elif o == '-u':
+            user = a
+        elif o == '-p':
+            token = a
+
+    # A shard only has part of the topics and no TOCs, it can't be published on its own
+    if (command == 'merge' and main.shard_count is None) or (command == 'publish' and main.shard is not None):
+        print(usage % sys.argv[0])
+        sys.exit(exit_usage)
+    if main.unit_variants is not None and (main.streaming_mode or not main.use_template_renderer):
+        print("--unit-variants needs the template renderer and can't be used with --stream")
+        sys.exit(exit_usage)
+
+    if command == 'commit':
+        commit_command(user, token)
+    elif command == 'publish':
+        sys.exit(publish_command(user, token, dry_run))
+    else:
+        commands[command]()
@@ -0,0 +1,64 @@
+# ================================================
+# Purpose: Finds the continent (which is also the folder) of a city from its country code
+# Background:
+#   pycountry_convert is slow to import and converting every city row on its own shows up in the profiles.
+#   country_continents is the table of pycountry_convert (country alpha-2 code -> continent name without spaces),
+#   so it only needs to be built once. pycountry_convert is only imported for codes that are not in the table.
+#   There is no folder for Antarctica, so its islands are in the folder of the nearest continent: Bouvet Island (BV) in
+#   Africa, Heard Island and McDonald Islands (HM, an Australian territory) in Oceania.
+# =================================================
+
+country_continents = {'AB': 'Asia', 'AD': 'Europe', 'AE': 'Asia', 'AF': 'Asia', 'AG': 'NorthAmerica', 'AI': 'NorthAmerica',
+                      'AL': 'Europe', 'AM': 'Asia', 'AO': 'Africa', 'AR': 'SouthAmerica', 'AS': 'Oceania', 'AT': 'Europe',
+                      'AU': 'Oceania', 'AW': 'NorthAmerica', 'AX': 'Europe', 'AZ': 'Asia', 'BA': 'Europe', 'BB': 'NorthAmerica',
+                      'BD': 'Asia', 'BE': 'Europe', 'BF': 'Africa', 'BG': 'Europe', 'BH': 'Asia', 'BI': 'Africa', 'BJ': 'Africa',
+                      'BL': 'NorthAmerica', 'BM': 'NorthAmerica', 'BN': 'Asia', 'BO': 'SouthAmerica', 'BQ': 'NorthAmerica',
+                      'BR': 'SouthAmerica', 'BS': 'NorthAmerica', 'BT': 'Asia', 'BV': 'Africa', 'BW': 'Africa', 'BY': 'Europe',
+                      'BZ': 'NorthAmerica', 'CA': 'NorthAmerica', 'CC': 'Asia', 'CD': 'Africa', 'CF': 'Africa', 'CG': 'Africa',
+                      'CH': 'Europe', 'CI': 'Africa', 'CK': 'Oceania', 'CL': 'SouthAmerica', 'CM': 'Africa', 'CN': 'Asia',
+                      'CO': 'SouthAmerica', 'CR': 'NorthAmerica', 'CU': 'NorthAmerica', 'CV': 'Africa', 'CW': 'NorthAmerica',
+                      'CX': 'Asia', 'CY': 'Asia', 'CZ': 'Europe', 'DE': 'Europe', 'DJ': 'Africa', 'DK': 'Europe',
+                      'DM': 'NorthAmerica', 'DO': 'NorthAmerica', 'DZ': 'Africa', 'EC': 'SouthAmerica', 'EE': 'Europe',
+                      'EG': 'Africa', 'ER': 'Africa', 'ES': 'Europe', 'ET': 'Africa', 'FI': 'Europe', 'FJ': 'Oceania',
+                      'FK': 'SouthAmerica', 'FM': 'Oceania', 'FO': 'Europe', 'FR': 'Europe', 'GA': 'Africa', 'GB': 'Europe',
+                      'GD': 'NorthAmerica', 'GE': 'Asia', 'GF': 'SouthAmerica', 'GG': 'Europe', 'GH': 'Africa', 'GI': 'Europe',
+                      'GL': 'NorthAmerica', 'GM': 'Africa', 'GN': 'Africa', 'GP': 'NorthAmerica', 'GQ': 'Africa', 'GR': 'Europe',
+                      'GS': 'SouthAmerica', 'GT': 'NorthAmerica', 'GU': 'Oceania', 'GW': 'Africa', 'GY': 'SouthAmerica',
+                      'HK': 'Asia', 'HM': 'Oceania', 'HN': 'NorthAmerica', 'HR': 'Europe', 'HT': 'NorthAmerica', 'HU': 'Europe',
+                      'ID': 'Asia', 'IE': 'Europe', 'IL': 'Asia', 'IM': 'Europe', 'IN': 'Asia', 'IO': 'Asia', 'IQ': 'Asia',
+                      'IR': 'Asia', 'IS': 'Europe', 'IT': 'Europe', 'JE': 'Europe', 'JM': 'NorthAmerica', 'JO': 'Asia', 'JP': 'Asia',
+                      'KE': 'Africa', 'KG': 'Asia', 'KH': 'Asia', 'KI': 'Oceania', 'KM': 'Africa', 'KN': 'NorthAmerica',
+                      'KP': 'Asia', 'KR': 'Asia', 'KW': 'Asia', 'KY': 'NorthAmerica', 'KZ': 'Asia', 'LA': 'Asia', 'LB': 'Asia',
+                      'LC': 'NorthAmerica', 'LI': 'Europe', 'LK': 'Asia', 'LR': 'Africa', 'LS': 'Africa', 'LT': 'Europe',
+                      'LU': 'Europe', 'LV': 'Europe', 'LY': 'Africa', 'MA': 'Africa', 'MC': 'Europe', 'MD': 'Europe', 'ME': 'Europe',
+                      'MF': 'NorthAmerica', 'MG': 'Africa', 'MH': 'Oceania', 'MK': 'Europe', 'ML': 'Africa', 'MM': 'Asia',
+                      'MN': 'Asia', 'MO': 'Asia', 'MP': 'Oceania', 'MQ': 'NorthAmerica', 'MR': 'Africa', 'MS': 'NorthAmerica',
+                      'MT': 'Europe', 'MU': 'Africa', 'MV': 'Asia', 'MW': 'Africa', 'MX': 'NorthAmerica', 'MY': 'Asia',
+                      'MZ': 'Africa', 'NA': 'Africa', 'NC': 'Oceania', 'NE': 'Africa', 'NF': 'Oceania', 'NG': 'Africa',
+                      'NI': 'NorthAmerica', 'NL': 'Europe', 'NO': 'Europe', 'NP': 'Asia', 'NR': 'Oceania', 'NU': 'Oceania',
+                      'NZ': 'Oceania', 'OM': 'Asia', 'OS': 'Asia', 'PA': 'NorthAmerica', 'PE': 'SouthAmerica', 'PF': 'Oceania',
+                      'PG': 'Oceania', 'PH': 'Asia', 'PK': 'Asia', 'PL': 'Europe', 'PM': 'NorthAmerica', 'PR': 'NorthAmerica',
+                      'PS': 'Asia', 'PT': 'Europe', 'PW': 'Oceania', 'PY': 'SouthAmerica', 'QA': 'Asia', 'RE': 'Africa',
+                      'RO': 'Europe', 'RS': 'Europe', 'RU': 'Europe', 'RW': 'Africa', 'SA': 'Asia', 'SB': 'Oceania', 'SC': 'Africa',
+                      'SD': 'Africa', 'SE': 'Europe', 'SG': 'Asia', 'SH': 'Africa', 'SI': 'Europe', 'SJ': 'Europe', 'SK': 'Europe',
+                      'SL': 'Africa', 'SM': 'Europe', 'SN': 'Africa', 'SO': 'Africa', 'SR': 'SouthAmerica', 'SS': 'Africa',
+                      'ST': 'Africa', 'SV': 'NorthAmerica', 'SY': 'Asia', 'SZ': 'Africa', 'TC': 'NorthAmerica', 'TD': 'Africa',
+                      'TG': 'Africa', 'TH': 'Asia', 'TJ': 'Asia', 'TK': 'Oceania', 'TM': 'Asia', 'TN': 'Africa', 'TO': 'Oceania',
+                      'TP': 'Asia', 'TR': 'Asia', 'TT': 'NorthAmerica', 'TV': 'Oceania', 'TW': 'Asia', 'TZ': 'Africa',
+                      'UA': 'Europe', 'UG': 'Africa', 'US': 'NorthAmerica', 'UY': 'SouthAmerica', 'UZ': 'Asia', 'VC': 'NorthAmerica',
+                      'VE': 'SouthAmerica', 'VG': 'NorthAmerica', 'VI': 'NorthAmerica', 'VN': 'Asia', 'VU': 'Oceania',
+                      'WF': 'Oceania', 'WS': 'Oceania', 'XK': 'Europe', 'YE': 'Asia', 'YT': 'Africa', 'ZA': 'Africa', 'ZM': 'Africa',
+                      'ZW': 'Africa'}
+
+# Function get_continent_name
+# Input - country_code - the ISO alpha-2 code of a country
+# Output - the name of the continent without spaces (e.g. 'NorthAmerica'), which is also the name of its folder
+# Purpose:
+#   Converts the country code to the name of the continent so we know which folder to put a city in
+def get_continent_name(country_code):
+    if country_code in country_continents:
+        return country_continents[country_code]
+
+    import pycountry_convert as pc
+    continent_code = pc.country_alpha2_to_continent_code(country_code)
+    return pc.convert_continent_code_to_continent_name(continent_code).replace(' ', '')
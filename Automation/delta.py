@@ -0,0 +1,101 @@
+import os
+import hashlib
+import instrumentation
+import templates
+
+# ================================================
+# Purpose: Renders only the sections of a topic whose forecast changed since the last run
+# Background:
+#   A topic has three sections: div#current, div#forecast_hourly and div#forecast_daily. Most refreshes only change the
+#   current weather and some hours, but the whole topic used to be rendered again.
+#   For every topic, a short hash of the forecast data of each section is stored in its manifest entry (see
+#   manifest.py). In delta mode, the new hashes are compared with the stored ones:
+#       - no section changed: the topic is not rendered at all
+#       - some sections changed: only these are rendered and replace the old sections in the existing topic
+#       - the topic is new, or it was changed since it was generated (size or modification time differ from the
+#         manifest): the topic is rendered completely with templates.render_topic_for_file, which keeps the changes of
+#         writers outside of the sections
+#   The hashes are stored on every run, also without delta mode, so the stored hashes always match the topic.
+#   Patching only replaces the content of the section divs (see templates.replace_sections), so everything else in the
+#   topic stays as it is. If a div can't be found, the topic is rendered completely.
+# =================================================
+
+# Increase when the templates of the sections change, so every topic is rendered completely once
+sections_version = 1
+
+# The id of the div of every section and the function rendering its content
+section_renderers = {'current': templates.render_current_weather,
+                     'forecast_hourly': templates.render_hourly_forecast,
+                     'forecast_daily': templates.render_daily_forecast}
+
+# Function get_section_data
+# Input - forecast - the records.Forecast returned by api.get_weather_data
+# Output - dict with the id of every section and the part of the forecast shown in it
+def get_section_data(forecast):
+    return {'current': (forecast.current, forecast.alert),
+            'forecast_hourly': forecast.hourly,
+            'forecast_daily': forecast.daily}
+
+# Function hash_sections
+# Input - forecast - the records.Forecast returned by api.get_weather_data
+# Output - dict with the id of every section and a short hash of its data
+def hash_sections(forecast):
+    return {section: hashlib.sha256(f'{sections_version}:{data!r}'.encode('utf-8')).hexdigest()[:16]
+            for section, data in get_section_data(forecast).items()}
+
+# Function get_changed_sections
+# Input
+#   file_name - absolute path of the topic
+#   entry - the manifest entry of the topic from the last run, None for a new topic
+#   sections - the new hashes (see hash_sections)
+# Output - list of the ids of the changed sections, None if the topic has to be rendered completely
+def get_changed_sections(file_name, entry, sections):
+    if entry is None or entry.get('sections') is None:
+        return None
+
+    try:
+        stat = os.stat(file_name)
+    except FileNotFoundError:
+        return None
+    if entry['size'] != stat.st_size or entry['mtime_ns'] != stat.st_mtime_ns:
+        return None
+
+    return [section for section, section_hash in sections.items() if entry['sections'].get(section) != section_hash]
+
+# Function patch_topic
+# Input
+#   text - the existing topic
+#   forecast - the records.Forecast returned by api.get_weather_data
+#   changed - ids of the sections that are rendered again
+# Output - the topic with the new sections, None if a section was not found
+def patch_topic(text, forecast, changed):
+    return templates.replace_sections(text, {section: section_renderers[section](forecast) for section in changed})
+
+# Function render_topic
+# Input
+#   file_name - absolute path of the topic
+#   title - the title of the topic (h1), normally the name of the city
+#   forecast - the records.Forecast returned by api.get_weather_data
+#   entry - the manifest entry of the topic from the last run, None for a new topic
+# Output
+#   topic - the complete topic as string, None if no section changed and the topic can stay as it is
+#   sections - the new hashes, to be stored with Manifest.set_sections
+def render_topic(file_name, title, forecast, entry):
+    sections = hash_sections(forecast)
+    changed = get_changed_sections(file_name, entry, sections)
+
+    if changed is None:
+        return templates.render_topic_for_file(file_name, title, forecast), sections
+
+    if len(changed) == 0:
+        instrumentation.count('delta.topics_unchanged')
+        return None, sections
+
+    with open(file_name, encoding="utf-8") as topic_file:
+        topic = patch_topic(topic_file.read(), forecast, changed)
+
+    if topic is None:
+        return templates.render_topic_for_file(file_name, title, forecast), sections
+
+    instrumentation.count('delta.sections_rendered', len(changed))
+    return topic, sections
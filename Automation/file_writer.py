@@ -0,0 +1,249 @@
+import os
+import sys
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import instrumentation
+import manifest
+
+# ================================================
+# Purpose: Writes the generated files atomically, in the background
+# Background:
+#   If a run crashes while the topics are written, some files are new, some are old and one may be half written.
+#   Every file is first written completely to a temporary file next to it (see get_temp_file_name) and then replaces
+#   the old file with os.replace, so a file is always either the old or the new version, never half written.
+#   By default the files are only replaced when the whole run is done (commit), so a crash before that leaves the
+#   project as it was. In streaming mode (see main.stream) the topics are replaced in batches of replace_batch_size
+#   files while the run goes on, so the first topics are in the project while later cities are still fetched. A crash
+#   then leaves some topics new and some old, but every single file is complete. The TOCs and snippets are always
+#   written after all topics, so they are replaced last and never point to a topic that is not there yet.
+#   The temporary files are written by a pool of threads, so rendering never waits for the disk. They are not synced
+#   one by one: before a batch replaces the old files, the whole batch is synced at once (see sync_files) and every
+#   folder of the batch is synced once.
+#   Render processes (see render_pool.py) write their temporary files themselves and hand them over with
+#   add_temp_file, so they are synced and replaced together with all other files.
+# =================================================
+
+temp_suffix = '.tmp'
+
+# Numbers the temporary files, so a file written twice in a run gets two temporary files
+temp_file_numbers = itertools.count()
+
+# Function get_temp_file_name
+# Input - file_name - absolute path of a file
+# Output - a new name for a temporary file next to it, unique in all processes
+def get_temp_file_name(file_name):
+    return f'{file_name}.{os.getpid()}-{next(temp_file_numbers)}{temp_suffix}'
+
+# Function encode_text
+# Input - text - string or soup object
+# Output - the text as UTF-8 bytes, with '\n' as line break
+# Purpose:
+#   Python and Flare use different new line characters, not switching them causes extra line breaks all over the
+#   place. The text is only copied for this if it contains '\r\n' at all, which it normally doesn't
+def encode_text(text):
+    content = str(text)
+    if '\r\n' in content:
+        content = content.replace('\r\n', '\n')
+    return content.encode('utf-8')
+
+# Function write_temp_file
+# Input
+#   temp_file_name - absolute path of the temporary file (see get_temp_file_name)
+#   data - the content of the file (see encode_text)
+#   sync - if True, the file is synced to disk before returning. FileWriter syncs its files in batches instead
+# Output - the sha256 hash of data (see manifest.hash_text)
+# Purpose:
+#   Writes data to the temporary file. The files used to be written in text mode, so the new lines are still written
+#   as os.linesep
+def write_temp_file(temp_file_name, data, sync=False):
+    text_hash = manifest.hash_text(data)
+    if os.linesep != '\n':
+        data = data.replace(b'\n', os.linesep.encode('ascii'))
+
+    with instrumentation.timer('file.write'):
+        with open(temp_file_name, "wb") as file:
+            file.write(data)
+            if sync:
+                file.flush()
+                os.fsync(file.fileno())
+
+    return text_hash
+
+# Function sync_files
+# Input - file_names - list of absolute paths of files that were written without sync
+# Purpose:
+#   Makes sure the contents of the files are on disk before they replace the old files. On Linux a single sync call
+#   writes all of them, and waits until they are written. Other systems don't wait for sync, there every file is
+#   synced on its own
+def sync_files(file_names):
+    if len(file_names) == 0:
+        return
+
+    with instrumentation.timer('file.sync'):
+        if sys.platform.startswith('linux'):
+            os.sync()
+            return
+
+        for file_name in file_names:
+            file_fd = os.open(file_name, os.O_RDWR)
+            try:
+                os.fsync(file_fd)
+            finally:
+                os.close(file_fd)
+
+# Function sync_directories
+# Input - directories - list of absolute paths of folders
+# Purpose:
+#   Makes sure the new names of the replaced files are stored on disk. Windows can't sync folders, it is skipped there
+def sync_directories(directories):
+    if not hasattr(os, 'O_DIRECTORY'):
+        return
+
+    for directory in directories:
+        directory_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(directory_fd)
+        finally:
+            os.close(directory_fd)
+
+# Function write_file_atomically
+# Input
+#   file_name - absolute path of the file
+#   data - the content of the file (see encode_text)
+#   sync - if True, the file and its folder are synced to disk
+# Output - the sha256 hash of data
+# Purpose:
+#   Writes a single file right away, without ever leaving a half written file
+def write_file_atomically(file_name, data, sync=True):
+    temp_file_name = get_temp_file_name(file_name)
+    text_hash = write_temp_file(temp_file_name, data, sync=sync)
+    os.replace(temp_file_name, file_name)
+    if sync:
+        sync_directories([os.path.dirname(file_name)])
+    return text_hash
+
+# Class FileWriter
+# Input
+#   workers - number of threads writing the temporary files. With 0, they are written in the calling thread
+#   sync - if True, all files are synced to disk before they replace the old files
+#   queue_size - maximum number of files waiting to be written. write waits if there are more, so the contents of
+#                thousands of files are never in memory at the same time
+#   replace_batch_size - if given, the files replace the old files as soon as this many files were written, otherwise
+#                        only on commit
+# Purpose:
+#   Collects the files of a run and replaces the old files in batches (see Background above)
+class FileWriter:
+    def __init__(self, workers=4, sync=True, queue_size=64, replace_batch_size=None):
+        self.sync = sync
+        self.replace_batch_size = replace_batch_size
+        self.executor = ThreadPoolExecutor(max_workers=workers) if workers > 0 else None
+        self.slots = threading.BoundedSemaphore(queue_size)
+        self.pending = []  # (file_name, temp_file_name, future or sha256 hash, manifest), in the order of writing
+
+    # Function write
+    # Input
+    #   file_name - absolute path of the file
+    #   data - the content of the file (see encode_text)
+    #   generated_files - optional Manifest, the file is recorded in it when it is replaced
+    def write(self, file_name, data, generated_files=None):
+        temp_file_name = get_temp_file_name(file_name)
+
+        if self.executor is None:
+            self.pending.append((file_name, temp_file_name, write_temp_file(temp_file_name, data), generated_files))
+        else:
+            self.slots.acquire()
+            try:
+                future = self.executor.submit(self.write_in_background, temp_file_name, data)
+            except Exception:
+                self.slots.release()
+                raise
+            self.pending.append((file_name, temp_file_name, future, generated_files))
+
+        if self.replace_batch_size is not None and len(self.pending) >= self.replace_batch_size:
+            self.commit()
+
+    def write_in_background(self, temp_file_name, data):
+        try:
+            return write_temp_file(temp_file_name, data)
+        finally:
+            self.slots.release()
+
+    # Function add_temp_file
+    # Input
+    #   file_name - absolute path of a file whose temporary file was written by another process
+    #   temp_file_name - absolute path of the temporary file
+    #   text_hash - the sha256 hash of its content
+    #   generated_files - optional Manifest, the file is recorded in it when it is replaced
+    def add_temp_file(self, file_name, temp_file_name, text_hash, generated_files=None):
+        self.pending.append((file_name, temp_file_name, text_hash, generated_files))
+
+    # Function get_temp_files
+    # Output - list of (file_name, temp_file_name, sha256 hash) of all files written so far, used to hand them to
+    #          another writer
+    def get_temp_files(self):
+        return [(file_name, temp_file_name, self.get_hash(result))
+                for file_name, temp_file_name, result, generated_files in self.pending]
+
+    def get_hash(self, result):
+        if isinstance(result, str):
+            return result
+        return result.result()
+
+    # Function commit
+    # Purpose:
+    #   Waits until all temporary files are written, syncs them and replaces the old files with them. If one of the
+    #   files could not be written, no file of the batch is replaced, the temporary files are removed and the error is
+    #   raised. Batches that were replaced before (see replace_batch_size) stay replaced
+    def commit(self):
+        try:
+            hashes = [self.get_hash(result) for file_name, temp_file_name, result, generated_files in self.pending]
+        except Exception:
+            self.discard()
+            raise
+
+        if self.sync:
+            try:
+                sync_files([temp_file_name for file_name, temp_file_name, result, generated_files in self.pending])
+            except Exception:
+                self.discard()
+                raise
+
+        directories = set()
+        with instrumentation.timer('file.replace'):
+            # In the order of writing, so the last version of a file written twice is kept
+            for (file_name, temp_file_name, result, generated_files), text_hash in zip(self.pending, hashes):
+                os.replace(temp_file_name, file_name)
+                directories.add(os.path.dirname(file_name))
+                if generated_files is not None:
+                    generated_files.record_hash(file_name, text_hash)
+
+            if self.sync:
+                sync_directories(sorted(directories))
+
+        self.pending = []
+
+    # Function discard
+    # Purpose:
+    #   Removes the temporary files of all files that were not replaced yet, the old files stay as they are
+    def discard(self):
+        for file_name, temp_file_name, result, generated_files in self.pending:
+            if not isinstance(result, str):
+                try:
+                    result.result()
+                except Exception:
+                    pass
+            try:
+                os.remove(temp_file_name)
+            except FileNotFoundError:
+                pass
+
+        self.pending = []
+
+    # Function close
+    # Purpose:
+    #   Stops the threads. Files that were not committed are discarded
+    def close(self):
+        self.discard()
+        if self.executor is not None:
+            self.executor.shutdown()
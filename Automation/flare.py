@@ -1,19 +1,44 @@
 import os
 from bs4 import BeautifulSoup, NavigableString
+from lxml import etree
+import file_writer
+import instrumentation
 
 
 # Function insert_into_file
 # Input
 #   file_name - the absolute path of a file to be written
 #   text - the contents of the file
-# Output: None - the file is overwritten
+#   manifest - optional Manifest (see manifest.py) of the files generated by the last run
+#   writer - optional FileWriter (see file_writer.py). If given, the file is written in the background and only
+#            replaces the old file when the writer is committed
+# Output: True if the file was written, False if it already had this content
 # Purpose:
-#   This function overwrites the content of file_name with the string in text
-def insert_into_file(file_name, text):
-    with open(file_name, "w", encoding="utf-8") as file:
-        # The new line characters are replaced because Python and Flare use different characters. Not switching it causes
-        # Extra line breaks all over the place
-        file.write(str(text).replace('\r\n', '\n'))
+#   This function overwrites the content of file_name with the string in text, without ever leaving a half written
+#   file. If a manifest is given, files that already have the same content are not written again
+def insert_into_file(file_name, text, manifest=None, writer=None):
+    with instrumentation.timer('soup.serialize'):
+        data = file_writer.encode_text(text)
+
+    if manifest is not None and manifest.is_unchanged(file_name, data):
+        manifest.skipped += 1
+        instrumentation.count('files.unchanged')
+        return False
+
+    instrumentation.count('files.written')
+    instrumentation.count('files.bytes_written', len(data))
+
+    if writer is not None:
+        writer.write(file_name, data, manifest)
+    else:
+        text_hash = file_writer.write_file_atomically(file_name, data)
+        if manifest is not None:
+            manifest.record_hash(file_name, text_hash)
+
+    if manifest is not None:
+        manifest.written_files.append(file_name)
+
+    return True
 
 # Function check_if_file_exists
 # Input - file_name - absolute path of a file
@@ -27,21 +52,12 @@ def check_if_file_exists (file_name):
     else:
         return False
 
-# Function create_file
+# Function get_file_start_text
 # Input
-#   path_to_file - absolute path of a file to be created
-#   Title - The title of the file (h1)
-#   Description - text which is stored in the description metadata
-# Purpose
-#   This function will create the given file and then insert the string in file_start_text into that file using
-#   the insert_into_file function
-
-def create_file(path_to_file, type_of_file, title):
-    # Creates the file
-    f = open(path_to_file, "x")
-
-    # Define what starting text the file needs (defining the structure)
-
+#   type_of_file - either 'topic' or 'toc'
+#   title - The title of the file (h1)
+# Output - file_start_text - the text of a new, empty file (defining the structure)
+def get_file_start_text(type_of_file, title):
     if type_of_file == 'topic':
         file_start_text = f"""<?xml version="1.0" encoding="utf-8"?>
             <html xmlns:MadCap="http://www.madcapsoftware.com/Schemas/MadCap.xsd">
@@ -68,8 +84,7 @@ def create_file(path_to_file, type_of_file, title):
         </CatapultToc>
         """
 
-    # Insert this text into the newly-created file
-    insert_into_file(path_to_file,file_start_text)
+    return file_start_text
 
 # Function number_is_even
 # Input
@@ -99,16 +114,8 @@ def add_entry_to_toc(toc_soup_object, folder_name, topic_name):
     # Finds the object corresponding to 'CatapultToc' which is the top-level object in the TOC
     for entry in toc_soup_object.findAll('CatapultToc'):
 
-        # Define properties for the new object, like title and the link to the file
-        toc_props = {}
-        toc_props['Title'] = f'{topic_name}'
-        toc_props['Link'] = f'/Content/{folder_name}/{topic_name}.htm'
-
-        # Create new TocEntry tag with the above properties
-        new_toc_entry = toc_soup_object.new_tag('TocEntry', **toc_props)
-
-        # Add the new tag at the end of the 'CatapultToc' tag
-        entry.append(new_toc_entry)
+        # Add the new TocEntry tag at the end of the 'CatapultToc' tag
+        entry.append(create_toc_entry(toc_soup_object, folder_name, topic_name))
     return toc_soup_object
 
 # Function create_table
@@ -302,20 +309,14 @@ def create_conditional_text(conditions, text):
 #   file_name - absolute path of the TOC file
 # output - toc_soup - a soup object containing the empty TOC
 # Purpose
-#   This script will check if a file exists. If it doesn't, then it will create the TOC file. After,
-#   it will store the file into a soup object and clear everything in the 'CatapultToc' tag. It should be empty after.
-#   This is then stored into the file and the soup object is returned
+#   This script will check if a file exists. If it doesn't, the empty TOC is used. Otherwise it will store the
+#   file without the entries (see read_skeleton) into a soup object and clear everything in the 'CatapultToc' tag.
+#   It should be empty after. The soup object is returned. The file itself is only written once all entries are added
 def initialize_toc(file_name):
-    if not check_if_file_exists(file_name):
-        create_file(file_name, 'toc', '')
-
-    with open(file_name, encoding="utf-8-sig") as toc:
-        toc_soup = BeautifulSoup(toc, "xml")
+    toc_soup = parse_skeleton(file_name, get_file_start_text('toc', ''), lambda element: etree.QName(element).localname == 'CatapultToc')
 
     toc_soup.find('CatapultToc').clear()
 
-    insert_into_file(file_name, toc_soup)
-
     return toc_soup
 
 # Function make_readable_text
@@ -351,15 +352,87 @@ def get_value_from_metric(metric):
     else:
         return metric
 
+# Function initialize_topic
+# Input
+#   file_name - absolute path of the topic
+#   title - the title of the topic (h1), only used if the topic doesn't exist yet
+# Output - topic_soup - a soup object containing the empty topic
+# Purpose
+#   Reads the topic (or uses a new one if it doesn't exist) and then clears it (see clear_topic).
+#   The head and the weather divs are already left out when the file is read, so they are never parsed
 def initialize_topic(file_name, title):
-    if not check_if_file_exists(file_name):
-        create_file(file_name, 'topic', title)
-
+    topic_soup = parse_skeleton(file_name, get_file_start_text('topic', title), is_cleared_in_topic)
 
+    return clear_topic(topic_soup)
 
-    with open(file_name, encoding="utf-8-sig") as topic:
-        topic_soup = BeautifulSoup(topic, "xml")
+# Function is_cleared_in_topic
+# Input - element - lxml element of a topic
+# Output - True for the elements cleared by clear_topic: the head and the weather divs
+def is_cleared_in_topic(element):
+    tag = etree.QName(element).localname
+    if tag == 'head':
+        return True
+    return tag == 'div' and element.get('id') in ('current', 'forecast_hourly', 'forecast_daily')
 
+# Function read_skeleton
+# Input
+#   file_name - absolute path of an existing file
+#   is_cleared - function which gets an lxml element and returns True if its content is not needed
+# Output - the file as bytes, with the cleared elements empty (their attributes are kept)
+# Purpose
+#   The content of the generated parts (e.g. the weather tables of a topic) is most of the file and is thrown away
+#   anyway. The file is read with lxml iterparse, which is much faster than BeautifulSoup, and every element inside a
+#   cleared element is removed as soon as it was read, so only the skeleton of the file is kept in memory.
+#   Raises etree.XMLSyntaxError if the file is not well-formed XML
+def read_skeleton(file_name, is_cleared):
+    cleared = []
+    events = etree.iterparse(file_name, events=('start', 'end'), remove_comments=False, resolve_entities=False,
+                             huge_tree=True)
+    for event, element in events:
+        if event == 'start':
+            if is_cleared(element):
+                cleared.append(element)
+        elif len(cleared) > 0 and element is cleared[-1]:
+            # Comments and processing instructions are not reported by iterparse, they are removed here
+            element.text = None
+            for child in list(element):
+                element.remove(child)
+            cleared.pop()
+        elif len(cleared) > 0 and element.getparent() is cleared[-1]:
+            cleared[-1].remove(element)
+
+    return etree.tostring(events.root.getroottree(), encoding='utf-8')
+
+# Function parse_skeleton
+# Input
+#   file_name - absolute path of the file
+#   start_text - the text of a new file, used if the file doesn't exist (see get_file_start_text)
+#   is_cleared - see read_skeleton
+# Output - soup object with the file, the cleared elements are empty
+# Purpose
+#   New files are not written and read again, their start text is parsed straight away. Existing files are read
+#   with read_skeleton. If lxml can't read the file, the whole file is parsed with BeautifulSoup, which also accepts
+#   broken XML
+def parse_skeleton(file_name, start_text, is_cleared):
+    if start_text is not None and not check_if_file_exists(file_name):
+        with instrumentation.timer('soup.parse'):
+            return BeautifulSoup(start_text, "xml")
+
+    try:
+        with instrumentation.timer('skeleton.read'):
+            skeleton = read_skeleton(file_name, is_cleared)
+    except etree.XMLSyntaxError:
+        with open(file_name, encoding="utf-8-sig") as file:
+            with instrumentation.timer('soup.parse'):
+                return BeautifulSoup(file, "xml")
+
+    with instrumentation.timer('soup.parse'):
+        return BeautifulSoup(skeleton, "xml")
+
+# Function clear_topic
+# Input - topic_soup - soup object containing a topic
+# Output - topic_soup - the same soup object, with the head and the weather divs cleared
+def clear_topic(topic_soup):
     # Clear content from the head tag in the topic
     header = topic_soup.find('head')
     header.clear()
@@ -385,9 +458,11 @@ def initialize_topic(file_name, title):
 
     return topic_soup
 
+# Function initialize_snippet
+# Input - file_name - absolute path of the snippet file, which must exist
+# Output - snippet_soup - a soup object containing the snippet with an empty list in the body
 def initialize_snippet(file_name):
-    with open(file_name, encoding="utf-8-sig") as snippet:
-        snippet_soup = BeautifulSoup(snippet, "xml")
+    snippet_soup = parse_skeleton(file_name, None, lambda element: etree.QName(element).localname == 'body')
 
     body = snippet_soup.find('body')
     body.clear()
@@ -397,13 +472,18 @@ def initialize_snippet(file_name):
 
     return snippet_soup
 
-def update_current_weather(soup_object, weather_data):
-
+# Function update_current_weather
+# Input
+#   soup_object - soup object of the topic (see initialize_topic)
+#   forecast - the records.Forecast returned by api.get_weather_data
+# Output - soup_object - the same soup object with the current weather in div#current
+def update_current_weather(soup_object, forecast):
+    current = forecast.current
     current_weather = soup_object.find('div', id='current')
 
     # Add time information
     p_tag_1 = soup_object.new_tag('p')
-    p_tag_1.string = f"As of {weather_data[0]['time']} local time, the current weather is:"
+    p_tag_1.string = f"As of {current.time_text} local time, the current weather is:"
     current_weather.append(p_tag_1)
 
     # Add temp and pictures
@@ -411,12 +491,12 @@ def update_current_weather(soup_object, weather_data):
     p_tag_2['class'] = 'weather'
 
     # Add temperature with conditional text
-    for unit,temp in weather_data[0]['temp'].items():
+    for unit,temp in current.temp_text.items():
         p_tag_2.append(create_conditional_text(f"Units.{unit}", temp))
 
     # Add weather icon
     img_tag = soup_object.new_tag('img')
-    img_tag['src'] = f"../Resources/Images/weather_icons/{weather_data[0]['weather_conditions'][0]['icon']}.png"
+    img_tag['src'] = f"../Resources/Images/weather_icons/{current.icon}.png"
     img_tag['class'] = "icon_big"
     p_tag_2.append(img_tag)
 
@@ -425,10 +505,9 @@ def update_current_weather(soup_object, weather_data):
     # Add table with weather data
     table = create_table('Metric', 'Value')
     counter = 1
-    for metric, value in weather_data[0].items():
-        if metric != 'time':
-            table = insert_row_into_table(table, number_is_even(counter), make_readable_text(metric), get_value_from_metric(value))
-            counter += 1
+    for name, value in current.get_table_rows():
+        table = insert_row_into_table(table, number_is_even(counter), name, get_value_from_metric(value))
+        counter += 1
 
     current_weather.append(table)
 
@@ -438,56 +517,177 @@ def update_current_weather(soup_object, weather_data):
     current_weather.append(p_tag_3)
 
     # Add code snippet
-    current_weather.append(create_code_snippet(weather_data[3],''))
+    current_weather.append(create_code_snippet(forecast.alert,''))
 
     return soup_object
 
-def update_hourly_forecast(soup_object, weather_data):
+# Function update_hourly_forecast
+# Input
+#   soup_object - soup object of the topic (see initialize_topic)
+#   forecast - the records.Forecast returned by api.get_weather_data
+# Output - soup_object - the same soup object with the table of the next hours in div#forecast_hourly
+def update_hourly_forecast(soup_object, forecast):
 
     hourly_forecast = soup_object.find('div', id='forecast_hourly')
 
     table = create_table('Time', 'Weather', 'Temperature', 'Chance of Rain')
     counter = 1
-    for time in weather_data[1]:
-        table = insert_row_into_table(table, number_is_even(counter), time['time'], get_value_from_metric(time['weather_conditions']), get_value_from_metric(time['temp']), time['chance_of_rain'])
+    for hour in forecast.hourly:
+        table = insert_row_into_table(table, number_is_even(counter), hour.time_text, get_value_from_metric(hour.description), get_value_from_metric(hour.temp_text), hour.chance_of_rain_text)
         counter += 1
 
     hourly_forecast.append(table)
 
     return soup_object
 
-
-def update_daily_forecast(soup_object, weather_data):
+# Function update_daily_forecast
+# Input
+#   soup_object - soup object of the topic (see initialize_topic)
+#   forecast - the records.Forecast returned by api.get_weather_data
+# Output - soup_object - the same soup object with the table of the next days in div#forecast_daily
+def update_daily_forecast(soup_object, forecast):
     daily_forecast = soup_object.find('div', id='forecast_daily')
 
     table = create_table('Time', 'Weather', 'Min Temp', 'Max Temp', 'Chance of Rain')
     counter = 1
-    for time in weather_data[2]:
-        table = insert_row_into_table(table, number_is_even(counter), time['time'],
-                                      get_value_from_metric(time['weather_conditions']),
-                                      get_value_from_metric(time['min temp']), get_value_from_metric(time['max temp']), time['chance_of_rain'])
+    for day in forecast.daily:
+        table = insert_row_into_table(table, number_is_even(counter), day.time_text,
+                                      get_value_from_metric(day.description),
+                                      get_value_from_metric(day.min_temp_text), get_value_from_metric(day.max_temp_text), day.chance_of_rain_text)
         counter += 1
 
     daily_forecast.append(table)
 
     return soup_object
 
+# Function update_topic
+# Input
+#   file_name - absolute path of the topic
+#   title - the title of the topic (h1), only used if the topic doesn't exist yet
+#   forecast - the records.Forecast returned by api.get_weather_data
+# Output - soup object of the topic with the new weather. Everything outside the head and the weather divs is kept as
+#          it is in the file
+def update_topic(file_name, title, forecast):
+    topic = initialize_topic(file_name, title)
+    topic = update_current_weather(topic, forecast)
+    topic = update_hourly_forecast(topic, forecast)
+    return update_daily_forecast(topic, forecast)
+
 def add_entry_to_snippet_list(soup_object, folder, topic_name):
     list = soup_object.find('ul')
 
+    list.append(create_snippet_list_item(soup_object, folder, topic_name))
+
+    return soup_object
+
+# Function create_snippet_list_item
+# Input
+#   soup_object - soup object of the snippet
+#   folder - the folder of the topic in the Content folder
+#   topic_name - the name of the topic (also serves as the text of the link)
+#   file_name - optional name of the topic file without .htm, if it is not the topic_name
+#   conditions - optional condition tags of the list item, e.g. 'Units.Metric'
+# Output - list_item - new li tag with a cross reference to the topic
+def create_snippet_list_item(soup_object, folder, topic_name, file_name=None, conditions=None):
     list_item = soup_object.new_tag('li')
+    if conditions is not None:
+        list_item['MadCap:conditions'] = conditions
 
     p_tag = soup_object.new_tag('p')
-    p_tag.append(cross_reference(f'../../{folder}/{topic_name}.htm', topic_name))
+    p_tag.append(cross_reference(f'../../{folder}/{file_name or topic_name}.htm', topic_name))
 
     list_item.append(p_tag)
 
-    list.append(list_item)
-
-    return soup_object
-
-
+    return list_item
 
+# Function create_toc_entry
+# Input
+#   toc_soup_object - soup object of the TOC
+#   folder_name - the folder of the topic in the Content folder
+#   topic_name - the name of the topic (also serves as the title)
+#   file_name - optional name of the topic file without .htm, if it is not the topic_name
+#   conditions - optional condition tags of the entry, e.g. 'Units.Metric'
+# Output - new TocEntry tag linking to the topic
+def create_toc_entry(toc_soup_object, folder_name, topic_name, file_name=None, conditions=None):
+    toc_props = {}
+    toc_props['Title'] = f'{topic_name}'
+    toc_props['Link'] = f'/Content/{folder_name}/{file_name or topic_name}.htm'
+    if conditions is not None:
+        toc_props['conditions'] = conditions
+
+    return toc_soup_object.new_tag('TocEntry', **toc_props)
+
+# Function group_entries
+# Input
+#   entries - list of dicts with the title and folder of every topic, and optionally a group (e.g. the country)
+#   sort - if True, the groups and the topics in every group are sorted by name
+# Output - list of (group, entries) in the order the groups first appear. The group is None for entries without one
+def group_entries(entries, sort=False):
+    groups = {}
+    for entry in entries:
+        groups.setdefault(entry.get('group'), []).append(entry)
+
+    grouped_entries = list(groups.items())
+    if sort:
+        grouped_entries.sort(key=lambda group: '' if group[0] is None else group[0])
+        for group, group_entries_list in grouped_entries:
+            group_entries_list.sort(key=lambda entry: entry['title'])
+
+    return grouped_entries
+
+# Function build_toc
+# Input
+#   file_name - absolute path of the TOC file
+#   entries - list of dicts with the title and folder of every topic, and optionally a group (e.g. the country), the
+#             name of the file and the conditions (see create_toc_entry)
+#   sort - if True, the groups and the topics in every group are sorted by name
+# Output - toc_soup - soup object with the complete TOC
+# Purpose
+#   Builds the whole TOC in one pass. The CatapultToc tag is only searched once instead of once per entry.
+#   Entries with a group are put into a TocEntry (without link) with the name of the group
+def build_toc(file_name, entries, sort=False):
+    toc_soup = initialize_toc(file_name)
+    catapult_toc = toc_soup.find('CatapultToc')
+
+    for group, group_entries_list in group_entries(entries, sort):
+        parent = catapult_toc
+        if group is not None:
+            parent = toc_soup.new_tag('TocEntry', Title=f'{group}')
+            catapult_toc.append(parent)
+
+        for entry in group_entries_list:
+            parent.append(create_toc_entry(toc_soup, entry['folder'], entry['title'], entry.get('file'),
+                                           entry.get('conditions')))
 
+    return toc_soup
 
+# Function build_snippet
+# Input
+#   file_name - absolute path of the snippet file
+#   entries - list of dicts with the title and folder of every topic, and optionally a group (e.g. the country), the
+#             name of the file and the conditions (see create_snippet_list_item)
+#   sort - if True, the groups and the topics in every group are sorted by name
+# Output - snippet_soup - soup object with the complete snippet
+# Purpose
+#   Builds the whole list of the snippet in one pass. The ul tag is only searched once instead of once per entry.
+#   Entries with a group are put into a nested list below the name of the group
+def build_snippet(file_name, entries, sort=False):
+    snippet_soup = initialize_snippet(file_name)
+    list = snippet_soup.find('ul')
+
+    for group, group_entries_list in group_entries(entries, sort):
+        parent = list
+        if group is not None:
+            group_item = snippet_soup.new_tag('li')
+            group_name = snippet_soup.new_tag('p')
+            group_name.string = f'{group}'
+            group_item.append(group_name)
+            parent = snippet_soup.new_tag('ul')
+            group_item.append(parent)
+            list.append(group_item)
+
+        for entry in group_entries_list:
+            parent.append(create_snippet_list_item(snippet_soup, entry['folder'], entry['title'], entry.get('file'),
+                                                   entry.get('conditions')))
 
+    return snippet_soup
@@ -0,0 +1,222 @@
+import sqlite3
+import json
+import time
+import zlib
+import records
+
+# ================================================
+# Purpose: Keeps the forecasts of every run on disk, so topics can be rendered without calling the APIs
+# Background:
+#   The forecasts used to be thrown away once the topics were written. Rendering again (e.g. after changing a
+#   template), history or trend pages needed new API calls.
+#   Every run adds the forecast of every city to a SQLite database: the Forecast record (see records.py) as JSON,
+#   together with the continent and country of the city and the time of the run (fetched_at), and the One Call
+#   response as returned by the API (raw, see main.store_raw_responses). The response is compressed with zlib (see
+#   pack_response), which makes it about 7 times smaller. All cities of a run are inserted at once with executemany in
+#   one transaction.
+#   The table is indexed by city and time, so the forecasts of one run and the history of one city are read without
+#   going through the whole table.
+#   get_forecasts returns the cities in the same format as main.fetch, so the renderers can use them directly.
+#   A run with --shard (see shards.py) only fetches the cities of its shard, at its own time. Every row therefore has
+#   the shard of its run (shard_index and shard_count, NULL without shards), and the last forecasts of all cities are
+#   the last run of every shard (see get_last_runs).
+#   Old runs are removed with delete_before, and limit_size removes the oldest runs until the data fits into a maximum
+#   size, otherwise the file grows with every run. The last run of every shard is always kept. The file uses incremental auto vacuum, so the space of the removed
+#   runs is given back to the file system right away, without rewriting the whole file with VACUUM on every run.
+# =================================================
+
+# Value of PRAGMA auto_vacuum for incremental auto vacuum
+incremental_auto_vacuum = 2
+
+# Function pack_response
+# Input - response - the One Call response (already converted from JSON)
+# Output - the response as compact JSON, compressed with zlib. Stored in the raw column
+def pack_response(response):
+    return zlib.compress(json.dumps(response, separators=(',', ':')).encode('utf-8'))
+
+# Function unpack_response
+# Input - raw - the raw column of a forecast. Files of older versions have the JSON text without compression
+# Output - the One Call response
+def unpack_response(raw):
+    if isinstance(raw, bytes):
+        raw = zlib.decompress(raw).decode('utf-8')
+    return json.loads(raw)
+
+# Class ForecastStore
+# Input - file_name - absolute path of the SQLite file. It is created if it doesn't exist
+# Purpose:
+#   Stores and reads the forecasts of all runs
+class ForecastStore:
+    def __init__(self, file_name):
+        self.connection = sqlite3.connect(file_name)
+
+        # Only possible before the first table is created. Files of older versions are changed once with VACUUM
+        if self.connection.execute("PRAGMA auto_vacuum").fetchone()[0] != incremental_auto_vacuum:
+            self.connection.execute(f"PRAGMA auto_vacuum = {incremental_auto_vacuum}")
+            self.connection.execute("VACUUM")
+
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS forecasts (
+                                       city TEXT,
+                                       fetched_at REAL,
+                                       folder TEXT,
+                                       country TEXT,
+                                       raw BLOB,
+                                       forecast TEXT,
+                                       shard_index INTEGER,
+                                       shard_count INTEGER)""")
+
+        # Files of older versions don't have the shards yet, their runs had no shards
+        columns = [row[1] for row in self.connection.execute("PRAGMA table_info(forecasts)")]
+        for column in ['shard_index', 'shard_count']:
+            if column not in columns:
+                self.connection.execute(f"ALTER TABLE forecasts ADD COLUMN {column} INTEGER")
+
+        self.connection.execute("CREATE INDEX IF NOT EXISTS forecasts_city ON forecasts (city, fetched_at)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS forecasts_fetched_at ON forecasts (fetched_at)")
+        self.connection.commit()
+
+    # Function add_forecasts
+    # Input
+    #   city_forecasts - list of dicts with title, folder, group and forecast (see main.fetch)
+    #   responses - list of the One Call responses, in the same order, either as returned by the API or already
+    #               packed (see pack_response). None if only the forecasts are stored
+    #   fetched_at - time of the run (epoch time). If None, the current time
+    #   shard - (index, count) of the run, None if the run has all cities
+    # Output - fetched_at
+    def add_forecasts(self, city_forecasts, responses=None, fetched_at=None, shard=None):
+        if fetched_at is None:
+            fetched_at = time.time()
+        if responses is None:
+            responses = [None] * len(city_forecasts)
+
+        shard_index, shard_count = shard if shard is not None else (None, None)
+        rows = [(city['title'], fetched_at, city['folder'], city.get('group'),
+                 response if response is None or isinstance(response, bytes) else pack_response(response),
+                 json.dumps(city['forecast'].to_dict(), separators=(',', ':')), shard_index, shard_count)
+                for city, response in zip(city_forecasts, responses)]
+
+        with self.connection:
+            self.connection.executemany("INSERT INTO forecasts (city, fetched_at, folder, country, raw, forecast, "
+                                        "shard_index, shard_count) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+        return fetched_at
+
+    # Function get_fetch_times
+    # Output - list of the times of all runs in the store, oldest first
+    def get_fetch_times(self):
+        return [row[0] for row in self.connection.execute("SELECT DISTINCT fetched_at FROM forecasts ORDER BY 1")]
+
+    # Function get_last_runs
+    # Output - list of the times of the last run of every shard. The shards are the ones of the newest run: if it had
+    #          no shards, only its time, otherwise the last run of every shard with the same number of shards
+    def get_last_runs(self):
+        row = self.connection.execute("SELECT shard_count FROM forecasts ORDER BY fetched_at DESC LIMIT 1").fetchone()
+        if row is None:
+            return []
+
+        return [last_run[0] for last_run in
+                self.connection.execute("SELECT MAX(fetched_at) FROM forecasts WHERE shard_count IS ? "
+                                        "GROUP BY shard_index ORDER BY 1", (row[0],))]
+
+    # Function get_forecasts
+    # Input - fetched_at - time of the run, as returned by get_fetch_times. If None, the last run of every shard (see
+    #                      get_last_runs)
+    # Output - list of dicts with title, folder, group and forecast (a records.Forecast), sorted by title. Same format
+    #          and order as main.fetch
+    def get_forecasts(self, fetched_at=None):
+        fetch_times = [fetched_at] if fetched_at is not None else self.get_last_runs()
+
+        city_forecasts = []
+        for run_fetched_at in fetch_times:
+            rows = self.connection.execute("SELECT city, folder, country, forecast FROM forecasts "
+                                           "WHERE fetched_at = ? ORDER BY city, rowid", (run_fetched_at,))
+            city_forecasts.extend({'title': city,
+                                   'folder': folder,
+                                   'group': country,
+                                   'forecast': records.Forecast.from_dict(json.loads(forecast))}
+                                  for city, folder, country, forecast in rows)
+
+        # Every city is only in one shard, the order within a run stays as it is
+        city_forecasts.sort(key=lambda city: city['title'])
+        return city_forecasts
+
+    # Function get_history
+    # Input
+    #   city - the title of the city
+    #   since - optional epoch time, older runs are left out
+    # Output - list of (fetched_at, records.Forecast) of the city, oldest first
+    def get_history(self, city, since=None):
+        rows = self.connection.execute("SELECT fetched_at, forecast FROM forecasts "
+                                       "WHERE city = ? AND fetched_at >= ? ORDER BY fetched_at",
+                                       (city, since if since is not None else 0))
+        return [(fetched_at, records.Forecast.from_dict(json.loads(forecast))) for fetched_at, forecast in rows]
+
+    # Function get_response
+    # Input
+    #   city - the title of the city
+    #   fetched_at - time of the run
+    # Output - the One Call response of the city in that run, None if it was not stored
+    def get_response(self, city, fetched_at):
+        row = self.connection.execute("SELECT raw FROM forecasts WHERE city = ? AND fetched_at = ?",
+                                      (city, fetched_at)).fetchone()
+        if row is None or row[0] is None:
+            return None
+        return unpack_response(row[0])
+
+    # Function delete_before
+    # Input - fetched_at - epoch time
+    # Output - the number of forecasts deleted
+    # Purpose:
+    #   Removes all runs older than fetched_at and gives their space back to the file system
+    def delete_before(self, fetched_at):
+        return self.delete_where("fetched_at < ?", fetched_at)
+
+    # Function delete_run
+    # Input - fetched_at - time of the run
+    # Output - the number of forecasts deleted
+    def delete_run(self, fetched_at):
+        return self.delete_where("fetched_at = ?", fetched_at)
+
+    # Function delete_where
+    # Input
+    #   condition - SQL condition on fetched_at, with a placeholder for the time
+    #   fetched_at - epoch time
+    # Output - the number of forecasts deleted
+    # Purpose:
+    #   Removes the forecasts and gives their space back to the file system
+    def delete_where(self, condition, fetched_at):
+        with self.connection:
+            deleted = self.connection.execute(f"DELETE FROM forecasts WHERE {condition}", (fetched_at,)).rowcount
+
+        # execute only runs the first step of the pragma, which frees a single page. executescript runs all of them
+        if deleted > 0:
+            self.connection.executescript("PRAGMA incremental_vacuum;")
+        return deleted
+
+    # Function get_size
+    # Output - the size of the data in the file in bytes, without the free pages
+    def get_size(self):
+        page_count = self.connection.execute("PRAGMA page_count").fetchone()[0]
+        free_pages = self.connection.execute("PRAGMA freelist_count").fetchone()[0]
+        page_size = self.connection.execute("PRAGMA page_size").fetchone()[0]
+        return (page_count - free_pages) * page_size
+
+    # Function limit_size
+    # Input - max_size - maximum size of the data in bytes
+    # Output - the number of forecasts deleted
+    # Purpose:
+    #   Removes the oldest runs until the data is not bigger than max_size. The last run of every shard is always kept
+    #   (see get_last_runs)
+    def limit_size(self, max_size):
+        last_runs = set(self.get_last_runs())
+        fetch_times = [fetched_at for fetched_at in self.get_fetch_times() if fetched_at not in last_runs]
+
+        deleted = 0
+        for fetched_at in fetch_times:
+            if self.get_size() <= max_size:
+                break
+            deleted += self.delete_run(fetched_at)
+        return deleted
+
+    def close(self):
+        self.connection.close()
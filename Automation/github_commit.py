@@ -4,6 +4,10 @@ import sys, getopt
 import requests
 import glob, os
 import getpass
+import tempfile
+import layout
+import main
+import manifest
 import api_secrets
 
 # ================================================
@@ -17,8 +21,8 @@ import api_secrets
 # =================================================
 
 # Variables to be defined
-# gets the absolute path of the current file and goes one directory up to be at the top level
-root_dir = os.path.realpath(os.path.join(os.path.dirname(__file__), '..')) 
+# the top level folder of the repository (see layout.py)
+root_dir = layout.project.root_dir
 github_repo = 'github.com/nconforti93/madcap-python-example/'
 
 # Function safe_exit
@@ -32,20 +36,103 @@ github_repo = 'github.com/nconforti93/madcap-python-example/'
 #   the error.txt file exists. If it does, it will delete the file and then return an error.
 #   this way, the error is propagated to Jenkins and pipeline execution is shown as failed
 def safe_exit(message):
-    f = open(f"{root_dir}\Automation\error.txt", "x")
+    f = open(layout.project.automation_dir / 'error.txt', "x")
     sys.exit(message)
 
+# Function write_paths
+# input:
+#   paths - list of paths relative to root_dir
+#   separator - bytes between the paths, NUL for --pathspec-file-nul
+# output: temporary file with the paths, to be passed to git as stdin
+def write_paths(paths, separator=b'\0'):
+    path_file = tempfile.TemporaryFile()
+    path_file.write(separator.join(path.encode('utf-8') for path in paths))
+    path_file.seek(0)
+    return path_file
+
+# Function get_head_blobs
+# input:
+#   repo - the Repo
+#   paths - list of paths relative to root_dir
+# output: dict with the blob hash in HEAD of every path that exists in HEAD
+# purpose:
+#   Looks up exactly the given paths in HEAD, so the time grows with the number of written files, not with the size of
+#   the repository. git ls-tree can only take the paths as arguments, which gets too long for thousands of files, so
+#   the paths are sent to git cat-file on stdin instead, one "HEAD:<path>" per line
+def get_head_blobs(repo, paths):
+    if not repo.head.is_valid():
+        return {}
+
+    with write_paths([f'HEAD:{path}' for path in paths], b'\n') as path_file:
+        lines = repo.git.cat_file('--batch-check', istream=path_file).split('\n')
+
+    # One line per path, in the same order: "<hash> <type> <size>", or "HEAD:<path> missing" for new files
+    head_blobs = {}
+    for path, line in zip(paths, lines):
+        if not line.endswith(' missing'):
+            head_blobs[path] = line.split()[0]
+    return head_blobs
+
+# Function get_changed_files
+# input:
+#   repo - the Repo
+#   paths - list of paths relative to root_dir, normally the files written by main.py (see manifest.py)
+# output: the paths whose content is different from HEAD, including new files
+# purpose:
+#   Hashes the files with git hash-object, which applies the same filters as git add (e.g. line endings), and
+#   compares the hashes with the blobs in HEAD. Files that were written with the same content are not changed
+def get_changed_files(repo, paths):
+    paths = [path for path in paths if os.path.isfile(os.path.join(root_dir, path))]
+    if len(paths) == 0:
+        return []
+
+    # hash-object reads one path per line and prints one hash per line, in the same order
+    with write_paths(paths, b'\n') as path_file:
+        blobs = repo.git.hash_object('--stdin-paths', istream=path_file).split('\n')
+
+    head_blobs = get_head_blobs(repo, paths)
+    return [path for path, blob in zip(paths, blobs) if head_blobs.get(path) != blob]
+
+# Function get_push_remote
+# input: repo - the Repo
+# output: the origin remote, with the user and token in its URL
+# purpose:
+#   The URL is only written to the git config if it changed, later runs reuse the remote as it is
+def get_push_remote(repo):
+    origin = repo.remote(name='origin')
+    push_url = f"https://{user}:{token}@{github_repo}"
+    if origin.url != push_url:
+        origin.set_url(new_url = push_url)
+    return origin
+
 # Function commit_to_github
-# input: None
-# output: None
+# input:
+#   written_files - optional list of the files written since the last commit, relative to root_dir. The files in the
+#                   lists saved by main.py (e.g. by the shards) are always committed as well
+#   dry_run - if True, the changed files are only printed, nothing is committed or pushed
+# output: the list of changed files (committed unless dry_run)
 # purpose:
-#   Compares files, sets some Git variables, and then commits and pushes any files that changed.
+#   Commits and pushes the files written by main.py since the last commit.
+#   The list of written files is kept next to the manifest of main.py (see manifest.py). Only these files are hashed,
+#   compared with HEAD and staged, so the time does not grow with the number of topics in the repository. If there is
+#   no list yet, all changes in the working tree are committed.
 #   Afterwards it creates a pull request from test to master
-def commit_to_github():
+def commit_to_github(written_files=None, dry_run=False):
     # Sets an instance of the GitHub repo
     repo = Repo(root_dir)
-    # Adds the list of any changed files into the changedFiles variable
-    changedFiles = [item.a_path for item in repo.index.diff(None)]
+
+    # Every list that is read is cleared after the commit, so all files in them must be part of this commit
+    stored_files, list_files = manifest.read_uncommitted_files(main.manifest_file)
+    if written_files is None:
+        written_files = stored_files
+    else:
+        written_files = sorted(set(written_files).union(stored_files))
+
+    if len(list_files) > 0:
+        changedFiles = get_changed_files(repo, written_files)
+    else:
+        # Adds the list of any changed files into the changedFiles variable, new files included
+        changedFiles = [item.a_path for item in repo.index.diff(None)] + repo.untracked_files
 
     # Proceed only if there are actually changedFiles present. Otherwise nothing to commit
     if len(changedFiles) > 0:
@@ -53,17 +140,27 @@ def commit_to_github():
             # Display in the Jenkins log all of the files that were modified.
             print(f"Changes made to {item}")
 
-        # Set git variables to show who is committing
+        if dry_run:
+            print(f"Dry run, {len(changedFiles)} changed files are not committed")
+            return changedFiles
 
-        # stage all changes
-        repo.git.add(all=True)
+        if len(list_files) > 0:
+            # stage and commit only the changed files. Anything else that is staged is not committed
+            literal_git = repo.git(literal_pathspecs=True)
+            with write_paths(changedFiles) as path_file:
+                literal_git.add('--pathspec-from-file=-', '--pathspec-file-nul', istream=path_file)
+                path_file.seek(0)
+                literal_git.commit('-m', "AUTOMATED - Updating weather info", '--pathspec-from-file=-',
+                                   '--pathspec-file-nul', istream=path_file)
+        else:
+            # stage all changes
+            repo.git.add(all=True)
 
-        # Commit the changes
-        repo.index.commit("AUTOMATED - Updating weather info")
+            # Commit the changes
+            repo.index.commit("AUTOMATED - Updating weather info")
 
         # Define what the remote repository is
-        origin = repo.remote(name='origin')
-        origin.set_url(new_url = f"https://{user}:{token}@{github_repo}")
+        get_push_remote(repo)
         print("Pushing changes to Github")
 
         # Push the changes to remote
@@ -85,6 +182,12 @@ def commit_to_github():
     else:
         print("No changes discovered, nothing to push to Github")
 
+    # The written files are in HEAD now, the next commit only needs to look at files written after this
+    if not dry_run:
+        manifest.clear_uncommitted_files(list_files)
+
+    return changedFiles
+
 # Function create_pull_request
 # input:
 #   project_name - base folder in Github storing the docs repo
@@ -98,6 +201,7 @@ def commit_to_github():
 # purpose:
 #   Uses the GitHub API to open a pull request
 #   If a pull request for the branches already exists, then a warning is simply displayed. It will not cause the script to exit with an error.
+#   Any other error raises a RuntimeError
 def create_pull_request(project_name, repo_name, title, description, head_branch, base_branch, git_token):
     """Creates the pull request for the head_branch against the base_branch"""
     git_pulls_api = "https://api.github.com/repos/{0}/{1}/pulls".format(
@@ -125,7 +229,7 @@ def create_pull_request(project_name, repo_name, title, description, head_branch
             print("WARNING: A pull request already exists for exasol:test. Skipping... ")
         else:
             # Some other error occurred, script should be aborted
-            safe_exit("Failed to create Pull Request: {0}".format(r.text))
+            raise RuntimeError("Failed to create Pull Request: {0}".format(r.text))
         
 if __name__ == '__main__':
 
@@ -0,0 +1,208 @@
+import os
+import io
+import json
+import time
+import inspect
+import functools
+import threading
+import contextlib
+
+# ================================================
+# Purpose: Timers and counters for the different stages of a run
+# Background:
+#   When a run is slow, we need to know if the API, parsing, rendering or the disk is to blame.
+#   Timers measure how often and how long something ran (e.g. every function of api.py and flare.py, see
+#   instrument_module), counters add up numbers (e.g. bytes received from the APIs or files written).
+#   Everything is a no-op until enabled is set to True, so the instrumentation costs nothing in a normal run.
+#   The results are sent to sinks: JsonLinesSink writes every measurement and the summary as JSON lines,
+#   PrometheusSink writes the summary in the Prometheus textfile format. profile runs a function with cProfile and
+#   tracemalloc and prints the hot spots.
+#   Timers and counters of the render processes (see render_pool.py) are not collected.
+# =================================================
+
+enabled = False
+sinks = []
+
+timers = {}  # name -> {'count': ..., 'total_seconds': ..., 'max_seconds': ...}
+counters = {}  # name -> value
+lock = threading.Lock()
+
+# Function record_time
+# Input
+#   name - name of the timer
+#   seconds - the measured time
+def record_time(name, seconds):
+    if not enabled:
+        return
+
+    with lock:
+        timer = timers.setdefault(name, {'count': 0, 'total_seconds': 0.0, 'max_seconds': 0.0})
+        timer['count'] += 1
+        timer['total_seconds'] += seconds
+        timer['max_seconds'] = max(timer['max_seconds'], seconds)
+        for sink in sinks:
+            sink.event({'type': 'timer', 'name': name, 'seconds': seconds})
+
+# Function count
+# Input
+#   name - name of the counter
+#   value - the value added to the counter
+def count(name, value=1):
+    if not enabled:
+        return
+
+    with lock:
+        counters[name] = counters.get(name, 0) + value
+        for sink in sinks:
+            sink.event({'type': 'counter', 'name': name, 'value': value})
+
+# Function timer
+# Input - name - name of the timer
+# Purpose:
+#   Measures the time of the code in a with statement:
+#       with instrumentation.timer('soup.parse'):
+#           ...
+@contextlib.contextmanager
+def timer(name):
+    if not enabled:
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_time(name, time.perf_counter() - start)
+
+# Function instrument_module
+# Input - module - a module like api or flare
+# Output: None - the functions of the module are replaced
+# Purpose:
+#   Wraps every public function defined in the module with a timer named module.function. Calls inside the module
+#   are measured as well, because they look up the function in the module
+def instrument_module(module):
+    for name, function in list(vars(module).items()):
+        if name.startswith('_') or not inspect.isfunction(function) or function.__module__ != module.__name__:
+            continue
+        if getattr(function, 'instrumented', False):
+            continue
+        setattr(module, name, wrap_function(f'{module.__name__}.{name}', function))
+
+def wrap_function(timer_name, function):
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if not enabled:
+            return function(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            record_time(timer_name, time.perf_counter() - start)
+
+    wrapper.instrumented = True
+    return wrapper
+
+# Function get_summary
+# Output - dict with all timers and counters
+def get_summary():
+    with lock:
+        return {'timers': {name: dict(timer) for name, timer in timers.items()},
+                'counters': dict(counters)}
+
+# Function report
+# Purpose:
+#   Prints all timers (slowest first) and counters, and hands the summary to all sinks
+def report():
+    if not enabled:
+        return
+
+    summary = get_summary()
+
+    print(f"{'Timer':<45}{'Calls':>10}{'Total (s)':>12}{'Max (ms)':>12}")
+    for name, timer in sorted(summary['timers'].items(), key=lambda item: item[1]['total_seconds'], reverse=True):
+        print(f"{name:<45}{timer['count']:>10}{timer['total_seconds']:>12.3f}{timer['max_seconds'] * 1000:>12.1f}")
+
+    for name, value in sorted(summary['counters'].items()):
+        print(f"{name:<45}{value:>10}")
+
+    for sink in sinks:
+        sink.close(summary)
+
+# Class JsonLinesSink
+# Input - file_name - the file the JSON lines are written to
+# Purpose:
+#   Writes every measurement as one JSON line, followed by a line with the summary at the end of the run
+class JsonLinesSink:
+    def __init__(self, file_name):
+        self.file = open(file_name, "w", encoding="utf-8")
+
+    def event(self, record):
+        record['time'] = time.time()
+        self.file.write(json.dumps(record) + '\n')
+
+    def close(self, summary):
+        self.file.write(json.dumps({'type': 'summary', 'time': time.time(), **summary}) + '\n')
+        self.file.close()
+
+# Class PrometheusSink
+# Input - file_name - the .prom file read by the textfile collector of the Prometheus node exporter
+# Purpose:
+#   Writes the summary in the Prometheus text format. The file is replaced at once, so the collector never reads a
+#   file that is only half written
+class PrometheusSink:
+    def __init__(self, file_name):
+        self.file_name = file_name
+
+    def event(self, record):
+        pass
+
+    def close(self, summary):
+        lines = ['# TYPE weather_stage_calls_total counter',
+                 '# TYPE weather_stage_seconds_total counter',
+                 '# TYPE weather_stage_max_seconds gauge']
+        for name, timer in sorted(summary['timers'].items()):
+            lines.append(f'weather_stage_calls_total{{stage="{name}"}} {timer["count"]}')
+            lines.append(f'weather_stage_seconds_total{{stage="{name}"}} {timer["total_seconds"]}')
+            lines.append(f'weather_stage_max_seconds{{stage="{name}"}} {timer["max_seconds"]}')
+
+        lines.append('# TYPE weather_counter_total counter')
+        for name, value in sorted(summary['counters'].items()):
+            lines.append(f'weather_counter_total{{name="{name}"}} {value}')
+
+        with open(self.file_name + '.tmp', "w", encoding="utf-8") as file:
+            file.write('\n'.join(lines) + '\n')
+        os.replace(self.file_name + '.tmp', self.file_name)
+
+# Function profile
+# Input
+#   function - the function to run (normally the whole run of main.py)
+#   output_file - the cProfile statistics are stored in this file (can be opened with pstats or snakeviz)
+#   number_of_lines - number of hot spots printed
+# Output - the result of function
+# Purpose:
+#   Runs the function with cProfile and tracemalloc and prints the functions that took the most time and the lines
+#   that allocated the most memory
+def profile(function, output_file, number_of_lines=25):
+    import cProfile
+    import pstats
+    import tracemalloc
+
+    profiler = cProfile.Profile()
+    tracemalloc.start()
+    try:
+        result = profiler.runcall(function)
+    finally:
+        snapshot = tracemalloc.take_snapshot()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        profiler.dump_stats(output_file)
+        stream = io.StringIO()
+        pstats.Stats(profiler, stream=stream).sort_stats('cumulative').print_stats(number_of_lines)
+        print(stream.getvalue())
+
+        print(f"Peak traced memory: {peak / 1024 / 1024:.1f} MB")
+        for statistic in snapshot.statistics('lineno')[:number_of_lines]:
+            print(statistic)
+
+    return result
@@ -0,0 +1,60 @@
+from pathlib import Path
+
+# ================================================
+# Purpose: The folders and files of the Flare project, in one place
+# Background:
+#   The paths used to be put together with '\\', which only works on Windows. On Linux this creates files with
+#   backslashes in their name instead of files in the folders. ProjectLayout builds all paths with pathlib, so they
+#   work on every system. All scripts use project, the layout of this repository, unless they are given another one
+#   (e.g. benchmark.py, which writes into a temporary folder).
+# =================================================
+
+# Function get_topic_name
+# Input
+#   title - the title of the topic, normally the name of the city
+#   unit - optional unit of the topic (see ProjectLayout.get_topic_file)
+# Output - the name of the topic file without .htm. The topics of the units are next to each other, e.g. Chicago_Metric,
+#          so the links to the resources stay the same
+def get_topic_name(title, unit=None):
+    if unit is None:
+        return title
+    return f'{title}_{unit}'
+
+# Class ProjectLayout
+# Input - root_dir - the top-level folder of the repository (the folder with Weather.flprj)
+# Purpose:
+#   Resolves the folders of the project once. The file names are returned as strings, same as the other functions
+#   expect
+class ProjectLayout:
+    def __init__(self, root_dir):
+        self.root_dir = Path(root_dir).resolve()
+        self.automation_dir = self.root_dir / 'Automation'
+        self.content_dir = self.root_dir / 'Content'  # Base folder of all topics
+        self.snippet_dir = self.content_dir / 'Resources' / 'Snippets'
+        self.toc_dir = self.root_dir / 'Project' / 'TOCs' / 'Generated_TOCs'  # Folder containing the generated TOCs
+
+    # Function get_topic_file
+    # Input
+    #   folder - the folder of the topic in the Content folder, normally the continent
+    #   title - the title of the topic, normally the name of the city
+    #   unit - optional unit of the topic, if one topic per unit is generated (see templates.render_topic_variants)
+    # Output - absolute path of the topic
+    def get_topic_file(self, folder, title, unit=None):
+        return str(self.content_dir / folder / f'{get_topic_name(title, unit)}.htm')
+
+    def get_toc_file(self, name):
+        return str(self.toc_dir / f'{name}.fltoc')
+
+    def get_snippet_file(self, name):
+        return str(self.snippet_dir / f'{name}.flsnp')
+
+    # Function create_folders
+    # Input - folders - names of the folders in the Content folder, normally the continents
+    # Purpose:
+    #   Creates all folders of the layout which don't exist yet
+    def create_folders(self, folders):
+        for directory in [self.snippet_dir, self.toc_dir] + [self.content_dir / folder for folder in folders]:
+            directory.mkdir(parents=True, exist_ok=True)
+
+# The layout of this repository, the folder above Automation
+project = ProjectLayout(Path(__file__).parent.parent)
@@ -1,15 +1,24 @@
-import api
-import flare
-import api_secrets
+import instrumentation
+import layout
 
-import pandas as pd
 import os
-import pycountry_convert as pc
+import sys, getopt
+
+# ================================================
+# Purpose: Creates the weather topics, TOCs and snippets
+# Background:
+#   Starting Python and importing pandas, BeautifulSoup, requests and pytz takes longer than a small run itself.
+#   Every stage (fetch, render, build_tocs_and_snippets) only imports the modules it needs when it runs, so importing
+#   this file for its settings is cheap. cli.py runs the stages on their own.
+# =================================================
 
 # Variables
 
-# Number of cities we want to get the weather for (max 100 because I didn't implement offsets)
-number_of_cities = str(10)
+# Number of cities we want to get the weather for (max 10000, the limit of the geonames API)
+number_of_cities = 10
+
+# Number of pages of cities requested from the geonames API at the same time
+max_concurrent_city_requests = 4
 
 # API Url we will connect to get the largest cities
 geonames_api = \
@@ -18,8 +27,7 @@ geonames_api = \
 # Parameters for the API call to get the right data
 geonames_parameters = {'select': 'name, ascii_name, latitude, longitude, country_code, population, timezone, country',
                        'where': 'population > 500000',
-                       'order_by': 'population desc',
-                       'limit': number_of_cities}
+                       'order_by': 'population desc'}
 
 # List of additional cities we want the weather for (note - the city name must be unique!)
 special_cities = ['Nuernberg',
@@ -28,104 +36,510 @@ special_cities = ['Nuernberg',
 # URL for the API containing the weather data
 weather_api = "https://api.openweathermap.org/data/3.0/onecall"
 
-root_dir = os.path.realpath(
-    os.path.join(os.path.dirname(__file__), '..'))  # Absolute Path to the top-level folder in the repo
-content_folder_dir = root_dir + '\\Content'  # Absolute path to the content folder as the base for all files
-toc_dir = root_dir + '\\Project\\TOCs\\Generated_TOCs'  # Absolute path to the directory containing the generated TOCs
-snippet_dir = content_folder_dir + '\\Resources\\Snippets'
-
-# List of snippet files stored in the project
-snippets = [f'{snippet_dir}\\Africa.flsnp',
-            f'{snippet_dir}\\Asia.flsnp',
-            f'{snippet_dir}\\Europe.flsnp',
-            f'{snippet_dir}\\NorthAmerica.flsnp',
-            f'{snippet_dir}\\Oceania.flsnp',
-            f'{snippet_dir}\\SouthAmerica.flsnp']
-
-# List of TOCs stored in the project
-TOCs = [f'{toc_dir}\\Africa.fltoc',
-        f'{toc_dir}\\Asia.fltoc',
-        f'{toc_dir}\\Europe.fltoc',
-        f'{toc_dir}\\NorthAmerica.fltoc',
-        f'{toc_dir}\\Oceania.fltoc',
-        f'{toc_dir}\\SouthAmerica.fltoc']
+# Maximum number of weather requests that are sent at the same time
+max_concurrent_requests = 8
 
-if __name__ == "__main__":
+# Responses of the APIs are stored in this file and reused until they expire (see cache.py). The calls per day of the
+# APIs with a daily quota are counted in the same file, also without the cache (see api.DailyCallCounter)
+use_cache = True
+cache_file = os.path.join(os.path.dirname(__file__), 'api_cache.sqlite')
 
-    print(f"Requesting data for top {number_of_cities} cities")
-    # Get list of 100 most populous cities using Geonames API
-    cities = pd.json_normalize(api.make_api_request(geonames_api, geonames_parameters)["results"])
+# In offline mode, only the responses stored in the cache are used and no API calls are made
+offline_mode = False
+
+# Folders of the Flare project: Content, snippets and generated TOCs (see layout.py)
+project = layout.project
+
+# In streaming mode the cities go one by one through fetch, transform, render and write (see streaming.py)
+streaming_mode = False
+
+# Render topics with the string templates in templates.py. If False, the BeautifulSoup functions in flare.py are used
+use_template_renderer = True
+
+# Only render the sections of the topics whose forecast changed since the last run (see delta.py). Needs the template
+# renderer
+delta_rendering = False
+
+# If set, one topic per unit is generated (e.g. Chicago_Metric.htm and Chicago_Imperial.htm) with the condition of the
+# unit on the whole topic, instead of one topic with the values of all units as conditional text (see
+# templates.render_topic_variants). The units are the condition tags of Project/ConditionTagSets/Units.flcts.
+# Needs the template renderer, not supported in streaming mode. Delta rendering is not used for these topics
+unit_variants = None
+all_unit_variants = ['Metric', 'Imperial']
+
+# Every fetch stores the forecasts of all cities in this file (see forecast_store.py). Runs older than
+# forecast_store_days are removed, and the oldest runs as long as the file is bigger than forecast_store_max_size.
+# Streaming mode does not store the forecasts
+use_forecast_store = True
+forecast_store_file = os.path.join(project.automation_dir, 'forecasts.sqlite')
+forecast_store_days = 7
+forecast_store_max_size = 500 * 1024 * 1024
+# Also store the One Call responses as returned by the API. Compressed, they take about as much space as the
+# forecasts, so the store keeps about half as many runs within forecast_store_max_size
+store_raw_responses = True
+
+# Render the forecasts of the last fetch in the forecast store instead of calling the APIs
+render_from_store = False
+
+# Number of processes rendering and writing the topics at the same time. With 1, everything runs in this process
+render_processes = os.cpu_count()
+
+# Hashes of all generated files, used to skip writing files whose content did not change (see manifest.py)
+manifest_file = os.path.join(project.root_dir, 'generated_files.json')
+
+# The generated files are written by these threads and only replace the old files at the end of the run
+# (see file_writer.py). With sync_files, the files are synced to disk before that
+writer_threads = 4
+sync_files = True
+# In streaming mode the topics replace the old topics in batches of this many files while the run goes on
+stream_replace_batch_size = 32
+
+# With --profile the run is profiled with cProfile and tracemalloc, the statistics are stored in this file
+profile_file = os.path.join(os.path.dirname(__file__), 'profile.pstats')
 
-    # Add special cities to list
-    for city in special_cities:
-        geonames_parameters['where'] = f"ascii_name='{city}'"
-        cities = pd.concat([cities, pd.json_normalize(api.make_api_request(geonames_api, geonames_parameters)["results"])])
+# Continents, also the names of the folders, TOCs and snippets of the cities
+continent_folders = ['Africa', 'Asia', 'Europe', 'NorthAmerica', 'Oceania', 'SouthAmerica']
 
+# Snippet files stored in the project, per continent
+snippets = {continent: project.get_snippet_file(continent) for continent in continent_folders}
 
-    print("Initializing TOCs and snippets")
+# TOCs stored in the project, per continent
+TOCs = {continent: project.get_toc_file(continent) for continent in continent_folders}
 
-    # Initialize TOCs (open and empty them)
-    TOC_soup_objects = {}
-    for TOC in TOCs:
-        TOC_soup_objects[TOC] = flare.initialize_toc(TOC)
+# Put the cities of every country into their own folder in the TOCs and snippets
+group_by_country = False
 
-    # Initialize snippets (open and empty them)
-    snippet_soup_objects = {}
-    for snippet in snippets:
-        snippet_soup_objects[snippet] = flare.initialize_snippet(snippet)
+# With --shard index/count only the cities of one shard are rendered, e.g. on one of several machines (see shards.py).
+# Instead of the TOCs and snippets, the entries of the topics are saved in shard_dir. When all shards are done, the
+# TOCs and snippets are built from all entries with --merge --shard-count count
+shard = None
+shard_count = None
+shard_dir = os.path.join(project.automation_dir, 'shards')
+# Id of the run, the same for all shards of the run. merge only uses the entries of this run, so a shard that failed
+# does not bring back the topics of an earlier run. Set with --run-id, Jenkins builds use their BUILD_TAG
+run_id = os.environ.get('BUILD_TAG')
 
-    # Loop through all of the cities we got earlier
+# Function open_cache
+# Input: None
+# Output: None
+# Purpose:
+#   Stores the responses of the APIs in cache_file (see cache.py) if the cache or offline mode is used. The daily
+#   quotas are always counted in cache_file
+def open_cache():
+    import api
+    api.quota_file = cache_file
+    if use_cache or offline_mode:
+        import cache
+        api.response_cache = cache.ResponseCache(cache_file, offline=offline_mode)
 
-    for index, row in cities.sort_values('ascii_name').iterrows():
-        print(f"Getting weather data for {row['ascii_name']}")
+# Function close_cache
+# Input: None
+# Output: None
+# Purpose:
+#   Closes the response cache, which writes the access times of the last cache hits (see cache.py)
+def close_cache():
+    import api
+    if api.response_cache is not None:
+        api.response_cache.close()
+        api.response_cache = None
 
-        # Connect to weather api now
-        weather_parameters = {
+# Function open_manifest
+# Input: None
+# Output - the Manifest with the hashes of all generated files (see manifest.py)
+def open_manifest():
+    import manifest
+
+    # Shards running on the same machine must not overwrite the manifest of each other
+    if shard is not None:
+        return manifest.Manifest(f'{os.path.splitext(manifest_file)[0]}_shard_{shard[0]}_of_{shard[1]}.json',
+                                 project.root_dir)
+    return manifest.Manifest(manifest_file, project.root_dir)
+
+# Function open_writer
+# Input: None
+# Output - the FileWriter used for all generated files of the run
+def open_writer():
+    import file_writer
+
+    replace_batch_size = stream_replace_batch_size if streaming_mode and not render_from_store else None
+    return file_writer.FileWriter(writer_threads, sync_files, replace_batch_size=replace_batch_size)
+
+# Function save_manifest
+# Input - generated_files - the Manifest of the run
+# Output: None
+# Purpose:
+#   Saves the manifest and prints how many files were written
+def save_manifest(generated_files):
+    generated_files.save()
+    print(f"{len(generated_files.written_files)} files written, {generated_files.skipped} files unchanged")
+
+# Function fetch
+# Input: None - the settings are the variables above
+# Output
+#   forecasts - list of dicts, one per city with a forecast: title, folder (the continent), group (the country) and
+#               forecast (see api.get_weather_data). Sorted by title
+#   failures - list of (name of the city, error) for all cities without a forecast
+# Purpose:
+#   Gets the cities and their weather. The cities are a plain list of dicts, so pandas is not needed
+def fetch():
+    import api
+    import continents
+    import cities as city_source
+    import api_secrets
+
+    print(f"Requesting data for top {number_of_cities} cities")
+    # Get list of the most populous cities and the special cities using Geonames API
+    city_records = city_source.get_city_records(geonames_api, geonames_parameters, number_of_cities, special_cities,
+                                                max_concurrent_city_requests)
+
+    # Sort the cities once so the topics, TOCs and snippets are always in the same order
+    city_records.sort(key=lambda city: city['ascii_name'])
+
+    if shard is not None:
+        import shards
+        city_records = list(shards.select_cities(city_records, shard))
+        print(f"{len(city_records)} cities are in shard {shard[0]} of {shard[1]}")
+
+    # Parameters for the weather api, one entry per city
+    weather_parameter_list = []
+    for city in city_records:
+        weather_parameter_list.append({
             'appid': api_secrets.openweather_api_key,
             'exclude': 'minutely',
-            'lat': row['latitude'],
-            'lon': row['longitude'],
-            'units': 'metric'}
+            'lat': city['latitude'],
+            'lon': city['longitude'],
+            'units': 'metric'})
+
+    print(f"Getting weather data for {len(weather_parameter_list)} cities")
+
+    # Get the forecast for all cities before rendering starts
+    keep_responses = use_forecast_store and store_raw_responses
+    forecasts, failed_requests = api.get_weather_data_for_cities(weather_api, weather_parameter_list,
+                                                                 max_concurrent_requests, keep_responses)
+    failures = [(city_records[index]['ascii_name'], error) for index, error in failed_requests.items()]
 
-        # Get the forecast for the specific city
-        forecast = api.get_weather_data(weather_api, weather_parameters)
+    # Keep every city that has a forecast. Cities where the request failed are reported at the end
+    city_forecasts = []
+    responses = []
+    for city, forecast in zip(city_records, forecasts):
+        if forecast is None:
+            continue
+        if keep_responses:
+            response, forecast = forecast
+            responses.append(response)
 
         # Convert the country code to the name of the continent so we know which folder to put it in
-        continent_code = pc.country_alpha2_to_continent_code(row['country_code'])
-        continent_name = pc.convert_continent_code_to_continent_name(continent_code).replace(' ', '')
+        city_forecasts.append({'title': city['ascii_name'],
+                               'folder': continents.get_continent_name(city['country_code']),
+                               'group': city.get('country'),
+                               'forecast': forecast})
+
+    if use_forecast_store:
+        store_forecasts(city_forecasts, responses if keep_responses else None)
+
+    return city_forecasts, failures
+
+# Function store_forecasts
+# Input
+#   city_forecasts - list of dicts, one per city with a forecast (see fetch)
+#   responses - the One Call responses of the cities, in the same order. None if they are not stored
+# Output: None
+# Purpose:
+#   Adds the forecasts to the forecast store and removes the runs older than forecast_store_days, and the oldest runs
+#   if the store is still bigger than forecast_store_max_size
+def store_forecasts(city_forecasts, responses):
+    import time
+    import forecast_store
 
-        # Check if topic exists (if not, create it), and empty the topic
-        topic = flare.initialize_topic(f'{content_folder_dir}/{continent_name}/{row["ascii_name"]}.htm',
-                                       row["ascii_name"])
+    store = forecast_store.ForecastStore(forecast_store_file)
+    try:
+        store.add_forecasts(city_forecasts, responses, shard=shard)
+        store.delete_before(time.time() - forecast_store_days * 24 * 60 * 60)
+        store.limit_size(forecast_store_max_size)
+    finally:
+        store.close()
 
-        # Add the current weather forecast to the top
-        topic = flare.update_current_weather(topic, forecast)
+# Function load_stored_forecasts
+# Input: None
+# Output - city_forecasts and failures, same as fetch. There are no failures, the store only has the forecasts that
+#          were fetched
+# Purpose:
+#   Reads the forecasts of the last fetch from the forecast store, no API is called. After runs with --shard, the last
+#   fetch of every shard is read, so all cities are there (see forecast_store.ForecastStore.get_last_runs)
+def load_stored_forecasts():
+    import forecast_store
 
-        # Add the hourly forecast
-        topic = flare.update_hourly_forecast(topic, forecast)
+    store = forecast_store.ForecastStore(forecast_store_file)
+    try:
+        city_forecasts = store.get_forecasts()
+    finally:
+        store.close()
 
-        # Add the daily forecast
-        topic = flare.update_daily_forecast(topic, forecast)
+    if shard is not None:
+        import shards
+        city_forecasts = list(shards.select_cities(city_forecasts, shard, key='title'))
 
-        # Insert the new xml into the file
-        flare.insert_into_file(f'{content_folder_dir}/{continent_name}/{row["ascii_name"]}.htm', topic)
+    print(f"Loaded the forecasts of {len(city_forecasts)} cities from {forecast_store_file}")
+    return city_forecasts, []
 
-        # Add to TOC
-        for TOC in TOCs:
-            if continent_name in TOC:
-                TOC_soup_objects[TOC] = flare.add_entry_to_toc(TOC_soup_objects[TOC], continent_name, row['ascii_name'])
+# Function render
+# Input
+#   city_forecasts - list returned by fetch
+#   generated_files - the Manifest of the run
+#   writer - the FileWriter of the run
+# Output - entries - one entry per topic (see render_pool.render_topic_file)
+# Purpose:
+#   Renders and writes the topics of all cities
+def render(city_forecasts, generated_files, writer):
+    import render_pool
 
-        # Add entry to the appropriate overview snippet
-        for snippet in snippets:
-            if continent_name in snippet:
-                snippet_soup_objects[snippet] = flare.add_entry_to_snippet_list(snippet_soup_objects[snippet],
-                                                                                continent_name, row['ascii_name'])
+    work_items = []
+    for city in city_forecasts:
+        variant_files = None
+        if unit_variants is not None:
+            variant_files = {unit: project.get_topic_file(city['folder'], city['title'], unit)
+                             for unit in unit_variants}
+
+        work_items.append(render_pool.create_work_item(city['title'], city['folder'],
+                                                       project.get_topic_file(city['folder'], city['title']),
+                                                       city['forecast'], city['group'], variant_files))
+
+    print(f"Creating topics for {len(work_items)} cities")
+
+    return render_pool.render_topics(work_items, generated_files, render_processes, use_template_renderer, writer,
+                                     delta_rendering)
+
+# Function stream
+# Input
+#   generated_files - the Manifest of the run
+#   writer - the FileWriter of the run
+# Output
+#   entries - one entry per topic, sorted by title
+#   failures - list of (name of the city, error)
+# Purpose:
+#   Fetches, renders and writes the cities one by one (see streaming.py)
+def stream(generated_files, writer):
+    import streaming
+    import cities as city_source
+    import api_secrets
+
+    print(f"Streaming top {number_of_cities} cities")
+    cities = city_source.iterate_cities(geonames_api, geonames_parameters, number_of_cities, special_cities)
+    if shard is not None:
+        import shards
+        cities = shards.select_cities(cities, shard)
+
+    entries = []
+    failures = []
+    for entry in streaming.run_pipeline(cities, weather_api, api_secrets.openweather_api_key, project,
+                                        generated_files, max_concurrent_requests, writer=writer,
+                                        delta_rendering=delta_rendering):
+        if entry['error'] is None:
+            print(f"Created topic for {entry['title']}")
+            entries.append(entry)
+        else:
+            failures.append((entry['title'], entry['error']))
+
+    # Sort the entries so the TOCs and snippets are in the same order as in the normal run
+    entries.sort(key=lambda entry: entry['title'])
+    return entries, failures
+
+# Function build_tocs_and_snippets
+# Input
+#   entries - list of dicts with the title, folder and group of every topic
+#   generated_files - the Manifest of the run
+#   writer - the FileWriter of the run
+# Output: None
+# Purpose:
+#   Builds and saves the TOC and the snippet of every continent
+def build_tocs_and_snippets(entries, generated_files, writer):
+    import flare
+
+    # Sort the topics by continent. With unit_variants, every topic of a unit gets its own entry with the condition
+    # of the unit
+    toc_entries = {continent: [] for continent in continent_folders}
+    for entry in entries:
+        toc_entry = {'title': entry['title'],
+                     'folder': entry['folder'],
+                     'group': entry.get('group') if group_by_country else None}
+        if unit_variants is None:
+            toc_entries[entry['folder']].append(toc_entry)
+            continue
+
+        for unit in unit_variants:
+            toc_entries[entry['folder']].append(dict(toc_entry, file=layout.get_topic_name(entry['title'], unit),
+                                                     conditions=f'Units.{unit}'))
 
     print("Saving TOCs and snippets")
-    # save all TOC files
-    for file, soup in TOC_soup_objects.items():
-        flare.insert_into_file(file, soup)
+    for continent in continent_folders:
+        # Build and save the TOC and the snippet of every continent at once
+        flare.insert_into_file(TOCs[continent], flare.build_toc(TOCs[continent], toc_entries[continent],
+                                                                 group_by_country), generated_files, writer)
+        flare.insert_into_file(snippets[continent], flare.build_snippet(snippets[continent], toc_entries[continent],
+                                                                        group_by_country), generated_files, writer)
+
+# Function report_failures
+# Input - failures - list of (name of the city, error)
+# Output: None
+# Purpose:
+#   Reports all cities without weather data
+def report_failures(failures):
+    if len(failures) > 0:
+        print(f"Failed to create the topic for {len(failures)} cities:")
+        for city, error in failures:
+            print(f"  {city}: {error}")
+
+# Function run
+# Input: None - the settings are the variables above
+# Output
+#   generated_files - the Manifest of the run, with the files written since the last commit (see manifest.py)
+#   failures - list of (name of the city, error) for all cities without a topic
+# Purpose:
+#   Gets the cities and their weather, and creates the topics, TOCs and snippets
+def run():
+    open_cache()
+    generated_files = open_manifest()
+    writer = open_writer()
+
+    try:
+        if render_from_store:
+            city_forecasts, failures = load_stored_forecasts()
+            entries = render(city_forecasts, generated_files, writer)
+        elif streaming_mode:
+            entries, failures = stream(generated_files, writer)
+        else:
+            city_forecasts, failures = fetch()
+            entries = render(city_forecasts, generated_files, writer)
+
+        # The TOCs and snippets need the topics of all shards, they are built by merge
+        if shard is None:
+            build_tocs_and_snippets(entries, generated_files, writer)
+
+        # Replace all generated files that were not replaced yet, the TOCs and snippets last
+        writer.commit()
+    finally:
+        writer.close()
+        close_cache()
+
+    save_manifest(generated_files)
+    if shard is not None:
+        save_shard_entries(entries, failures)
+    report_failures(failures)
+
+    return generated_files, failures
+
+# Function save_shard_entries
+# Input
+#   entries - one entry per topic of the shard
+#   failures - list of (name of the city, error) of the shard
+# Output: None
+# Purpose:
+#   Saves the entries of the shard, only after its topics were written, so merge never uses an unfinished shard
+def save_shard_entries(entries, failures):
+    import shards
+    file_name = shards.save_entries(shard_dir, shard, entries, failures, run_id)
+    print(f"Saved the entries of shard {shard[0]} of {shard[1]} to {file_name}")
+
+# Function merge
+# Input: None - the settings are the variables above
+# Output: None
+# Purpose:
+#   Builds the TOCs and snippets from the entries of all shard_count shards
+def merge():
+    import shards
+
+    entries, failures = shards.merge_entries(shard_dir, shard_count, run_id)
+    print(f"Merging the entries of {len(entries)} topics from {shard_count} shards")
+
+    generated_files = open_manifest()
+    writer = open_writer()
+    try:
+        build_tocs_and_snippets(entries, generated_files, writer)
+        writer.commit()
+    finally:
+        writer.close()
+
+    save_manifest(generated_files)
+    report_failures(failures)
+
+if __name__ == "__main__":
+
+    # Read the options: --offline replays the cached responses, --no-cache always calls the APIs,
+    # --stream runs in streaming mode, --delta only renders the changed sections of the topics, --from-store renders
+    # the last forecasts in the forecast store without calling the APIs, --no-store does not store them,
+    # --unit-variants generates one topic per unit (see unit_variants), --metrics prints timers and counters of all
+    # stages (also written to a file with --metrics-jsonl and --metrics-prom), --profile runs with cProfile and
+    # tracemalloc, --shard index/count only renders one shard of the cities, --merge --shard-count count builds the
+    # TOCs and snippets of all shards, --run-id sets the id of the run shared by all shards (see run_id)
+    usage = "Usage: %s [--offline] [--no-cache] [--stream] [--delta] [--from-store] [--no-store] [--unit-variants] " \
+            "[--metrics] [--metrics-jsonl file] [--metrics-prom file] [--profile] [--shard index/count] " \
+            "[--merge --shard-count count] [--run-id id]"
+    try:
+        myopts, args = getopt.getopt(sys.argv[1:], "", ["offline", "no-cache", "stream", "delta", "from-store",
+                                                        "no-store", "unit-variants", "metrics", "metrics-jsonl=",
+                                                        "metrics-prom=", "profile", "shard=", "merge",
+                                                        "shard-count=", "run-id="])
+    except getopt.GetoptError as e:
+        print(str(e))
+        sys.exit(usage % sys.argv[0])
+
+    profile_run = False
+    merge_run = False
+    for o, a in myopts:
+        if o == '--offline':
+            offline_mode = True
+        elif o == '--no-cache':
+            use_cache = False
+        elif o == '--stream':
+            streaming_mode = True
+        elif o == '--delta':
+            delta_rendering = True
+        elif o == '--from-store':
+            render_from_store = True
+        elif o == '--no-store':
+            use_forecast_store = False
+        elif o == '--unit-variants':
+            unit_variants = all_unit_variants
+        elif o == '--metrics':
+            instrumentation.enabled = True
+        elif o == '--metrics-jsonl':
+            instrumentation.enabled = True
+            instrumentation.sinks.append(instrumentation.JsonLinesSink(a))
+        elif o == '--metrics-prom':
+            instrumentation.enabled = True
+            instrumentation.sinks.append(instrumentation.PrometheusSink(a))
+        elif o == '--profile':
+            profile_run = True
+        elif o == '--shard':
+            import shards
+            try:
+                shard = shards.parse_shard(a)
+            except ValueError as e:
+                sys.exit(str(e))
+        elif o == '--merge':
+            merge_run = True
+        elif o == '--shard-count':
+            shard_count = int(a)
+        elif o == '--run-id':
+            run_id = a
+
+    if merge_run and (shard_count is None or shard is not None):
+        sys.exit(usage % sys.argv[0])
+    if unit_variants is not None and (streaming_mode or not use_template_renderer):
+        sys.exit("--unit-variants needs the template renderer and can't be used with --stream")
+
+    if instrumentation.enabled:
+        # Measure every function of api.py and flare.py
+        import api
+        import flare
+        instrumentation.instrument_module(api)
+        instrumentation.instrument_module(flare)
+
+    if merge_run:
+        merge()
+    elif profile_run:
+        instrumentation.profile(run, profile_file)
+    else:
+        run()
 
-    # Save all snippets
-    for file, soup in snippet_soup_objects.items():
-        flare.insert_into_file(file, soup)
+    instrumentation.report()
@@ -0,0 +1,186 @@
+import os
+import json
+import glob
+import hashlib
+
+# ================================================
+# Purpose: Keeps track of the files generated by the last run so unchanged files are not written again
+# Background:
+#   Every run renders all topics, TOCs and snippets again, but most of them end up with exactly the same content.
+#   Writing them anyway changes the modification time, which makes Flare, the Analyzer and git look at every file.
+#   The manifest stores a hash of the content of every generated file together with its size and modification time.
+#   If the size and modification time on disk still match, the file was not touched since the last run and the hash
+#   can be trusted. Otherwise the file on disk is read and hashed instead.
+#   The entries of topics also store a short hash of the forecast of every section (see delta.py).
+#   Next to the manifest, save keeps the list of files written since the last commit (see uncommitted_suffix).
+#   github_commit.py only looks at these files instead of the whole working tree and clears the list after the push.
+# =================================================
+
+# The files written since the last commit are stored in <manifest>_uncommitted.json
+uncommitted_suffix = '_uncommitted.json'
+
+# Function get_uncommitted_file
+# Input - file_name - absolute path of the manifest
+# Output - absolute path of the list of files written since the last commit
+def get_uncommitted_file(file_name):
+    return os.path.splitext(file_name)[0] + uncommitted_suffix
+
+# Function find_uncommitted_lists
+# Input - file_name - absolute path of the manifest
+# Output - the lists of files written since the last commit of the manifest and its shards (see main.open_manifest).
+#          Empty if no run saved a list yet
+def find_uncommitted_lists(file_name):
+    return sorted(glob.glob(glob.escape(os.path.splitext(file_name)[0]) + '*' + uncommitted_suffix))
+
+# Function read_uncommitted_files
+# Input - file_name - absolute path of the manifest
+# Output
+#   paths - sorted list of the files written since the last commit, relative to the root_dir of the manifest
+#   list_files - the lists that were read (see find_uncommitted_lists)
+def read_uncommitted_files(file_name):
+    list_files = find_uncommitted_lists(file_name)
+
+    paths = set()
+    for list_file in list_files:
+        with open(list_file, encoding="utf-8") as uncommitted_file:
+            paths.update(json.load(uncommitted_file))
+
+    return sorted(paths), list_files
+
+# Function clear_uncommitted_files
+# Input - list_files - the lists returned by read_uncommitted_files
+# Purpose:
+#   Called after the files were committed, so the next commit only looks at the files written after this one
+def clear_uncommitted_files(list_files):
+    for list_file in list_files:
+        with open(list_file, "w", encoding="utf-8") as uncommitted_file:
+            json.dump([], uncommitted_file)
+
+# Function hash_text
+# Input - text - the content of a file, as string or as UTF-8 bytes
+# Output - the sha256 hash of the text (as hex string)
+def hash_text(text):
+    if isinstance(text, str):
+        text = text.encode('utf-8')
+    return hashlib.sha256(text).hexdigest()
+
+# Class Manifest
+# Input
+#   file_name - absolute path of the JSON file holding the manifest. It doesn't need to exist yet. If None, the
+#               manifest starts empty and can't be saved (used in the render processes, see render_pool.py)
+#   root_dir - the paths in the manifest are stored relative to this folder
+# Purpose:
+#   Decides if a file needs to be written and counts the written and skipped files
+class Manifest:
+    def __init__(self, file_name, root_dir):
+        self.file_name = file_name
+        self.root_dir = root_dir
+        self.entries = {}
+        self.written_files = []
+        self.uncommitted_files = []  # set by save
+        self.sections = {}  # hashes of the sections of the topics of this run, added to the entries by save
+        self.skipped = 0
+
+        if file_name is not None and os.path.isfile(file_name):
+            with open(file_name, encoding="utf-8") as manifest_file:
+                self.entries = json.load(manifest_file)
+
+    def get_key(self, file_name):
+        return os.path.relpath(file_name, self.root_dir).replace(os.sep, '/')
+
+    # Function is_unchanged
+    # Input
+    #   file_name - absolute path of the file that should be written
+    #   text - the new content of the file, as string or as UTF-8 bytes
+    # Output - True if the file already has exactly this content
+    def is_unchanged(self, file_name, text):
+        if not os.path.isfile(file_name):
+            return False
+
+        text_hash = hash_text(text)
+        entry = self.entries.get(self.get_key(file_name))
+        stat = os.stat(file_name)
+
+        if entry is not None and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+            return entry['sha256'] == text_hash
+
+        # The file was changed outside of the generator (or is not in the manifest yet), so compare with the file itself
+        with open(file_name, encoding="utf-8") as existing_file:
+            if hash_text(existing_file.read()) != text_hash:
+                return False
+
+        self.record(file_name, text)
+        return True
+
+    # Function record
+    # Input
+    #   file_name - absolute path of the file that was written
+    #   text - the content that was written
+    # Purpose:
+    #   Stores the hash, size and modification time of the file in the manifest
+    def record(self, file_name, text):
+        self.record_hash(file_name, hash_text(text))
+
+    # Function record_hash
+    # Purpose:
+    #   Same as record, with the hash of the content. The hashes of the sections of the old content are dropped,
+    #   set_sections adds the new ones
+    def record_hash(self, file_name, text_hash):
+        stat = os.stat(file_name)
+        self.entries[self.get_key(file_name)] = {'sha256': text_hash,
+                                                 'size': stat.st_size,
+                                                 'mtime_ns': stat.st_mtime_ns}
+
+    def get_entry(self, file_name):
+        return self.entries.get(self.get_key(file_name))
+
+    def set_entry(self, file_name, entry):
+        if entry is not None:
+            self.entries[self.get_key(file_name)] = entry
+
+    # Function set_sections
+    # Input
+    #   file_name - absolute path of a topic
+    #   sections - the hashes of its sections (see delta.hash_sections)
+    # Purpose:
+    #   The hashes are added to the entry of the topic by save, after the topic was written and its entry recorded
+    def set_sections(self, file_name, sections):
+        self.sections[self.get_key(file_name)] = sections
+
+    # Function merge
+    # Input
+    #   file_name - absolute path of a file that was handled by another process
+    #   entry - the manifest entry of the file in the other process
+    #   written - True if the file was written by the other process
+    # Purpose:
+    #   Adds the result of another process to this manifest, as if the file was written here
+    def merge(self, file_name, entry, written):
+        self.set_entry(file_name, entry)
+        if written:
+            self.written_files.append(file_name)
+        else:
+            self.skipped += 1
+
+    # Function save
+    # Purpose:
+    #   Saves the manifest and adds the files written in this run to the files written since the last commit. Files
+    #   of runs that were never committed stay in the list, so they are not missed by the next commit. The list is
+    #   also kept in uncommitted_files, so it can be committed right away without reading it again
+    def save(self):
+        for key, sections in self.sections.items():
+            if key in self.entries:
+                self.entries[key]['sections'] = sections
+
+        with open(self.file_name, "w", encoding="utf-8") as manifest_file:
+            json.dump(self.entries, manifest_file, indent=1, sort_keys=True)
+
+        uncommitted_file_name = get_uncommitted_file(self.file_name)
+        uncommitted = set()
+        if os.path.isfile(uncommitted_file_name):
+            with open(uncommitted_file_name, encoding="utf-8") as uncommitted_file:
+                uncommitted.update(json.load(uncommitted_file))
+        uncommitted.update(self.get_key(file_name) for file_name in self.written_files)
+
+        self.uncommitted_files = sorted(uncommitted)
+        with open(uncommitted_file_name, "w", encoding="utf-8") as uncommitted_file:
+            json.dump(self.uncommitted_files, uncommitted_file, indent=1)
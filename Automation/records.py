@@ -0,0 +1,182 @@
+import functools
+from dataclasses import dataclass
+import api
+
+# ================================================
+# Purpose: Compact records for the forecast of a city
+# Background:
+#   api.transform_weather_data used to return [current, hourly, daily, alert]: a list of dicts holding strings and a
+#   dict per temperature, hundreds of small objects per city, which the renderers had to read by position.
+#   The records below only keep the raw values of the One Call API (numbers as returned by the API, timestamps in
+#   epoch format, the icon and description of the first weather condition). They use __slots__, so a record has no
+#   dict of its own. The texts shown in the topics are formatted when they are read (the *_text properties). The
+#   formatting functions are cached, most values repeat between hours, days and cities.
+#   Forecast.to_dict and Forecast.from_dict convert a forecast to plain JSON data and back (see cli.py).
+# =================================================
+
+current_time_format = '%A, %B %d, %Y at %I:%M %p'
+hourly_time_format = '%I:%M %p'
+daily_time_format = '%B %d'
+
+# Function format_temperature
+# Input - value - temperature in degrees Celsius
+# Output - dict with the text in every unit (see api.create_dict_with_multiple_units). Must not be changed
+@functools.lru_cache(maxsize=65536)
+def format_temperature(value):
+    return api.create_dict_with_multiple_units('temperature', value)
+
+# Function format_speed
+# Input - value - speed in m/s
+# Output - dict with the text in every unit (see api.create_dict_with_multiple_units). Must not be changed
+@functools.lru_cache(maxsize=65536)
+def format_speed(value):
+    return api.create_dict_with_multiple_units('speed', value)
+
+# Function format_percentage
+# Input - value - probability between 0 and 1
+# Output - the value in percent as text, e.g. '40%'
+def format_percentage(value):
+    return str(round(value * 100)) + '%'
+
+# Function get_values
+# Input - record - CurrentWeather, HourlyForecast or DailyForecast
+# Output - dict with the value of every field of the record
+def get_values(record):
+    return {name: getattr(record, name) for name in record.__slots__}
+
+# Class CurrentWeather
+# Purpose:
+#   The current weather of a city
+@dataclass
+class CurrentWeather:
+    __slots__ = ('time', 'timezone', 'temp', 'feels_like', 'humidity', 'uvi', 'wind_speed', 'icon', 'description')
+    time: int  # epoch time
+    timezone: str
+    temp: float  # degrees Celsius
+    feels_like: float  # degrees Celsius
+    humidity: int  # percent
+    uvi: float
+    wind_speed: float  # m/s
+    icon: str
+    description: str
+
+    @property
+    def time_text(self):
+        return api.convert_epoch_time(self.time, self.timezone, current_time_format)
+
+    @property
+    def temp_text(self):
+        return format_temperature(self.temp)
+
+    @property
+    def feels_like_text(self):
+        return format_temperature(self.feels_like)
+
+    @property
+    def humidity_text(self):
+        return str(self.humidity) + ' %'
+
+    @property
+    def uv_text(self):
+        return str(self.uvi)
+
+    @property
+    def wind_speed_text(self):
+        return format_speed(self.wind_speed)
+
+    # Function get_table_rows
+    # Output - list of (name, value) for the table of the current weather. The value is either a text or a dict
+    #          with the text in every unit
+    def get_table_rows(self):
+        return [('Temperature', self.temp_text),
+                ('Weather Conditions', self.description),
+                ('Feels like', self.feels_like_text),
+                ('Humidity (%)', self.humidity_text),
+                ('UV Index', self.uv_text),
+                ('Wind speed', self.wind_speed_text)]
+
+# Class HourlyForecast
+# Purpose:
+#   The forecast of one hour
+@dataclass
+class HourlyForecast:
+    __slots__ = ('time', 'timezone', 'temp', 'pop', 'icon', 'description')
+    time: int  # epoch time
+    timezone: str
+    temp: float  # degrees Celsius
+    pop: float  # probability of precipitation, between 0 and 1
+    icon: str
+    description: str
+
+    @property
+    def time_text(self):
+        return api.convert_epoch_time(self.time, self.timezone, hourly_time_format)
+
+    @property
+    def temp_text(self):
+        return format_temperature(self.temp)
+
+    @property
+    def chance_of_rain_text(self):
+        return format_percentage(self.pop)
+
+# Class DailyForecast
+# Purpose:
+#   The forecast of one day
+@dataclass
+class DailyForecast:
+    __slots__ = ('time', 'timezone', 'min_temp', 'max_temp', 'pop', 'icon', 'description')
+    time: int  # epoch time
+    timezone: str
+    min_temp: float  # degrees Celsius
+    max_temp: float  # degrees Celsius
+    pop: float  # probability of precipitation, between 0 and 1
+    icon: str
+    description: str
+
+    @property
+    def time_text(self):
+        return api.convert_epoch_time(self.time, self.timezone, daily_time_format)
+
+    @property
+    def min_temp_text(self):
+        return format_temperature(self.min_temp)
+
+    @property
+    def max_temp_text(self):
+        return format_temperature(self.max_temp)
+
+    @property
+    def chance_of_rain_text(self):
+        return format_percentage(self.pop)
+
+# Class Forecast
+# Purpose:
+#   Everything shown in the topic of a city: the current weather, the forecast of the next hours and days and the
+#   alert (a text, also if there is no alert)
+@dataclass
+class Forecast:
+    __slots__ = ('current', 'hourly', 'daily', 'alert')
+    current: CurrentWeather
+    hourly: list  # list of HourlyForecast
+    daily: list  # list of DailyForecast
+    alert: str
+
+    # Function to_dict
+    # Output - the forecast as dict of plain values, which can be stored as JSON. Same as dataclasses.asdict, which is
+    #          a lot slower because it copies every value
+    def to_dict(self):
+        return {'current': get_values(self.current),
+                'hourly': [get_values(hour) for hour in self.hourly],
+                'daily': [get_values(day) for day in self.daily],
+                'alert': self.alert}
+
+    # Function from_dict
+    # Input - values - dict returned by to_dict
+    # Output - the Forecast
+    @staticmethod
+    def from_dict(values):
+        return Forecast(CurrentWeather(**values['current']),
+                        [HourlyForecast(**hour) for hour in values['hourly']],
+                        [DailyForecast(**day) for day in values['daily']],
+                        values['alert'])
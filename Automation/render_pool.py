@@ -0,0 +1,146 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+import delta
+import file_writer
+import flare
+import manifest
+import templates
+
+# ================================================
+# Purpose: Renders and writes the city topics in several processes at the same time
+# Background:
+#   Rendering is CPU-bound, so a single process only uses one core. Every city is sent as a small work item to a pool
+#   of processes. The worker renders the topic and writes it to disk itself, so the topic text never goes back to
+#   the main process. Only a small entry per city is returned, which is then used to build the TOCs and snippets.
+#   Every work item gets the manifest entry (see manifest.py) of its topic, so the worker can skip unchanged topics.
+#   The workers only write the temporary files of the topics, without syncing them. They are synced and replace the
+#   old topics when the FileWriter of the main process is committed (see file_writer.py).
+#   In delta mode, the worker only renders the sections of a topic whose forecast changed (see delta.py). With
+#   variant_files, the worker writes one topic per unit (see templates.render_topic_variants).
+# =================================================
+
+# Function create_work_item
+# Input
+#   title - the title of the topic, normally the name of the city
+#   folder - the folder of the topic in the Content folder, normally the continent
+#   file_name - absolute path of the topic
+#   forecast - the records.Forecast returned by api.get_weather_data
+#   group - optional group of the topic in the TOC and snippet, e.g. the country
+#   variant_files - optional dict with a unit as key and the absolute path of the topic of the unit as value. If
+#                   given, one topic per unit is written instead of file_name (see templates.render_topic_variants)
+# Output - work_item - dict with everything a worker needs to render and write the topic
+def create_work_item(title, folder, file_name, forecast, group=None, variant_files=None):
+    return {'title': title,
+            'folder': folder,
+            'file_name': file_name,
+            'forecast': forecast,
+            'group': group,
+            'variant_files': variant_files}
+
+# Function get_file_names
+# Input - work_item - see create_work_item
+# Output - the absolute paths of all files written for the work item
+def get_file_names(work_item):
+    if work_item['variant_files'] is not None:
+        return list(work_item['variant_files'].values())
+    return [work_item['file_name']]
+
+# Function render_texts
+# Input - work_item - see render_topic_file
+# Output - list of (file_name, topic, sections) for every file of the work item. The topic is None if it did not
+#          change (delta mode), sections are the hashes of its sections (see delta.py), None for the topics of units
+def render_texts(work_item):
+    file_name = work_item['file_name']
+    forecast = work_item['forecast']
+
+    if work_item['variant_files'] is not None:
+        topics = templates.render_topic_variants_for_files(work_item['variant_files'], work_item['title'], forecast)
+        return [(work_item['variant_files'][unit], topic, None) for unit, topic in topics.items()]
+
+    if work_item['use_template_renderer'] and work_item['delta_rendering']:
+        topic, sections = delta.render_topic(file_name, work_item['title'], forecast,
+                                             work_item['manifest_entries'][file_name])
+        return [(file_name, topic, sections)]
+
+    if work_item['use_template_renderer']:
+        topic = templates.render_topic_for_file(file_name, work_item['title'], forecast)
+    else:
+        topic = flare.update_topic(file_name, work_item['title'], forecast)
+    return [(file_name, topic, delta.hash_sections(forecast))]
+
+# Function render_topic_file
+# Input
+#   work_item - see create_work_item. render_topics adds the settings and the manifest entries
+# Output - entry - dict with the title, folder and group of the topic, the files (file_name, if it was written, its
+#                   manifest entry and the hashes of its sections, see render_texts) and the temporary files written
+#                   (see FileWriter.get_temp_files)
+# Purpose
+#   Renders a topic and writes it to disk. This runs in the worker processes
+def render_topic_file(work_item):
+    # Manifest which only knows about the files of this topic
+    topic_manifest = manifest.Manifest(None, work_item['root_dir'])
+    topic_writer = file_writer.FileWriter(workers=0)
+
+    files = []
+    for file_name, topic, sections in render_texts(work_item):
+        # No section changed, the topic stays as it is
+        if topic is None:
+            files.append((file_name, False, work_item['manifest_entries'][file_name], sections))
+            continue
+
+        topic_manifest.set_entry(file_name, work_item['manifest_entries'][file_name])
+        written = flare.insert_into_file(file_name, topic, topic_manifest, topic_writer)
+        files.append((file_name, written, topic_manifest.get_entry(file_name), sections))
+
+    return {'title': work_item['title'],
+            'folder': work_item['folder'],
+            'group': work_item['group'],
+            'files': files,
+            'temp_files': topic_writer.get_temp_files()}
+
+# Function render_topics
+# Input
+#   work_items - list of work items (see create_work_item)
+#   generated_files - the Manifest of the run
+#   processes - number of processes. If 1, everything is rendered in this process
+#   use_template_renderer - if True, templates.py is used to render, otherwise the BeautifulSoup functions in flare.py
+#   writer - optional FileWriter. If given, the topics replace the old topics when it is committed, otherwise right
+#            after all topics were rendered
+#   delta_rendering - if True, only the changed sections of the topics are rendered (see delta.py). Only used with
+#                     the template renderer, not for the topics of units
+# Output - entries - list of the entries returned by render_topic_file, in the same order as work_items
+# Purpose
+#   Renders and writes all topics and adds the results to generated_files
+def render_topics(work_items, generated_files, processes=os.cpu_count(), use_template_renderer=True, writer=None,
+                  delta_rendering=False):
+    commit = writer is None
+    if writer is None:
+        writer = file_writer.FileWriter(workers=0)
+
+    for work_item in work_items:
+        work_item['use_template_renderer'] = use_template_renderer
+        work_item['delta_rendering'] = delta_rendering
+        work_item['root_dir'] = generated_files.root_dir
+        work_item['manifest_entries'] = {file_name: generated_files.get_entry(file_name)
+                                         for file_name in get_file_names(work_item)}
+
+    if processes is None or processes <= 1:
+        entries = [render_topic_file(work_item) for work_item in work_items]
+    else:
+        # Sending several work items at once to a worker saves a lot of communication between the processes
+        chunk_size = max(1, len(work_items) // (processes * 4))
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            entries = list(executor.map(render_topic_file, work_items, chunksize=chunk_size))
+
+    for entry in entries:
+        for file_name, written, manifest_entry, sections in entry['files']:
+            generated_files.merge(file_name, manifest_entry, written)
+            if sections is not None:
+                generated_files.set_sections(file_name, sections)
+        for file_name, temp_file_name, text_hash in entry['temp_files']:
+            writer.add_temp_file(file_name, temp_file_name, text_hash, generated_files)
+
+    if commit:
+        writer.commit()
+
+    return entries
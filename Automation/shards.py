@@ -0,0 +1,126 @@
+import os
+import json
+import time
+import zlib
+
+# ================================================
+# Purpose: Splits the cities between several workers (shards), which can run on different machines
+# Background:
+#   Every city belongs to exactly one of count shards, decided by a stable hash of its ascii name. The hash does not
+#   change between runs, machines or Python versions (unlike hash()), so a city is always rendered by the same shard.
+#   Every shard gets the list of all cities, but only requests the weather of its own cities and renders their topics.
+#   Instead of the TOCs and snippets, which need all cities, a shard saves the entries of its topics in an entries
+#   file in the shard folder. When all shards are done, merge_entries reads the entries files of all shards so the
+#   TOCs and snippets can be built once. The shard folder must be shared by all shards (or the entries files copied
+#   into it) before the merge.
+#   A shard that failed or was skipped leaves the entries file of an earlier run in the folder. Every entries file
+#   therefore has the id of its run (shared by all shards of the run, e.g. the build of the CI server, see
+#   main.run_id), and merge_entries refuses files of another run. Without a run id, the run of the newest entries
+#   file is used, so an old file is only noticed if the runs have ids.
+# =================================================
+
+# Function parse_shard
+# Input - text - the shard as "index/count", e.g. "0/4" for the first of four shards
+# Output - (index, count)
+# Purpose:
+#   Reads the --shard option. Raises ValueError if the text is not a valid shard
+def parse_shard(text):
+    index, separator, count = text.partition('/')
+    if separator != '/' or not index.isdigit() or not count.isdigit():
+        raise ValueError(f"Shard must be given as index/count, e.g. 0/4, not '{text}'")
+
+    index = int(index)
+    count = int(count)
+    if count < 1 or index >= count:
+        raise ValueError(f"Shard index must be between 0 and {count - 1}, not {index}")
+
+    return index, count
+
+# Function get_shard
+# Input
+#   name - the ascii name of the city
+#   count - the number of shards
+# Output - the index of the shard the city belongs to
+def get_shard(name, count):
+    return zlib.crc32(name.encode('utf-8')) % count
+
+# Function select_cities
+# Input
+#   cities - list or generator of cities (one dict per city)
+#   shard - (index, count)
+#   key - the field with the ascii name of the city. The cities of a fetch have it as 'title' (see main.fetch)
+# Output - generator with the cities of the shard, in the same order
+def select_cities(cities, shard, key='ascii_name'):
+    index, count = shard
+    return (city for city in cities if get_shard(city[key], count) == index)
+
+# Function get_entries_file
+# Input
+#   shard_dir - the folder with the entries files of all shards
+#   shard - (index, count)
+# Output - absolute path of the entries file of the shard
+def get_entries_file(shard_dir, shard):
+    index, count = shard
+    return os.path.join(shard_dir, f'entries_{index}_of_{count}.json')
+
+# Function save_entries
+# Input
+#   shard_dir - the folder with the entries files of all shards
+#   shard - (index, count)
+#   entries - list of dicts with the title, folder and group of every topic of the shard
+#   failures - list of (name of the city, error) of the shard
+#   run_id - the id of the run, the same for all shards of the run. May be None
+# Output - the name of the entries file
+def save_entries(shard_dir, shard, entries, failures, run_id=None):
+    os.makedirs(shard_dir, exist_ok=True)
+    file_name = get_entries_file(shard_dir, shard)
+
+    # Written to a temporary file first, so a merge never reads a half written file
+    with open(file_name + '.tmp', "w", encoding="utf-8") as file:
+        json.dump({'shard': list(shard),
+                   'run_id': run_id,
+                   'saved_at': time.time(),
+                   'entries': [{'title': entry['title'], 'folder': entry['folder'], 'group': entry.get('group')}
+                               for entry in entries],
+                   'failures': [[city, str(error)] for city, error in failures]}, file, indent=1)
+    os.replace(file_name + '.tmp', file_name)
+
+    return file_name
+
+# Function merge_entries
+# Input
+#   shard_dir - the folder with the entries files of all shards
+#   count - the number of shards
+#   run_id - the id of the run whose entries are merged. If None, the run of the newest entries file
+# Output
+#   entries - the entries of all shards, sorted by title (same order as a run without shards)
+#   failures - the failures of all shards
+# Purpose:
+#   Combines the entries files of all shards. Raises FileNotFoundError if a shard is missing and ValueError if a
+#   shard is from another run, so incomplete or outdated TOCs are never written
+def merge_entries(shard_dir, count, run_id=None):
+    missing = [index for index in range(count) if not os.path.isfile(get_entries_file(shard_dir, (index, count)))]
+    if len(missing) > 0:
+        raise FileNotFoundError(f"The entries of shards {missing} of {count} are missing in {shard_dir}")
+
+    all_shard_entries = []
+    for index in range(count):
+        with open(get_entries_file(shard_dir, (index, count)), encoding="utf-8") as file:
+            all_shard_entries.append(json.load(file))
+
+    if run_id is None:
+        run_id = max(all_shard_entries, key=lambda shard_entries: shard_entries.get('saved_at', 0)).get('run_id')
+    stale = [f"{index} (run {shard_entries.get('run_id')})" for index, shard_entries in enumerate(all_shard_entries)
+             if shard_entries.get('run_id') != run_id]
+    if len(stale) > 0:
+        raise ValueError(f"The entries of shards {', '.join(stale)} of {count} in {shard_dir} are not from run "
+                         f"{run_id}, the shard failed or did not run")
+
+    entries = []
+    failures = []
+    for shard_entries in all_shard_entries:
+        entries.extend(shard_entries['entries'])
+        failures.extend([tuple(failure) for failure in shard_entries['failures']])
+
+    entries.sort(key=lambda entry: entry['title'])
+    return entries, failures
@@ -0,0 +1,148 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import api
+import continents
+import delta
+import flare
+import templates
+
+# ================================================
+# Purpose: Generates the topics city by city instead of loading everything first
+# Background:
+#   The normal run in main.py loads all cities, then gets all forecasts, then renders all topics.
+#   Memory grows with the number of cities and nothing is written until every forecast is there.
+#   In streaming mode every stage is a generator which takes the cities one by one from the stage before:
+#       city source -> fetch -> transform -> render -> write
+#   Between the stages only a limited number of cities are waiting (queue_size), so memory stays the same no matter
+#   how many cities there are, and the first topics are written while later cities are still being fetched.
+#   Only a small entry per city (title, folder and country) is kept for the TOCs and snippets.
+#   Every city is passed through the stages as a dict. If a stage fails for a city, the error is stored in the dict
+#   and the later stages let it pass without doing anything.
+# =================================================
+
+# Function bounded_map
+# Input
+#   function - function called for every item
+#   items - iterable (normally a generator) with the items
+#   workers - number of threads calling the function
+#   queue_size - maximum number of items that are taken from items but not yet given back
+# Output - generator with the results of function, in the same order as items
+# Purpose:
+#   Like map, but with several threads. Items are only taken from the input when there is space in the queue, so the
+#   stages before are never further ahead than queue_size
+def bounded_map(function, items, workers, queue_size):
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for item in items:
+            pending.append(executor.submit(function, item))
+            if len(pending) >= queue_size:
+                yield pending.popleft().result()
+
+        while len(pending) > 0:
+            yield pending.popleft().result()
+
+# Function fetch_stage
+# Input
+#   cities - generator with the cities (see cities.iterate_cities)
+#   weather_api - url of the One Call API
+#   api_key - key for the One Call API
+#   workers - number of requests running at the same time
+#   queue_size - maximum number of cities waiting in this stage
+# Output - generator with one dict per city, containing the city and the response of the API (data)
+def fetch_stage(cities, weather_api, api_key, workers, queue_size):
+    def fetch(city):
+        item = {'city': city, 'error': None}
+        try:
+            item['data'] = api.make_api_request(weather_api, {'appid': api_key,
+                                                              'exclude': 'minutely',
+                                                              'lat': city['latitude'],
+                                                              'lon': city['longitude'],
+                                                              'units': 'metric'})
+        except Exception as e:
+            item['error'] = e
+        return item
+
+    return bounded_map(fetch, cities, workers, queue_size)
+
+# Function transform_stage
+# Input - items - generator from fetch_stage
+# Output - generator with the same dicts, the response of the API is replaced by the forecast and folder
+def transform_stage(items):
+    for item in items:
+        if item['error'] is None:
+            try:
+                item['forecast'] = api.transform_weather_data(item.pop('data'))
+                item['folder'] = continents.get_continent_name(item['city']['country_code'])
+            except Exception as e:
+                item['error'] = e
+        yield item
+
+# Function render_stage
+# Input
+#   items - generator from transform_stage
+#   project - the ProjectLayout (see layout.py) the topics are written to
+#   generated_files - the Manifest of the run (see manifest.py)
+#   delta_rendering - if True, only the changed sections of the topics are rendered (see delta.py)
+# Output - generator with the same dicts, the forecast is replaced by the rendered topic (None if it did not change),
+#          the hashes of its sections and its file name
+def render_stage(items, project, generated_files, delta_rendering=False):
+    for item in items:
+        if item['error'] is None:
+            try:
+                name = item['city']['ascii_name']
+                item['file_name'] = project.get_topic_file(item['folder'], name)
+                forecast = item.pop('forecast')
+                if delta_rendering:
+                    item['topic'], item['sections'] = delta.render_topic(item['file_name'], name, forecast,
+                                                                         generated_files.get_entry(item['file_name']))
+                else:
+                    item['topic'] = templates.render_topic_for_file(item['file_name'], name, forecast)
+                    item['sections'] = delta.hash_sections(forecast)
+            except Exception as e:
+                item['error'] = e
+        yield item
+
+# Function write_stage
+# Input
+#   items - generator from render_stage
+#   generated_files - the Manifest of the run (see manifest.py)
+#   writer - optional FileWriter (see file_writer.py), which writes the topics in the background
+# Output - generator with one small entry per city: title, folder, group (the country) and error
+def write_stage(items, generated_files, writer=None):
+    for item in items:
+        if item['error'] is None:
+            try:
+                topic = item.pop('topic')
+                if topic is None:
+                    generated_files.skipped += 1
+                else:
+                    flare.insert_into_file(item['file_name'], topic, generated_files, writer)
+                generated_files.set_sections(item['file_name'], item['sections'])
+            except Exception as e:
+                item['error'] = e
+
+        yield {'title': item['city']['ascii_name'],
+               'folder': item.get('folder'),
+               'group': item['city'].get('country'),
+               'error': item['error']}
+
+# Function run_pipeline
+# Input
+#   cities - generator with the cities (see cities.iterate_cities)
+#   weather_api - url of the One Call API
+#   api_key - key for the One Call API
+#   project - the ProjectLayout (see layout.py) the topics are written to
+#   generated_files - the Manifest of the run (see manifest.py)
+#   workers - number of requests running at the same time
+#   queue_size - maximum number of cities waiting between two stages
+#   writer - optional FileWriter (see file_writer.py), which writes the topics in the background
+#   delta_rendering - if True, only the changed sections of the topics are rendered (see delta.py)
+# Output - generator with one entry per city (see write_stage)
+# Purpose:
+#   Connects all stages. Nothing happens until the entries are read
+def run_pipeline(cities, weather_api, api_key, project, generated_files, workers=8, queue_size=32,
+                 writer=None, delta_rendering=False):
+    fetched = fetch_stage(cities, weather_api, api_key, workers, queue_size)
+    transformed = transform_stage(fetched)
+    rendered = render_stage(transformed, project, generated_files, delta_rendering)
+    return write_stage(rendered, generated_files, writer)
@@ -0,0 +1,335 @@
+from bs4 import BeautifulSoup
+import file_writer
+import flare
+import instrumentation
+
+# ================================================
+# Purpose: Renders weather topics from string templates instead of building them tag by tag with BeautifulSoup
+# Background:
+#   The functions in flare.py parse the topic, create every tr and td with new_tag (and a new BeautifulSoup object
+#   for most cells) and serialize the soup again. For thousands of cities this is most of the run time.
+#   The templates below produce exactly the same text as the BeautifulSoup functions, given a topic that was
+#   started from flare.get_file_start_text (which is true for every generated topic). Attributes are written in
+#   alphabetical order, because this is how BeautifulSoup writes them.
+#   Writers may still change a generated topic in Flare, e.g. the h1 or an added paragraph. The BeautifulSoup
+#   functions keep everything outside the head and the weather divs, the templates don't. render_topic_for_file only
+#   uses the templates if the existing topic is the same as the generated one outside of the weather divs, any other
+#   topic is updated with the BeautifulSoup functions.
+#   render_topic_with_soup is the reference implementation using flare.py. check_renderer compares both.
+#   render_topic_variants renders one topic per unit instead (see the Background there).
+# =================================================
+
+topic_template = ('<?xml version="1.0" encoding="utf-8"?>\n'
+                  '<html xmlns:MadCap="http://www.madcapsoftware.com/Schemas/MadCap.xsd">\n'
+                  '<head><title>Weather in [%=Heading.Level1%]</title><link/>'
+                  '<meta content="This page shows the weather in [%=Heading.Level1%]" name="description"/></head>\n'
+                  '<body>\n'
+                  '<h1>{title}</h1>\n'
+                  '<h2>Current Weather</h2>\n'
+                  '<div id="current">{current}</div>\n'
+                  "<h2>Today's forecast</h2>\n"
+                  '<div id="forecast_hourly">{hourly}</div>\n'
+                  '<h2>7 Day Forecast</h2>\n'
+                  '<div id="forecast_daily">{daily}</div>\n'
+                  '</body>\n'
+                  '</html>')
+
+current_weather_template = ('<p>As of {time} local time, the current weather is:</p>'
+                            '<p class="weather">{temp}'
+                            '<img class="icon_big" src="../Resources/Images/weather_icons/{icon}.png"/></p>'
+                            '{table}'
+                            '<p>Please note the following alert:</p>'
+                            '<MadCap:codeSnippet><MadCap:codeSnippetCopyButton/>'
+                            '<MadCap:codeSnippetBody MadCap:continue="False" MadCap:lineNumberStart="1" '
+                            'MadCap:useLineNumbers="False" xml:space="preserve">{alert}</MadCap:codeSnippetBody>'
+                            '</MadCap:codeSnippet>')
+
+table_template = ('<table cellspacing="21" class="TableStyle-Alternate-Row-Color" '
+                  'style="mc-table-style: url(\'../Resources/TableStyles/Alternate-Row-Color.css\');">'
+                  '{columns}<thead><tr>{headers}</tr></thead><tbody>{rows}</tbody></table>')
+
+# Same as topic_template, with the condition of the unit on the whole topic (see render_topic_variants)
+variant_topic_template = topic_template.replace('<html ', '<html MadCap:conditions="{conditions}" ', 1)
+
+column_tag = '<col class="TableStyle-Alternate-Row-Color-Column-Column1"/>'
+
+conditional_text_template = '<MadCap:conditionalText MadCap:conditions="Units.{unit}">{text}</MadCap:conditionalText>'
+
+# The ids of the weather divs, in the order of the topic
+section_ids = ['current', 'forecast_hourly', 'forecast_daily']
+
+# Function escape
+# Input - text - text that is inserted into the topic
+# Output - the text with the characters escaped that are not allowed in XML text
+def escape(text):
+    return str(text).replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+# Function render_conditional_texts
+# Input - values - dict with the unit as key and the text as value (see api.create_dict_with_multiple_units)
+# Output - one MadCap:conditionalText per unit, same as flare.create_conditional_text
+def render_conditional_texts(values):
+    return ''.join([conditional_text_template.format(unit=unit, text=escape(text)) for unit, text in values.items()])
+
+# Function render_value
+# Input
+#   metric - a value of the weather data
+#   render_units - optional function rendering a dict with the text in every unit (see render_topic_variants)
+# Output - the value as it is shown in a table cell, same as flare.get_value_from_metric
+def render_value(metric, render_units=None):
+    if isinstance(metric, dict):
+        if render_units is not None:
+            return render_units(metric)
+        return '<span>' + render_conditional_texts(metric) + '</span>'
+    elif isinstance(metric, list):
+        return escape(metric[0]['description'])
+    else:
+        return escape(metric)
+
+# Function render_table
+# Input
+#   headers - list of the column headers
+#   rows - list of rows, every row is a list of the (already rendered) cells
+# Output - the table, same as flare.create_table and flare.insert_row_into_table
+def render_table(headers, rows):
+    return table_template.format(
+        columns=column_tag * len(headers),
+        headers=''.join(['<th>' + escape(header) + '</th>' for header in headers]),
+        rows=''.join(['<tr>' + ''.join(['<td>' + cell + '</td>' for cell in row]) + '</tr>' for row in rows]))
+
+# Function render_current_weather
+# Input
+#   forecast - the records.Forecast returned by api.get_weather_data
+#   render_units - optional function rendering the values with units (see render_value)
+# Output - content of div#current, same as flare.update_current_weather
+def render_current_weather(forecast, render_units=None):
+    current = forecast.current
+
+    rows = [[escape(name), render_value(value, render_units)] for name, value in current.get_table_rows()]
+
+    if render_units is None:
+        temp = render_conditional_texts(current.temp_text)
+    else:
+        temp = render_units(current.temp_text)
+
+    return current_weather_template.format(time=escape(current.time_text),
+                                           temp=temp,
+                                           icon=escape(current.icon),
+                                           table=render_table(['Metric', 'Value'], rows),
+                                           alert=escape(forecast.alert))
+
+# Function render_hourly_forecast
+# Input
+#   forecast - the records.Forecast returned by api.get_weather_data
+#   render_units - optional function rendering the values with units (see render_value)
+# Output - content of div#forecast_hourly, same as flare.update_hourly_forecast
+def render_hourly_forecast(forecast, render_units=None):
+    rows = []
+    for hour in forecast.hourly:
+        rows.append([escape(hour.time_text), render_value(hour.description), render_value(hour.temp_text, render_units),
+                     escape(hour.chance_of_rain_text)])
+
+    return render_table(['Time', 'Weather', 'Temperature', 'Chance of Rain'], rows)
+
+# Function render_daily_forecast
+# Input
+#   forecast - the records.Forecast returned by api.get_weather_data
+#   render_units - optional function rendering the values with units (see render_value)
+# Output - content of div#forecast_daily, same as flare.update_daily_forecast
+def render_daily_forecast(forecast, render_units=None):
+    rows = []
+    for day in forecast.daily:
+        rows.append([escape(day.time_text), render_value(day.description),
+                     render_value(day.min_temp_text, render_units), render_value(day.max_temp_text, render_units),
+                     escape(day.chance_of_rain_text)])
+
+    return render_table(['Time', 'Weather', 'Min Temp', 'Max Temp', 'Chance of Rain'], rows)
+
+# Function render_topic
+# Input
+#   title - the title of the topic (h1), normally the name of the city
+#   forecast - the records.Forecast returned by api.get_weather_data
+# Output - the complete topic as string, ready for flare.insert_into_file
+def render_topic(title, forecast):
+    return topic_template.format(title=escape(title),
+                                 current=render_current_weather(forecast),
+                                 hourly=render_hourly_forecast(forecast),
+                                 daily=render_daily_forecast(forecast))
+
+# Function find_section
+# Input
+#   text - a topic
+#   section - the id of a weather div
+# Output - (start, end) of the content of the div in text, None if the div was not found or contains another div
+# Purpose
+#   The topic is not parsed, the div is found as it is written by the templates and by BeautifulSoup
+def find_section(text, section):
+    start_tag = f'<div id="{section}">'
+    start = text.find(start_tag)
+    if start < 0:
+        return None
+    start += len(start_tag)
+
+    end = text.find('</div>', start)
+    if end < 0 or text.find('<div', start, end) >= 0:
+        return None
+    return start, end
+
+# Function get_sections
+# Input - text - a topic
+# Output - dict with the id and the content of every weather div, None if a div was not found
+def get_sections(text):
+    sections = {}
+    for section in section_ids:
+        position = find_section(text, section)
+        if position is None:
+            return None
+        sections[section] = text[position[0]:position[1]]
+    return sections
+
+# Function replace_sections
+# Input
+#   text - a topic
+#   sections - dict with the id of a weather div and its new content
+# Output - the topic with the new content in the divs, None if one of the divs was not found
+def replace_sections(text, sections):
+    for section, content in sections.items():
+        position = find_section(text, section)
+        if position is None:
+            return None
+        text = text[:position[0]] + content + text[position[1]:]
+    return text
+
+# Function read_topic
+# Input - file_name - absolute path of a topic
+# Output - the text of the topic, None if it doesn't exist. A topic that is not UTF-8 is returned as empty text, which
+#          is never the same as a generated topic
+def read_topic(file_name):
+    try:
+        with open(file_name, encoding="utf-8") as topic_file:
+            return topic_file.read()
+    except FileNotFoundError:
+        return None
+    except UnicodeDecodeError:
+        return ''
+
+# Function is_generated_topic
+# Input
+#   text - the existing topic (see read_topic)
+#   topic - the new topic, rendered from the templates
+# Output - True if the topic doesn't exist yet or only differs from topic in the weather divs
+def is_generated_topic(text, topic):
+    if text is None:
+        return True
+    empty_sections = {section: '' for section in section_ids}
+    return replace_sections(text, empty_sections) == replace_sections(topic, empty_sections)
+
+# Function render_topic_for_file
+# Input
+#   file_name - absolute path of the topic
+#   title - the title of the topic (h1), only used if the topic doesn't exist yet
+#   forecast - the records.Forecast returned by api.get_weather_data
+# Output - the topic as string, the same as flare.update_topic makes of the file
+# Purpose
+#   New topics and topics that were not changed outside of the weather divs are rendered from the templates. Topics
+#   that were changed by a writer are updated with flare.update_topic, which keeps the changes
+def render_topic_for_file(file_name, title, forecast):
+    topic = render_topic(title, forecast)
+    if is_generated_topic(read_topic(file_name), topic):
+        return topic
+
+    instrumentation.count('templates.edited_topics')
+    return str(flare.update_topic(file_name, title, forecast))
+
+# Class UnitPlaceholders
+# Purpose:
+#   Used as render_units by render_topic_variants. Every value with units is replaced by a placeholder (its number
+#   between two NUL characters, which never appear in a topic) and remembered, resolve puts in the text of one unit
+class UnitPlaceholders:
+    def __init__(self):
+        self.values = []
+
+    def __call__(self, values):
+        self.values.append(values)
+        return f'\0{len(self.values) - 1}\0'
+
+    # Function resolve
+    # Input
+    #   text - text with placeholders
+    #   unit - the unit, e.g. 'Metric'
+    # Output - the text with the escaped text of the unit instead of every placeholder
+    def resolve(self, text, unit):
+        parts = text.split('\0')
+        parts[1::2] = [escape(self.values[int(index)][unit]) for index in parts[1::2]]
+        return ''.join(parts)
+
+# Function render_topic_variants
+# Input
+#   title - the title of the topic (h1), normally the name of the city
+#   forecast - the records.Forecast returned by api.get_weather_data
+#   units - the units to render, e.g. ['Metric', 'Imperial']
+# Output - dict with the unit as key and the complete topic of the unit as value
+# Purpose
+#   render_topic writes every value with units once per unit as MadCap:conditionalText, and Flare removes the texts
+#   of the other units in every topic of every target. Here every topic only contains the values of its unit, as plain
+#   text, and the whole topic gets the condition of the unit (MadCap:conditions on the html tag), so a target does
+#   not build the topics of the other units at all.
+#   The forecast is only rendered once, with placeholders for the values with units, which are then resolved for
+#   every unit
+def render_topic_variants(title, forecast, units):
+    placeholders = UnitPlaceholders()
+    topic = variant_topic_template.format(conditions=placeholders({unit: f'Units.{unit}' for unit in units}),
+                                          title=escape(title),
+                                          current=render_current_weather(forecast, placeholders),
+                                          hourly=render_hourly_forecast(forecast, placeholders),
+                                          daily=render_daily_forecast(forecast, placeholders))
+
+    return {unit: placeholders.resolve(topic, unit) for unit in units}
+
+# Function render_topic_variants_for_files
+# Input
+#   variant_files - dict with a unit as key and the absolute path of the topic of the unit as value
+#   title - the title of the topic (h1), normally the name of the city
+#   forecast - the records.Forecast returned by api.get_weather_data
+# Output - dict with the unit as key and the topic of the unit as value
+# Purpose
+#   Same as render_topic_variants. There is no BeautifulSoup version of these topics, so if a writer changed a topic
+#   outside of the weather divs, the new weather divs are put into the existing topic instead. If its weather divs
+#   can't be found, the topic is rendered completely
+def render_topic_variants_for_files(variant_files, title, forecast):
+    topics = render_topic_variants(title, forecast, list(variant_files))
+
+    for unit, file_name in variant_files.items():
+        text = read_topic(file_name)
+        if is_generated_topic(text, topics[unit]):
+            continue
+
+        instrumentation.count('templates.edited_topics')
+        topic = replace_sections(text, get_sections(topics[unit]))
+        if topic is not None:
+            topics[unit] = topic
+
+    return topics
+
+# Function render_topic_with_soup
+# Input
+#   title - the title of the topic (h1), normally the name of the city
+#   forecast - the records.Forecast returned by api.get_weather_data
+# Output - the complete topic as string, rendered with the BeautifulSoup functions in flare.py
+# Purpose
+#   Reference implementation for render_topic. It does the same as main.py does for a new topic, without any files
+def render_topic_with_soup(title, forecast):
+    topic = flare.clear_topic(BeautifulSoup(flare.get_file_start_text('topic', escape(title)), "xml"))
+    topic = flare.update_current_weather(topic, forecast)
+    topic = flare.update_hourly_forecast(topic, forecast)
+    topic = flare.update_daily_forecast(topic, forecast)
+    return str(topic)
+
+# Function check_renderer
+# Input
+#   title - the title of the topic (h1), normally the name of the city
+#   forecast - the records.Forecast returned by api.get_weather_data
+# Output - True if render_topic and render_topic_with_soup create exactly the same file. The texts are compared as
+#          they are written (see file_writer.encode_text), where '\r\n' in the alert becomes '\n' for both
+def check_renderer(title, forecast):
+    return file_writer.encode_text(render_topic(title, forecast)) == \
+        file_writer.encode_text(render_topic_with_soup(title, forecast))
@@ -0,0 +1,15 @@
+import json
+import os
+import sys
+import pytest
+
+# The scripts in Automation import each other as top-level modules
+automation_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, automation_dir)
+
+
+# The One Call response in fixtures/onecall.json, read again for every test so it can be changed
+@pytest.fixture
+def onecall_response():
+    with open(os.path.join(automation_dir, 'fixtures', 'onecall.json'), encoding="utf-8") as file:
+        return json.load(file)
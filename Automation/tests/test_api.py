@@ -0,0 +1,26 @@
+import pytest
+import api
+
+
+def test_daily_quota_is_shared_by_all_runs(tmp_path):
+    quota_file = str(tmp_path / 'api_cache.sqlite')
+    first_run = api.RateLimiter(1000, 5, api.DailyCallCounter(quota_file, 'api.openweathermap.org'))
+    for call in range(3):
+        first_run.acquire()
+
+    # A later run starts with the calls of the earlier runs of the day
+    second_run = api.RateLimiter(1000, 5, api.DailyCallCounter(quota_file, 'api.openweathermap.org'))
+    assert second_run.calls_today == 3
+
+    second_run.acquire()
+    first_run.acquire()
+    with pytest.raises(api.DailyQuotaExceeded):
+        second_run.acquire()
+    with pytest.raises(api.DailyQuotaExceeded):
+        first_run.acquire()
+
+
+def test_daily_quota_is_counted_per_host(tmp_path):
+    quota_file = str(tmp_path / 'api_cache.sqlite')
+    api.RateLimiter(1000, 1, api.DailyCallCounter(quota_file, 'a.example.com')).acquire()
+    api.RateLimiter(1000, 1, api.DailyCallCounter(quota_file, 'b.example.com')).acquire()
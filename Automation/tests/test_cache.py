@@ -0,0 +1,37 @@
+import cache
+
+
+def test_hits_are_written_on_close(tmp_path):
+    file_name = str(tmp_path / 'api_cache.sqlite')
+    response_cache = cache.ResponseCache(file_name)
+    response_cache.set('https://example.com/a', {'q': 1}, {'a': 1})
+    stored_at = response_cache.connection.execute("SELECT last_access FROM responses").fetchone()[0]
+
+    assert response_cache.get('https://example.com/a', {'q': 1}) == {'a': 1}
+    response_cache.close()
+
+    response_cache = cache.ResponseCache(file_name)
+    assert response_cache.connection.execute("SELECT last_access FROM responses").fetchone()[0] > stored_at
+    response_cache.close()
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, monkeypatch):
+    body_size = len('{"value": "xxxxxxxxxx"}')
+    monkeypatch.setattr(cache, 'max_size', 3 * body_size)
+    response_cache = cache.ResponseCache(str(tmp_path / 'api_cache.sqlite'))
+
+    for name in ['a', 'b', 'c']:
+        response_cache.set(f'https://example.com/{name}', None, {'value': 'x' * 10})
+    # a was used after b, so b is the least recently used entry
+    assert response_cache.get('https://example.com/a', None) is not None
+    response_cache.set('https://example.com/d', None, {'value': 'x' * 10})
+
+    assert response_cache.total_size == 3 * body_size
+    assert response_cache.get('https://example.com/b', None) is None
+    for name in ['a', 'c', 'd']:
+        assert response_cache.get(f'https://example.com/{name}', None) is not None
+
+    # Replacing an entry does not count its old size
+    response_cache.set('https://example.com/a', None, {'value': 'x' * 10})
+    assert response_cache.total_size == 3 * body_size
+    response_cache.close()
@@ -0,0 +1,13 @@
+import continents
+import main
+
+
+def test_every_continent_has_a_folder():
+    assert set(continents.country_continents.values()) <= set(main.continent_folders)
+
+
+def test_continent_names():
+    assert continents.get_continent_name('DE') == 'Europe'
+    assert continents.get_continent_name('US') == 'NorthAmerica'
+    assert continents.get_continent_name('BV') == 'Africa'
+    assert continents.get_continent_name('HM') == 'Oceania'
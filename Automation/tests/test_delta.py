@@ -0,0 +1,94 @@
+import copy
+import api
+import delta
+import flare
+import manifest
+import templates
+
+
+def write_topic(tmp_path, text, forecast):
+    file_name = str(tmp_path / 'Lagos.htm')
+    flare.insert_into_file(file_name, text)
+
+    # The manifest entry the last run stored for the topic
+    topic_manifest = manifest.Manifest(None, str(tmp_path))
+    topic_manifest.record(file_name, text)
+    entry = dict(topic_manifest.get_entry(file_name), sections=delta.hash_sections(forecast))
+    return file_name, entry
+
+
+def change_forecast(onecall_response, current=False, hourly=False):
+    data = copy.deepcopy(onecall_response)
+    if current:
+        data['current']['temp'] += 3
+    if hourly:
+        data['hourly'][2]['pop'] = 0.77
+    return api.transform_weather_data(data)
+
+
+def test_new_topic_is_rendered_completely(tmp_path, onecall_response):
+    forecast = api.transform_weather_data(onecall_response)
+    topic, sections = delta.render_topic(str(tmp_path / 'Lagos.htm'), 'Lagos', forecast, None)
+
+    assert topic == templates.render_topic('Lagos', forecast)
+    assert sections == delta.hash_sections(forecast)
+
+
+def test_unchanged_topic_is_not_rendered(tmp_path, onecall_response):
+    forecast = api.transform_weather_data(onecall_response)
+    file_name, entry = write_topic(tmp_path, templates.render_topic('Lagos', forecast), forecast)
+
+    topic, sections = delta.render_topic(file_name, 'Lagos', api.transform_weather_data(onecall_response), entry)
+    assert topic is None
+    assert sections == entry['sections']
+
+
+def test_patched_topic_is_same_as_full_render(tmp_path, onecall_response):
+    old_forecast = api.transform_weather_data(onecall_response)
+    file_name, entry = write_topic(tmp_path, templates.render_topic('Lagos', old_forecast), old_forecast)
+
+    for changes in [{'current': True}, {'hourly': True}, {'current': True, 'hourly': True}]:
+        forecast = change_forecast(onecall_response, **changes)
+        changed = delta.get_changed_sections(file_name, entry, delta.hash_sections(forecast))
+        assert changed == [section for section, flag in [('current', 'current'), ('forecast_hourly', 'hourly')]
+                           if flag in changes]
+
+        topic, sections = delta.render_topic(file_name, 'Lagos', forecast, entry)
+        assert topic == templates.render_topic('Lagos', forecast)
+
+
+def test_topic_changed_outside_of_the_generator_is_rendered_completely(tmp_path, onecall_response):
+    old_forecast = api.transform_weather_data(onecall_response)
+    file_name, entry = write_topic(tmp_path, templates.render_topic('Lagos', old_forecast), old_forecast)
+    edited = templates.render_topic('Lagos', old_forecast).replace('<h1>Lagos</h1>', '<h1>Lagos</h1><p>Note</p>')
+    flare.insert_into_file(file_name, edited)
+
+    forecast = change_forecast(onecall_response, current=True)
+    topic, sections = delta.render_topic(file_name, 'Lagos', forecast, entry)
+    assert topic == templates.render_topic_for_file(file_name, 'Lagos', forecast)
+    assert '<p>Note</p>' in topic
+
+
+def test_patch_keeps_the_changes_of_writers(tmp_path, onecall_response):
+    old_forecast = api.transform_weather_data(onecall_response)
+    edited = templates.render_topic('Lagos', old_forecast).replace('<h1>Lagos</h1>', '<h1>Lagos</h1><p>Note</p>')
+    # The edited topic was written by the last run, so it is in the manifest
+    file_name, entry = write_topic(tmp_path, edited, old_forecast)
+
+    forecast = change_forecast(onecall_response, current=True, hourly=True)
+    topic, sections = delta.render_topic(file_name, 'Lagos', forecast, entry)
+    assert '<p>Note</p>' in topic
+    assert topic == templates.render_topic('Lagos', forecast).replace('<h1>Lagos</h1>', '<h1>Lagos</h1><p>Note</p>')
+
+
+def test_section_that_cant_be_patched_is_rendered_completely(tmp_path, onecall_response):
+    old_forecast = api.transform_weather_data(onecall_response)
+    # A div inside a section, added by a writer, can't be patched
+    broken = templates.render_topic('Lagos', old_forecast).replace('<div id="current">',
+                                                                   '<div id="current"><div>Note</div>')
+    file_name, entry = write_topic(tmp_path, broken, old_forecast)
+
+    forecast = change_forecast(onecall_response, current=True)
+    assert delta.patch_topic(broken, forecast, ['current']) is None
+    topic, sections = delta.render_topic(file_name, 'Lagos', forecast, entry)
+    assert topic == templates.render_topic_for_file(file_name, 'Lagos', forecast)
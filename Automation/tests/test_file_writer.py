@@ -0,0 +1,55 @@
+import os
+import pytest
+import file_writer
+
+
+def read(path):
+    with open(path, encoding="utf-8") as file:
+        return file.read()
+
+
+def test_files_are_replaced_on_commit(tmp_path):
+    writer = file_writer.FileWriter(workers=2)
+    try:
+        for name in ['a', 'b']:
+            (tmp_path / f'{name}.htm').write_text('old', encoding="utf-8")
+            writer.write(str(tmp_path / f'{name}.htm'), b'new')
+
+        assert read(tmp_path / 'a.htm') == 'old'
+        writer.commit()
+    finally:
+        writer.close()
+
+    assert read(tmp_path / 'a.htm') == 'new' and read(tmp_path / 'b.htm') == 'new'
+    assert sorted(os.listdir(tmp_path)) == ['a.htm', 'b.htm']
+
+
+def test_batches_are_replaced_while_writing(tmp_path):
+    writer = file_writer.FileWriter(workers=2, replace_batch_size=2)
+    try:
+        for name in ['a', 'b', 'c']:
+            writer.write(str(tmp_path / f'{name}.htm'), name.encode('utf-8'))
+
+        # The first batch is in place, the last file waits for the next batch or the commit
+        assert read(tmp_path / 'a.htm') == 'a' and read(tmp_path / 'b.htm') == 'b'
+        assert not (tmp_path / 'c.htm').exists()
+        writer.commit()
+    finally:
+        writer.close()
+
+    assert read(tmp_path / 'c.htm') == 'c'
+
+
+def test_failed_write_replaces_nothing(tmp_path):
+    (tmp_path / 'a.htm').write_text('old', encoding="utf-8")
+    writer = file_writer.FileWriter(workers=2)
+    try:
+        writer.write(str(tmp_path / 'a.htm'), b'new')
+        writer.write(str(tmp_path / 'missing' / 'b.htm'), b'new')
+        with pytest.raises(FileNotFoundError):
+            writer.commit()
+    finally:
+        writer.close()
+
+    assert read(tmp_path / 'a.htm') == 'old'
+    assert os.listdir(tmp_path) == ['a.htm']
@@ -0,0 +1,88 @@
+import os
+import json
+import sqlite3
+import api
+import forecast_store
+import shards
+
+
+def get_city_forecasts(onecall_response, number_of_cities):
+    forecast = api.transform_weather_data(onecall_response)
+    return [{'title': f'City{number}', 'folder': 'Europe', 'group': 'X', 'forecast': forecast}
+            for number in range(number_of_cities)]
+
+
+def test_responses_are_only_stored_if_given(tmp_path, onecall_response):
+    store = forecast_store.ForecastStore(str(tmp_path / 'forecasts.sqlite'))
+    city_forecasts = get_city_forecasts(onecall_response, 2)
+    without_raw = store.add_forecasts(city_forecasts, fetched_at=1)
+    with_raw = store.add_forecasts(city_forecasts, [onecall_response, onecall_response], fetched_at=2)
+
+    assert store.get_response('City0', without_raw) is None
+    assert store.get_response('City0', with_raw) == onecall_response
+    # Compressed, and responses of older versions without compression are still read
+    raw = store.connection.execute("SELECT raw FROM forecasts WHERE fetched_at = 2").fetchone()[0]
+    assert len(raw) < len(json.dumps(onecall_response)) / 4
+    store.connection.execute("UPDATE forecasts SET raw = ? WHERE fetched_at = 2", (json.dumps(onecall_response),))
+    assert store.get_response('City1', with_raw) == onecall_response
+    assert [city['title'] for city in store.get_forecasts()] == ['City0', 'City1']
+    store.close()
+
+
+def test_oldest_runs_are_removed_and_the_file_shrinks(tmp_path, onecall_response):
+    file_name = str(tmp_path / 'forecasts.sqlite')
+    store = forecast_store.ForecastStore(file_name)
+    city_forecasts = get_city_forecasts(onecall_response, 50)
+    for fetched_at in range(1, 6):
+        store.add_forecasts(city_forecasts, fetched_at=fetched_at)
+    full_size = os.path.getsize(file_name)
+
+    assert store.delete_before(2) == 50
+    assert store.limit_size(store.get_size() * 3 // 5) == 100
+    assert store.get_fetch_times() == [4, 5]
+    assert os.path.getsize(file_name) < full_size * 0.6
+
+    # The last run is kept, however small the limit is
+    store.limit_size(0)
+    assert store.get_fetch_times() == [5]
+    store.close()
+
+
+def test_last_run_of_every_shard_is_loaded(tmp_path, onecall_response):
+    store = forecast_store.ForecastStore(str(tmp_path / 'forecasts.sqlite'))
+    city_forecasts = get_city_forecasts(onecall_response, 20)
+    shard_cities = {index: list(shards.select_cities(city_forecasts, (index, 2), key='title')) for index in range(2)}
+
+    store.add_forecasts(city_forecasts, fetched_at=1)
+    store.add_forecasts(shard_cities[0], fetched_at=2, shard=(0, 2))
+    store.add_forecasts(shard_cities[1], fetched_at=3, shard=(1, 2))
+    store.add_forecasts(shard_cities[1], fetched_at=4, shard=(1, 2))
+
+    assert store.get_last_runs() == [2, 4]
+    assert [city['title'] for city in store.get_forecasts()] == sorted(city['title'] for city in city_forecasts)
+
+    # The runs of the shards are older than the size limit allows, but they are the last ones
+    assert store.limit_size(0) == 20 + len(shard_cities[1])
+    assert store.get_fetch_times() == [2, 4]
+    assert len(store.get_forecasts()) == 20
+
+    # A run without shards replaces the runs of all shards
+    store.add_forecasts(city_forecasts[:3], fetched_at=5)
+    assert store.get_last_runs() == [5]
+    store.close()
+
+
+def test_existing_file_is_upgraded(tmp_path):
+    file_name = str(tmp_path / 'forecasts.sqlite')
+    connection = sqlite3.connect(file_name)
+    connection.execute("CREATE TABLE forecasts (city TEXT, fetched_at REAL, folder TEXT, country TEXT, raw TEXT, "
+                       "forecast TEXT)")
+    connection.commit()
+    connection.close()
+
+    store = forecast_store.ForecastStore(file_name)
+    assert store.connection.execute("PRAGMA auto_vacuum").fetchone()[0] == forecast_store.incremental_auto_vacuum
+    # The runs of older versions had no shards
+    assert [row[1] for row in store.connection.execute("PRAGMA table_info(forecasts)")][-2:] == ['shard_index',
+                                                                                                 'shard_count']
+    store.close()
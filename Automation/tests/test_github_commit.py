@@ -0,0 +1,46 @@
+import json
+import pytest
+
+git = pytest.importorskip('git')
+pytest.importorskip('api_secrets')
+
+import github_commit
+import main
+
+
+def test_files_of_all_lists_are_committed(tmp_path, monkeypatch):
+    git.Repo.init(tmp_path)
+    monkeypatch.setattr(github_commit, 'root_dir', str(tmp_path))
+    monkeypatch.setattr(main, 'manifest_file', str(tmp_path / 'generated_files.json'))
+
+    for name in ['a.htm', 'b.htm', 'c.htm']:
+        (tmp_path / name).write_text(name, encoding="utf-8")
+    (tmp_path / 'generated_files_uncommitted.json').write_text(json.dumps(['a.htm']), encoding="utf-8")
+    (tmp_path / 'generated_files_shard_0_of_2_uncommitted.json').write_text(json.dumps(['b.htm']), encoding="utf-8")
+
+    # The lists are cleared after the commit, so the file of the shard must be committed with the written files
+    assert github_commit.commit_to_github(['a.htm'], dry_run=True) == ['a.htm', 'b.htm']
+    assert github_commit.commit_to_github(dry_run=True) == ['a.htm', 'b.htm']
+
+
+def test_only_changed_files_are_found(tmp_path, monkeypatch):
+    repo = git.Repo.init(tmp_path)
+    monkeypatch.setattr(github_commit, 'root_dir', str(tmp_path))
+    (tmp_path / 'Content' / 'Europe').mkdir(parents=True)
+    for name in ['Berlin.htm', 'Rome.htm', 'São Paulo.htm']:
+        (tmp_path / 'Content' / 'Europe' / name).write_text(name, encoding="utf-8")
+    with repo.config_writer() as config:
+        config.set_value('user', 'name', 'Test')
+        config.set_value('user', 'email', 'test@example.com')
+    repo.git.add(all=True)
+    repo.git.commit('-m', 'topics')
+
+    (tmp_path / 'Content' / 'Europe' / 'Rome.htm').write_text('changed', encoding="utf-8")
+    (tmp_path / 'Content' / 'Europe' / 'Paris.htm').write_text('new', encoding="utf-8")
+    written = ['Content/Europe/Berlin.htm', 'Content/Europe/Paris.htm', 'Content/Europe/Rome.htm',
+               'Content/Europe/São Paulo.htm']
+
+    assert github_commit.get_head_blobs(repo, written).keys() == {'Content/Europe/Berlin.htm',
+                                                                   'Content/Europe/Rome.htm',
+                                                                   'Content/Europe/São Paulo.htm'}
+    assert github_commit.get_changed_files(repo, written) == ['Content/Europe/Paris.htm', 'Content/Europe/Rome.htm']
@@ -0,0 +1,38 @@
+import pytest
+import api
+import cli
+import main
+import shards
+
+
+def test_shard_only_loads_its_own_cities(tmp_path, monkeypatch, onecall_response):
+    forecast = api.transform_weather_data(onecall_response)
+    titles = [f'City{number}' for number in range(20)]
+    monkeypatch.setattr(cli, 'forecasts_file', str(tmp_path / 'forecasts.json'))
+    cli.save_forecasts([{'title': title, 'folder': 'Europe', 'group': 'X', 'forecast': forecast} for title in titles],
+                       [('Failed1', 'error'), ('Failed2', 'error')])
+
+    loaded = {}
+    for index in range(2):
+        monkeypatch.setattr(main, 'shard', (index, 2))
+        city_forecasts, failures = cli.load_forecasts()
+        assert all(shards.get_shard(city['title'], 2) == index for city in city_forecasts)
+        assert all(shards.get_shard(title, 2) == index for title, error in failures)
+        loaded[index] = [city['title'] for city in city_forecasts] + [title for title, error in failures]
+
+    assert sorted(loaded[0] + loaded[1]) == sorted(titles + ['Failed1', 'Failed2'])
+
+
+def test_merge_refuses_entries_of_another_run(tmp_path):
+    for index, run_id in enumerate(['build-2', 'build-1', 'build-2']):
+        shards.save_entries(str(tmp_path), (index, 3), [{'title': f'City{index}', 'folder': 'Europe'}], [], run_id)
+
+    with pytest.raises(ValueError, match=r"shards 1 \(run build-1\) of 3"):
+        shards.merge_entries(str(tmp_path), 3, 'build-2')
+    # Without a run id, the run of the newest file is used
+    with pytest.raises(ValueError, match=r"shards 1 \(run build-1\) of 3"):
+        shards.merge_entries(str(tmp_path), 3)
+
+    shards.save_entries(str(tmp_path), (1, 3), [{'title': 'City1', 'folder': 'Europe'}], [], 'build-2')
+    entries, failures = shards.merge_entries(str(tmp_path), 3, 'build-2')
+    assert [entry['title'] for entry in entries] == ['City0', 'City1', 'City2']
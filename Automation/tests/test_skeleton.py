@@ -0,0 +1,115 @@
+import glob
+import os
+import pytest
+from bs4 import BeautifulSoup
+import flare
+import layout
+
+project = layout.project
+
+
+def parse_file(file_name):
+    with open(file_name, encoding="utf-8-sig") as file:
+        return BeautifulSoup(file, "xml")
+
+
+# The functions as they were before read_skeleton: the whole file is parsed with BeautifulSoup and cleared afterwards
+def initialize_topic_from_whole_file(file_name):
+    return flare.clear_topic(parse_file(file_name))
+
+
+def initialize_toc_from_whole_file(file_name):
+    toc_soup = parse_file(file_name)
+    toc_soup.find('CatapultToc').clear()
+    return toc_soup
+
+
+def initialize_snippet_from_whole_file(file_name):
+    snippet_soup = parse_file(file_name)
+    snippet_soup.find('body').clear()
+    snippet_soup.find('body').append(snippet_soup.new_tag('ul'))
+    return snippet_soup
+
+
+# The weather topics in the project. Every continent folder also has an overview topic, which is not generated
+def get_weather_topics():
+    weather_topics = []
+    for file_name in sorted(glob.glob(os.path.join(project.content_dir, '*', '*.htm'))):
+        with open(file_name, encoding="utf-8") as file:
+            if '<div id="current">' in file.read():
+                weather_topics.append(file_name)
+    return weather_topics
+
+
+@pytest.mark.parametrize('file_name', get_weather_topics())
+def test_project_topics(file_name):
+    assert str(flare.initialize_topic(file_name, 'unused')) == str(initialize_topic_from_whole_file(file_name))
+
+
+@pytest.mark.parametrize('file_name', sorted(glob.glob(os.path.join(project.toc_dir, '*.fltoc'))))
+def test_project_tocs(file_name):
+    assert str(flare.initialize_toc(file_name)) == str(initialize_toc_from_whole_file(file_name))
+
+
+@pytest.mark.parametrize('file_name', sorted(glob.glob(os.path.join(project.snippet_dir, '*.flsnp'))))
+def test_project_snippets(file_name):
+    assert str(flare.initialize_snippet(file_name)) == str(initialize_snippet_from_whole_file(file_name))
+
+
+edited_topic = """<?xml version="1.0" encoding="utf-8"?>
+<html xmlns:MadCap="http://www.madcapsoftware.com/Schemas/MadCap.xsd" MadCap:lastBlockDepth="2">
+<head><title>Old title</title><!-- comment in the head --><link href="x.css" rel="stylesheet"/></head>
+<body>
+<!-- comment kept in the body -->
+<h1>Nürnberg &amp; more</h1>
+<p>Added by a writer <b>with markup</b>.</p>
+<div id="current"><p>Old weather</p><!-- removed --><div><p>nested</p></div>tail text</div>
+<div id="notes"><p>A div that is not cleared</p></div>
+<div id="forecast_hourly"><table><tr><td>1</td></tr></table></div>
+<div id="forecast_daily"/>
+<?processing instruction?>
+</body>
+</html>"""
+
+
+def test_edited_topic(tmp_path):
+    file_name = str(tmp_path / 'Edited.htm')
+    with open(file_name, "w", encoding="utf-8") as file:
+        file.write(edited_topic)
+
+    topic = flare.initialize_topic(file_name, 'unused')
+    assert str(topic) == str(initialize_topic_from_whole_file(file_name))
+    assert topic.find('h1').string == 'Nürnberg & more'
+    assert 'Added by a writer' in str(topic)
+    assert 'A div that is not cleared' in str(topic)
+    assert 'Old weather' not in str(topic) and 'nested' not in str(topic) and 'tail text' not in str(topic)
+
+
+def test_skeleton_of_cleared_elements(tmp_path):
+    file_name = str(tmp_path / 'Edited.htm')
+    with open(file_name, "w", encoding="utf-8") as file:
+        file.write(edited_topic)
+
+    skeleton = flare.read_skeleton(file_name, flare.is_cleared_in_topic).decode('utf-8')
+    assert '<head/>' in skeleton
+    assert '<div id="current"/>' in skeleton
+    assert '<div id="forecast_hourly"/>' in skeleton
+    assert '<!-- comment kept in the body -->' in skeleton
+    assert 'comment in the head' not in skeleton and 'removed' not in skeleton
+
+
+def test_broken_topic_is_parsed_with_beautifulsoup(tmp_path):
+    file_name = str(tmp_path / 'Broken.htm')
+    with open(file_name, "w", encoding="utf-8") as file:
+        file.write(edited_topic.replace('</body>', ''))
+
+    assert str(flare.initialize_topic(file_name, 'unused')) == str(initialize_topic_from_whole_file(file_name))
+
+
+def test_new_topic_is_not_written(tmp_path):
+    file_name = str(tmp_path / 'New.htm')
+    topic = flare.initialize_topic(file_name, 'New')
+
+    assert not os.path.exists(file_name)
+    assert topic.find('h1').string == 'New'
+    assert str(topic) == str(flare.clear_topic(BeautifulSoup(flare.get_file_start_text('topic', 'New'), "xml")))
@@ -0,0 +1,83 @@
+import pytest
+import api
+import file_writer
+import flare
+import templates
+
+alerts = [None,
+          'Heat <warning> & stuff',
+          'First line of the alert\r\nSecond line\r\n',
+          'Old Mac line\rbreak and "quotes"']
+
+
+def get_forecast(onecall_response, alert):
+    if alert is not None:
+        onecall_response['alerts'] = [{'description': alert}]
+    return api.transform_weather_data(onecall_response)
+
+
+@pytest.mark.parametrize('alert', alerts)
+@pytest.mark.parametrize('title', ['Lagos', 'Sao Paulo', 'A & <B>'])
+def test_template_renderer_matches_soup(onecall_response, alert, title):
+    forecast = get_forecast(onecall_response, alert)
+
+    assert file_writer.encode_text(templates.render_topic(title, forecast)) == \
+        file_writer.encode_text(templates.render_topic_with_soup(title, forecast))
+    assert templates.check_renderer(title, forecast)
+
+
+@pytest.mark.parametrize('alert', alerts)
+def test_generated_topic_is_rendered_from_templates(tmp_path, onecall_response, alert):
+    forecast = get_forecast(onecall_response, alert)
+    file_name = str(tmp_path / 'Lagos.htm')
+    assert templates.render_topic_for_file(file_name, 'Lagos', forecast) == templates.render_topic('Lagos', forecast)
+
+    # An existing generated topic gets the same text as from the BeautifulSoup functions
+    flare.insert_into_file(file_name, templates.render_topic('Lagos', get_forecast(onecall_response, 'Old alert')))
+    topic = templates.render_topic_for_file(file_name, 'Lagos', forecast)
+    assert topic == templates.render_topic('Lagos', forecast)
+    assert file_writer.encode_text(topic) == file_writer.encode_text(flare.update_topic(file_name, 'Lagos', forecast))
+
+
+def test_edited_topic_keeps_the_changes(tmp_path, onecall_response):
+    file_name = str(tmp_path / 'Lagos.htm')
+    flare.insert_into_file(file_name, templates.render_topic('Lagos', get_forecast(onecall_response, None)))
+    with open(file_name, encoding="utf-8") as file:
+        edited = file.read().replace('<h1>Lagos</h1>', '<h1>Lagos, Nigeria</h1>\n<p>Added by a writer.</p>')
+    flare.insert_into_file(file_name, edited)
+
+    forecast = get_forecast(onecall_response, 'New alert')
+    topic = templates.render_topic_for_file(file_name, 'Lagos', forecast)
+
+    assert '<h1>Lagos, Nigeria</h1>' in topic
+    assert '<p>Added by a writer.</p>' in topic
+    assert 'New alert' in topic
+    assert topic == str(flare.update_topic(file_name, 'Lagos', forecast))
+
+
+def test_edited_variant_keeps_the_changes(tmp_path, onecall_response):
+    variant_files = {unit: str(tmp_path / f'Lagos_{unit}.htm') for unit in ['Metric', 'Imperial']}
+    old_topics = templates.render_topic_variants('Lagos', get_forecast(onecall_response, None), list(variant_files))
+    for unit, file_name in variant_files.items():
+        flare.insert_into_file(file_name, old_topics[unit])
+    flare.insert_into_file(variant_files['Metric'],
+                           old_topics['Metric'].replace('</h1>', '</h1>\n<p>Added by a writer.</p>'))
+
+    forecast = get_forecast(onecall_response, 'New alert')
+    topics = templates.render_topic_variants_for_files(variant_files, 'Lagos', forecast)
+    new_topics = templates.render_topic_variants('Lagos', forecast, list(variant_files))
+
+    assert topics['Imperial'] == new_topics['Imperial']
+    assert topics['Metric'] == new_topics['Metric'].replace('</h1>', '</h1>\n<p>Added by a writer.</p>')
+
+
+def test_variants_are_the_conditional_topic_of_one_unit(onecall_response):
+    forecast = get_forecast(onecall_response, None)
+    topic = templates.render_topic('Lagos', forecast)
+    topics = templates.render_topic_variants('Lagos', forecast, ['Metric', 'Imperial'])
+
+    for unit, other_unit in [('Metric', 'Imperial'), ('Imperial', 'Metric')]:
+        assert f'Units.{other_unit}' not in topics[unit]
+        assert f'<html MadCap:conditions="Units.{unit}" ' in topics[unit]
+        assert templates.get_sections(topics[unit])['forecast_daily'].count('<tr>') == \
+            templates.get_sections(topic)['forecast_daily'].count('<tr>')
@@ -0,0 +1,42 @@
+import calendar
+import datetime
+import pytest
+import api
+import records
+
+timezones = ['UTC', 'Africa/Lagos', 'America/Chicago', 'America/Sao_Paulo', 'Asia/Kolkata', 'Asia/Kathmandu',
+             'Australia/Adelaide', 'Australia/Lord_Howe', 'Europe/Berlin', 'Pacific/Chatham']
+
+formats = [records.current_time_format, records.hourly_time_format, records.daily_time_format, '%H:%M:%S %Z',
+           '%Y-%m-%d %H:%M %z']
+
+
+def get_epoch(*date):
+    return calendar.timegm(datetime.datetime(*date).timetuple())
+
+
+@pytest.mark.parametrize('timezone', timezones)
+def test_cached_conversion_matches_pytz(timezone):
+    # Every quarter of an hour around both daylight saving time changes of the year in Europe, the US and Australia
+    times = []
+    for date in [(2023, 3, 12), (2023, 3, 26), (2023, 4, 2), (2023, 10, 1), (2023, 10, 29), (2023, 11, 5)]:
+        start = get_epoch(*date) - 24 * 60 * 60
+        times.extend(range(start, start + 48 * 60 * 60, 15 * 60 + 7))
+    times.extend([0, 1697039340, get_epoch(2036, 12, 31, 23, 59), get_epoch(2045, 7, 1)])
+
+    for ts in times:
+        for format in formats:
+            assert api.convert_epoch_time(ts, timezone, format) == \
+                api.convert_epoch_time_with_pytz(ts, timezone, format), (ts, format)
+
+
+def test_fixture_times_match_pytz(onecall_response):
+    forecast = api.transform_weather_data(onecall_response)
+    timezone = onecall_response['timezone']
+
+    assert forecast.current.time_text == api.convert_epoch_time_with_pytz(onecall_response['current']['dt'],
+                                                                          timezone, records.current_time_format)
+    for hour, response in zip(forecast.hourly, onecall_response['hourly']):
+        assert hour.time_text == api.convert_epoch_time_with_pytz(response['dt'], timezone, records.hourly_time_format)
+    for day, response in zip(forecast.daily, onecall_response['daily']):
+        assert day.time_text == api.convert_epoch_time_with_pytz(response['dt'], timezone, records.daily_time_format)